@@ -1,10 +1,21 @@
-from owl_client import OwlClient, Pose,TrajectoryPlanMode
+from owl_client import Pose, TrajectoryPlanMode
+import os
+import sys
 import time
-import math
-import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rangoli import simplify, streaming
+from rangoli.executor import StrokeExecutor
+from rangoli.latency import InstrumentedClient
+from rangoli.session import RobotSession
 
-client = OwlClient("10.42.0.54")
+
+# Managed session: reconnects and resumes after network drops. Set OWL_ROBOT=host:port
+# to run against the stand-in robot from rangoli.standin_robot
+client = RobotSession(os.environ.get("OWL_ROBOT", "10.42.0.54"))
+# Pass --latency to time every controller call and print a latency report at the end
+if "--latency" in sys.argv:
+    client = InstrumentedClient(client)
 toolSpeed = 0.1  # Set an appropriate tool speed for the movement
       
 # Wait for the robot to be available
@@ -12,28 +23,11 @@ while not client.is_running():
     time.sleep(0.2)
 
 # Define a circular trajectory in Cartesian space
-def circular_trajectory(center_x, center_y, center_z, radius, steps=72):
-    waypoints = []
-    angle_step = 2 * math.pi / steps
-
-    # Generate waypoints around the circle in the x-y plane
-    for i in range(steps + 1):
-        angle = i * angle_step
-        waypoint = Pose()
-        
-        # Position for circular motion in x-y plane, z remains constant
-        waypoint.x = center_x + radius * math.cos(angle)
-        waypoint.y = center_y + radius * math.sin(angle)
-        waypoint.z = center_z
-
-        # Orientation (rx, ry, rz) can be set as needed
-        waypoint.rx = np.pi  # Replace with desired roll in radians
-        waypoint.ry = 0.0  # Replace with desired pitch in radians
-        waypoint.rz = 0.0  # Replace with desired yaw in radians
-
-        waypoints.append(waypoint)
-
-    return waypoints
+def circular_trajectory(center_x, center_y, center_z, radius, tolerance_mm=0.1):
+    # Generate the whole circle in the x-y plane in one vectorised call, z remains constant.
+    # The step count follows the radius so every chord stays within tolerance_mm of the circle.
+    # Orientation (rx, ry, rz) is the fixed drawing orientation: roll = pi, pitch = yaw = 0
+    return simplify.adaptive_circle_stroke(center_x, center_y, center_z, radius, tolerance_mm)
 
 # Generate the trajectory waypoints
 center_x = 0.623  # Center x-coordinate
@@ -42,9 +36,23 @@ center_z = 0.393  # Constant z-coordinate
 radius = 0.1  # Radius of the circular path
 waypoints = circular_trajectory(center_x, center_y, center_z, radius)
 
-# Execute each waypoint in Cartesian space
-for waypoint in waypoints:
-    client.move_to_pose(waypoint, toolSpeed, wait=True, relative=False, moveType=TrajectoryPlanMode.STRAIGHT)
-    time.sleep(0.1)  # Adjust delay for smoother movement if needed
+executor = StrokeExecutor(client, toolSpeed, move_type=TrajectoryPlanMode.STRAIGHT, pose_cls=Pose)
+if "--stream" in sys.argv:
+    # Pass --stream to draw at a constant tool speed: the circle is resampled into
+    # 125 Hz setpoints with speed and acceleration limits and streamed at that rate.
+    # Setpoints are timed in m/s from toolSpeed (assuming it is in mm/s, as --profile-speed
+    # does elsewhere), so the planned timing matches the speed sent with every setpoint.
+    # Needs OWL_QUEUE_MOVES=1 (see README)
+    streamer = streaming.SetpointStreamer(client, Pose, tool_speed=toolSpeed, move_type=TrajectoryPlanMode.STRAIGHT)
+    trajectory = streaming.time_parameterize(waypoints, max_speed=toolSpeed / 1000.0, max_accel=0.5, rate=125.0)
+    executor.move_to(waypoints[0])
+    report = streamer.stream(trajectory)
+    streaming.print_report(report, trajectory)
+else:
+    # Execute the whole path in Cartesian space; with OWL_QUEUE_MOVES=1 the next waypoint stays
+    # queued on the controller (see README)
+    executor.execute(waypoints)
 
 print("============ Task Complete")
+if isinstance(client, InstrumentedClient):
+    client.recorder.report()
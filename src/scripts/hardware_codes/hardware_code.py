@@ -1,8 +1,24 @@
-from owl_client import OwlClient, Pose, TrajectoryPlanMode
+from owl_client import Pose, TrajectoryPlanMode
+import os
+import sys
 import time
 import numpy as np
 
-client = OwlClient("10.42.0.54")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rangoli import blend, geometry
+from rangoli.executor import StrokeExecutor
+from rangoli.journal import JobJournal, resume_approach
+from rangoli.latency import InstrumentedClient
+from rangoli.session import RobotSession
+from rangoli.speed_profile import SpeedProfile
+from rangoli.stroke_order import optimize_stroke_order
+
+# Managed session: reconnects and resumes after network drops. Set OWL_ROBOT=host:port
+# to run against the stand-in robot from rangoli.standin_robot
+client = RobotSession(os.environ.get("OWL_ROBOT", "10.42.0.54"))
+# Pass --latency to time every controller call and print a latency report at the end
+if "--latency" in sys.argv:
+    client = InstrumentedClient(client)
 toolSpeed = 35  # Set an appropriate tool speed for the movement
 
 # Wait for the robot to be available
@@ -11,38 +27,14 @@ while not client.is_running():
 
 # Function to create a square with a specified rotation
 def rotated_square(center_x, center_y, center_z, side_length, angle_deg):
-    half_side = side_length / 2
-    angle_rad = np.radians(angle_deg)
-    waypoints = []
-
-    # Define corners for a square centered at the origin, then apply rotation
-    corners = [
-        (-half_side, -half_side),
-        (-half_side, half_side),
-        (half_side, half_side),
-        (half_side, -half_side),
-        (-half_side, -half_side)  # Close the square
-    ]
-
-    # Rotate each corner and translate to the center
-    for i, (x, y) in enumerate(corners):
-        rotated_x = x * np.cos(angle_rad) - y * np.sin(angle_rad)
-        rotated_y = x * np.sin(angle_rad) + y * np.cos(angle_rad)
-
-        waypoint = Pose()
-        waypoint.x = center_x + rotated_x
-        waypoint.y = center_y + rotated_y
-        waypoint.z = center_z
-
-        # Set fixed orientation for each waypoint
-        waypoint.rx = np.pi  # Fixed roll
-        waypoint.ry = 0.0    # Fixed pitch
-        waypoint.rz = angle_rad  # Yaw angle for this square
-
-        waypoints.append(waypoint)
-        print(f"Waypoint {i}: x={waypoint.x}, y={waypoint.y}, z={waypoint.z}, rx={waypoint.rx}, ry={waypoint.ry}, rz={waypoint.rz}")
-
-    return waypoints
+    # Corners are rotated and translated to the center in a single matrix product;
+    # roll is fixed at pi and the yaw follows the square's rotation
+    stroke = geometry.rotated_square_stroke(center_x, center_y, center_z, side_length, angle_deg)
+
+    for i, (x, y, z, rx, ry, rz) in enumerate(stroke.tolist()):
+        print(f"Waypoint {i}: x={x}, y={y}, z={z}, rx={rx}, ry={ry}, rz={rz}")
+
+    return stroke
 
 # Parameters for the squares
 center_x = 0.623  # Center x-coordinate
@@ -53,22 +45,73 @@ initial_side_length = 0.06  # Side length of the first square (6 cm)
 # Generate waypoints for each square with alternating rotation and increasing side length
 angles = [45, 0, 45, 0]  # Rotation angles for each square
 side_length = initial_side_length
-
-# Execute each square individually
+strokes = []
 for angle in angles:
-    # Generate waypoints for the current square
-    waypoints = rotated_square(center_x, center_y, center_z, side_length, angle)
-    
-    # Move to the starting point of the current square without connecting to the last point
-    client.move_to_pose(waypoints[0], toolSpeed, wait=True, relative=False, moveType=TrajectoryPlanMode.STRAIGHT)
-    time.sleep(0.5)  # Pause before starting the square to avoid connecting paths
-
-    # Execute each waypoint in the current square
-    for waypoint in waypoints:
-        client.move_to_pose(waypoint, toolSpeed, wait=True, relative=False, moveType=TrajectoryPlanMode.STRAIGHT)
-        time.sleep(0.1)  # Adjust delay for smoother movement if needed
+    strokes.append(rotated_square(center_x, center_y, center_z, side_length, angle))
 
     # Increase side length for the next square
     side_length *= np.sqrt(2)
 
+if "--blend" in sys.argv:
+    # Pass --blend 10 to replace the corners with arcs starting 10 mm from each corner, so each square
+    # is drawn without stopping at its corners. Add --blend-deviation 1 to keep every arc within 1 mm
+    # of its corner, which shortens the arcs of right angles to about 2.2 mm from the corner
+    blend_radius = float(sys.argv[sys.argv.index("--blend") + 1])
+    deviation = float(sys.argv[sys.argv.index("--blend-deviation") + 1]) if "--blend-deviation" in sys.argv else None
+    strokes = [blend.blend_corners(stroke, blend_radius, deviation_mm=deviation) for stroke in strokes]
+
+# Choose the order, direction and starting corner of the squares to minimise travel between them
+plan = optimize_stroke_order(strokes)
+print(f"============ Stroke order {plan.order}, travel {plan.travel_after:.3f} m (saved {plan.travel_saved:.3f} m)")
+
+# Pass --profile-speed to plan a speed for every move: straight runs keep toolSpeed, which stays the
+# ceiling, and the speed drops where the path bends (assuming toolSpeed is in mm/s)
+profile = None
+if "--profile-speed" in sys.argv:
+    profile = SpeedProfile(max_speed=toolSpeed / 1000.0, max_accel=0.5, scale=1000.0)
+executor = StrokeExecutor(client, toolSpeed, move_type=TrajectoryPlanMode.STRAIGHT, pose_cls=Pose,
+                          speed_profile=profile, max_queued=8 if "--journal" in sys.argv else None)
+# Pauses show up as "sleep" rather than "host" time in the latency report
+pause = client.recorder.sleep if isinstance(client, InstrumentedClient) else time.sleep
+position = None
+
+# Pass --journal run.journal to record progress; after an interruption, running the same
+# design again continues from the last waypoint reached instead of starting over
+journal = None
+if "--journal" in sys.argv:
+    journal = JobJournal(sys.argv[sys.argv.index("--journal") + 1], plan.strokes)
+    if journal.resumed:
+        print(f"============ Resuming at square {journal.resume.stroke}, waypoint {journal.resume.waypoint}")
+
+# Execute each square individually
+for index, stroke in enumerate(plan.strokes):
+    done = journal.start_of(index) if journal is not None else 0
+    if done is None:
+        continue  # Drawn before the interruption
+    executor.begin_stroke()
+    if journal is not None and journal.resumed and index == journal.resume.stroke:
+        # Hover above the last waypoint reached, then lower the pen onto it
+        for pose in resume_approach(stroke, done):
+            executor.move_to(pose)
+        pause(0.5)
+    elif position is None or np.linalg.norm(stroke[0, :3] - position) > 1e-6:
+        # Move to the starting point of the current square only if the previous one did not end there
+        executor.move_to(stroke[0])
+        pause(0.5)  # Pause before starting the square to avoid connecting paths
+
+    # Execute the rest of the square as one stroke; with OWL_QUEUE_MOVES=1 the next waypoint stays queued
+    # on the controller. With --journal every blocking move (each 8 waypoints and the last) is a checkpoint
+    first = max(done, 1)
+    progress = (lambda k: journal.checkpoint(index, first + k)) if journal is not None else None
+    if first < len(stroke):
+        executor.execute(stroke[first:], new_stroke=False, progress=progress)
+    if journal is not None:
+        journal.stroke_done(index)
+    position = stroke[-1, :3]
+
+if journal is not None:
+    journal.complete()
+
 print("============ Task Complete")
+if isinstance(client, InstrumentedClient):
+    client.recorder.report()
@@ -0,0 +1,50 @@
+from owl_client import Pose, TrajectoryPlanMode
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rangoli.latency import InstrumentedClient
+from rangoli.session import RobotSession
+from rangoli.trajectory_file import TrajectoryFile, TrajectoryReplayer
+
+parser = argparse.ArgumentParser(description="Replay a trajectory recorded in simulation, without replanning")
+parser.add_argument("trajectory", help="file written by a sim script run with --record")
+parser.add_argument("--mode", choices=("auto", "joint", "pose"), default="auto",
+                    help="joint moves, pose moves, or joint moves when the controller has them")
+parser.add_argument("--segments", type=int, nargs="+", help="replay only these segments")
+parser.add_argument("--latency", action="store_true", help="print a controller latency report at the end")
+args = parser.parse_args()
+
+trajectory = TrajectoryFile(args.trajectory)
+print(f"============ Loaded {trajectory} with joints {trajectory.joint_names}")
+
+# Managed session: reconnects and resumes after network drops. Set OWL_ROBOT=host:port
+# to run against the stand-in robot from rangoli.standin_robot
+client = RobotSession(os.environ.get("OWL_ROBOT", "10.42.0.54"))
+if args.latency:
+    client = InstrumentedClient(client)
+# Every point is sent at this speed: the path is replayed, but not the recorded timing
+toolSpeed = 35  # Set an appropriate tool speed for the movement
+
+# Wait for the robot to be available
+while not client.is_running():
+    time.sleep(0.2)
+
+replayer = TrajectoryReplayer(client, toolSpeed, mode=args.mode, pose_cls=Pose,
+                              move_type=TrajectoryPlanMode.STRAIGHT)
+pause = client.recorder.sleep if isinstance(client, InstrumentedClient) else time.sleep
+
+for index in (range(len(trajectory)) if args.segments is None else args.segments):
+    times, positions, poses = trajectory.segment(index)
+    print(f"============ Segment {index}: {len(times)} points, {times[-1] if len(times) else 0.0:.2f} s planned")
+    start = time.time()
+    replayer.replay_segment(times, positions, poses)
+    print(f"============ Segment {index} took {time.time() - start:.2f} s at tool speed {toolSpeed}")
+    pause(0.5)  # Pause between segments to avoid connecting paths
+
+print(f"============ Replayed {args.trajectory} in {replayer.mode} mode with {replayer.calls} controller calls")
+print("============ Task Complete")
+if isinstance(client, InstrumentedClient):
+    client.recorder.report()
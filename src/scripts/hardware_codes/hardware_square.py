@@ -1,8 +1,21 @@
-from owl_client import OwlClient, Pose, TrajectoryPlanMode
+from owl_client import Pose, TrajectoryPlanMode
+import os
+import sys
 import time
-import numpy as np
 
-client = OwlClient("10.42.0.54")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rangoli import blend, geometry
+from rangoli.executor import StrokeExecutor
+from rangoli.latency import InstrumentedClient
+from rangoli.session import RobotSession
+from rangoli.speed_profile import SpeedProfile
+
+# Managed session: reconnects and resumes after network drops. Set OWL_ROBOT=host:port
+# to run against the stand-in robot from rangoli.standin_robot
+client = RobotSession(os.environ.get("OWL_ROBOT", "10.42.0.54"))
+# Pass --latency to time every controller call and print a latency report at the end
+if "--latency" in sys.argv:
+    client = InstrumentedClient(client)
 toolSpeed = 35  # Set an appropriate tool speed for the movement
 
 # Wait for the robot to be available
@@ -11,34 +24,13 @@ while not client.is_running():
 
 # Define a square trajectory in Cartesian space
 def square_trajectory(center_x, center_y, center_z, side_length):
-    half_side = side_length / 2
-    waypoints = []
-
-    # Define the four corners of the square
-    corners = [
-        (center_x - half_side, center_y - half_side),
-        (center_x - half_side, center_y + half_side),
-        (center_x + half_side, center_y + half_side),
-        (center_x + half_side, center_y - half_side),
-        (center_x - half_side, center_y - half_side)  # Return to starting point
-    ]
-
-    # Create Pose waypoints for each corner
-    for i, (x, y) in enumerate(corners):
-        waypoint = Pose()
-        waypoint.x = x
-        waypoint.y = y
-        waypoint.z = center_z
-
-        # Set fixed orientation for each waypoint
-        waypoint.rx = np.pi  # Replace with desired roll in radians
-        waypoint.ry = 0.0  # Replace with desired pitch in radians
-        waypoint.rz = 0.0  # Replace with desired yaw in radians
-
-        waypoints.append(waypoint)
-        print(f"Waypoint {i}: x={waypoint.x}, y={waypoint.y}, z={waypoint.z}, rx={waypoint.rx}, ry={waypoint.ry}, rz={waypoint.rz}")
-
-    return waypoints
+    # The four corners of the square plus the starting point again, with a fixed
+    # orientation (roll = pi, pitch = yaw = 0) for each waypoint
+    stroke = geometry.square_stroke(center_x, center_y, center_z, side_length)
+    for i, (x, y, z, rx, ry, rz) in enumerate(stroke.tolist()):
+        print(f"Waypoint {i}: x={x}, y={y}, z={z}, rx={rx}, ry={ry}, rz={rz}")
+
+    return stroke
 
 # Generate the trajectory waypoints for a square path
 center_x = 0.623  # Center x-coordinate
@@ -46,10 +38,25 @@ center_y = 0.0589  # Center y-coordinate
 center_z = 0.42  # Constant z-coordinate
 side_length = 0.1  # Side length of the square
 waypoints = square_trajectory(center_x, center_y, center_z, side_length)
-
-# Execute each waypoint in Cartesian space
-for waypoint in waypoints:
-    client.move_to_pose(waypoint, toolSpeed, wait=True, relative=False, moveType=TrajectoryPlanMode.STRAIGHT)
-    time.sleep(0.1)  # Adjust delay for smoother movement if needed
+if "--blend" in sys.argv:
+    # Pass --blend 10 to replace the corners with arcs starting 10 mm from each corner, so the square
+    # is drawn without stopping at the corners. Add --blend-deviation 1 to keep every arc within 1 mm
+    # of its corner, which shortens the arcs to about 2.2 mm from the corner
+    blend_radius = float(sys.argv[sys.argv.index("--blend") + 1])
+    deviation = float(sys.argv[sys.argv.index("--blend-deviation") + 1]) if "--blend-deviation" in sys.argv else None
+    waypoints = blend.blend_corners(waypoints, blend_radius, deviation_mm=deviation)
+
+# Pass --profile-speed to accelerate out of each corner and brake into the next; toolSpeed stays
+# the ceiling on the edges (assuming toolSpeed is in mm/s)
+profile = None
+if "--profile-speed" in sys.argv:
+    profile = SpeedProfile(max_speed=toolSpeed / 1000.0, max_accel=0.5, scale=1000.0)
+executor = StrokeExecutor(client, toolSpeed, move_type=TrajectoryPlanMode.STRAIGHT, pose_cls=Pose,
+                          speed_profile=profile)
+# Execute the whole path in Cartesian space; with OWL_QUEUE_MOVES=1 the next waypoint stays
+# queued on the controller (see README)
+executor.execute(waypoints)
 
 print("============ Task Complete")
+if isinstance(client, InstrumentedClient):
+    client.recorder.report()
@@ -0,0 +1,77 @@
+from owl_client import Pose, TrajectoryPlanMode
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rangoli import svg
+from rangoli.async_client import AsyncOwlClient, iterate_in_thread
+from rangoli.executor import StrokeExecutor
+from rangoli.latency import InstrumentedClient
+from rangoli.session import RobotSession
+from rangoli.speed_profile import SpeedProfile
+
+parser = argparse.ArgumentParser(description="Draw an SVG file, streaming strokes while it is parsed")
+parser.add_argument("svg_file")
+parser.add_argument("--size", type=float, default=0.2, help="size of the drawing's larger side in metres")
+parser.add_argument("--tolerance", type=float, default=0.1, help="curve flattening tolerance in mm")
+parser.add_argument("--ready-timeout", type=float, default=30.0, help="seconds to wait for the robot")
+parser.add_argument("--latency", action="store_true", help="print a controller latency report at the end")
+parser.add_argument("--profile-speed", action="store_true",
+                    help="give every move its own speed from the curvature and length of its segment")
+args = parser.parse_args()
+
+# Managed session: reconnects and resumes after network drops. Set OWL_ROBOT=host:port
+# to run against the stand-in robot from rangoli.standin_robot
+client = RobotSession(os.environ.get("OWL_ROBOT", "10.42.0.54"))
+if args.latency:
+    client = InstrumentedClient(client)
+toolSpeed = 35  # Set an appropriate tool speed for the movement
+
+# Drawing center, as in the other hardware scripts
+center_x = 0.623  # Center x-coordinate
+center_y = 0.0589  # Center y-coordinate
+center_z = 0.42  # Constant z-coordinate
+
+# With --profile-speed long straight runs keep toolSpeed, which stays the ceiling, and the speed
+# drops where the path bends (assuming toolSpeed is in mm/s)
+profile = SpeedProfile(max_speed=toolSpeed / 1000.0, max_accel=0.5, scale=1000.0) if args.profile_speed else None
+executor = StrokeExecutor(client, toolSpeed, move_type=TrajectoryPlanMode.STRAIGHT, pose_cls=Pose,
+                          speed_profile=profile)
+pause = client.recorder.sleep if isinstance(client, InstrumentedClient) else time.sleep
+
+
+def draw_stroke(stroke):
+    executor.begin_stroke()
+    executor.move_to(stroke[0])
+    pause(0.5)  # Pause before starting the stroke to avoid connecting paths
+    executor.execute(stroke[1:], new_stroke=False)
+
+
+async def main():
+    polls = []
+    async with AsyncOwlClient(client) as robot:
+        robot.status_listeners.append(lambda running, stamp: polls.append(running))
+        # Wait for the robot to be available
+        await robot.wait_ready(args.ready_timeout)
+
+        # The SVG is parsed on its own thread while the previous stroke is drawn,
+        # and the controller status keeps being polled in the background
+        count = 0
+        strokes = svg.iter_strokes(args.svg_file, args.tolerance, args.size, (center_x, center_y, center_z))
+        async for stroke in iterate_in_thread(strokes):
+            if not robot.ready.is_set():
+                print("============ Controller not running, waiting")
+                await robot.wait_ready(args.ready_timeout)
+            await robot.call(draw_stroke, stroke)
+            count += 1
+
+    print(f"============ Drew {count} strokes from {args.svg_file} ({len(polls)} status polls)")
+
+
+asyncio.run(main())
+print("============ Task Complete")
+if isinstance(client, InstrumentedClient):
+    client.recorder.report()
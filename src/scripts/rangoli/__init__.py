@@ -0,0 +1,6 @@
+"""Shared helpers for the rangoli drawing scripts.
+
+The scripts in ``hardware_codes`` and ``sim_codes`` add ``src/scripts`` to
+``sys.path`` and import from here, so the package works straight from a
+checkout without a catkin build.
+"""
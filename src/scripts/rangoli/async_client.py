@@ -0,0 +1,225 @@
+"""asyncio facade over the blocking OwlClient.
+
+``AsyncOwlClient`` runs controller commands on one dedicated thread, so they
+keep their submission order, and polls ``is_running`` on a second thread in
+the background. The poll drives two ``asyncio.Event`` objects instead of the
+scripts' ``while not client.is_running(): time.sleep(0.2)`` loop:
+
+* ``ready``: the controller reports it is running;
+* ``motion_done``: no command is queued or executing, and the last move was
+  a blocking one, so the arm has stopped.
+
+OwlClient is not documented as thread-safe, so the two threads never call
+the client at the same time: every call holds one lock. A status poll
+therefore waits for the command in flight, and while a blocking move runs
+``ready`` keeps its last value.
+
+Every command accepts a ``timeout``. A timed-out or cancelled command
+cancels the commands queued behind it, so stale moves are never sent. The
+call already executing on the command thread cannot be interrupted and
+runs to completion.
+
+With ``iterate_in_thread`` a generator (e.g. ``svg.iter_strokes``) runs on
+its own thread, so waypoint generation, telemetry and command submission
+overlap in one process::
+
+    async with AsyncOwlClient(OwlClient(ip)) as robot:
+        await robot.wait_ready(timeout=10)
+        async for stroke in iterate_in_thread(strokes):
+            await robot.call(executor.execute, stroke)
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncOwlClient(object):
+    """Awaitable moves, readiness and motion events for an OwlClient."""
+
+    def __init__(self, client, poll_interval=0.2):
+        """
+        @param: client         A connected OwlClient (or anything with the same interface)
+        @param: poll_interval  Seconds between is_running polls; None disables polling
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self.running = None          # last polled is_running result
+        self.last_poll = None        # time.time() of that poll
+        self.status_listeners = []   # f(running, timestamp), called on the event loop
+        self.ready = None
+        self.motion_done = None
+        self._commands = ThreadPoolExecutor(1, thread_name_prefix="owl-commands")
+        self._status = ThreadPoolExecutor(1, thread_name_prefix="owl-status")
+        self._client_lock = threading.Lock()
+        self._pending = set()
+        self._moving = False
+        self._poller = None
+        self._loop = None
+
+    @classmethod
+    async def connect(cls, ip, poll_interval=0.2, timeout=None):
+        """Create the OwlClient off the event loop, start polling and wait until it is ready."""
+        from owl_client import OwlClient
+
+        client = await asyncio.get_running_loop().run_in_executor(None, OwlClient, ip)
+        robot = cls(client, poll_interval)
+        await robot.start()
+        await robot.wait_ready(timeout)
+        return robot
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Create the events on the running loop and start the status poller."""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+        self.motion_done = asyncio.Event()
+        self.motion_done.set()
+        if self.poll_interval is not None:
+            self._poller = asyncio.ensure_future(self._poll())
+
+    async def close(self):
+        """Stop polling, drop queued commands and release the threads."""
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        self.cancel_pending()
+        self._commands.shutdown(wait=False)
+        self._status.shutdown(wait=False)
+
+    async def poll_status(self):
+        """Poll is_running once and update ``ready``. @returns: the result"""
+        running = bool(await self._loop.run_in_executor(self._status, self._serialized, self.client.is_running))
+        self.running, self.last_poll = running, time.time()
+        if running:
+            self.ready.set()
+        else:
+            self.ready.clear()
+        for listener in self.status_listeners:
+            listener(running, self.last_poll)
+        return running
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.poll_status()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A failed poll counts as not ready until the next one succeeds
+                self.running = False
+                self.ready.clear()
+            await asyncio.sleep(self.poll_interval)
+
+    async def wait_ready(self, timeout=None):
+        """Wait until the controller reports running; raises asyncio.TimeoutError."""
+        if self._poller is None:
+            await self.poll_status()
+        await asyncio.wait_for(self.ready.wait(), timeout)
+
+    async def wait_motion_done(self, timeout=None):
+        await asyncio.wait_for(self.motion_done.wait(), timeout)
+
+    def cancel_pending(self):
+        """Cancel commands that have not started yet. @returns: how many were cancelled"""
+        return sum(1 for future in list(self._pending) if future.cancel())
+
+    def _settle(self, future, moving):
+        self._pending.discard(future)
+        if not future.cancelled() and future.exception() is None:
+            self._moving = moving
+        if not self._pending and not self._moving:
+            self.motion_done.set()
+
+    def _serialized(self, fn, *args, **kwargs):
+        """Call into the client with no other thread inside it."""
+        with self._client_lock:
+            return fn(*args, **kwargs)
+
+    async def call(self, fn, *args, timeout=None, moving=False, **kwargs):
+        """
+        Run a blocking client call on the command thread, in submission order.
+        @param: moving  Whether the arm may still be moving when the call returns
+        """
+        future = self._commands.submit(self._serialized, functools.partial(fn, *args, **kwargs))
+        self._pending.add(future)
+        self.motion_done.clear()
+        loop = self._loop
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._settle, f, moving))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Later moves were planned assuming this one completes
+            self.cancel_pending()
+            raise
+
+    async def move_to_pose(self, pose, toolSpeed, wait=True, relative=False, moveType=None, timeout=None):
+        """Awaitable ``OwlClient.move_to_pose``; ``moveType`` defaults to the client's own default."""
+        kwargs = {"wait": wait, "relative": relative}
+        if moveType is not None:
+            kwargs["moveType"] = moveType
+        return await self.call(self.client.move_to_pose, pose, toolSpeed, timeout=timeout,
+                               moving=not wait, **kwargs)
+
+    async def execute(self, executor, stroke, timeout=None):
+        """Draw one stroke with a ``StrokeExecutor`` built on this client's OwlClient."""
+        return await self.call(executor.execute, stroke, timeout=timeout)
+
+
+class _Failure(object):
+    def __init__(self, error):
+        self.error = error
+
+
+async def iterate_in_thread(iterable, maxsize=8):
+    """
+    Async iterator over a blocking iterable that runs on its own thread,
+    at most ``maxsize`` items ahead of the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                put(item)
+            put(done)
+        except Exception as e:
+            put(_Failure(e))
+
+    thread = threading.Thread(target=produce, name="rangoli-producer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # Unblock a producer waiting on a full queue so it can notice the stop
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
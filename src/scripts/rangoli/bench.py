@@ -0,0 +1,240 @@
+"""Benchmark the drawing scripts and synthetic designs against stand-in robots.
+
+Runs each existing program with the fakes from ``rangoli.fakes`` in place of
+``owl_client`` and MoveIt, plus synthetic mandala designs drawn both the way
+the original scripts do it (one blocking move and a sleep per waypoint) and
+through the optimised pipeline (stroke ordering, simplification and the
+pipelined executor). For every run it reports waypoints/sec and the split of
+time between generation (host compute), communication, planning and sleeps,
+plus peak Python memory, as JSON.
+
+From ``src/scripts``::
+
+    python3 -m rangoli.bench --synthetic 8 64 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from rangoli import executor, fakes, geometry, simplify
+from rangoli.executor import StrokeExecutor
+from rangoli.stroke_order import optimize_stroke_order
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = {
+    "hardware_circle": "hardware_codes/hardware_circle.py",
+    "hardware_square": "hardware_codes/hardware_square.py",
+    "hardware_code": "hardware_codes/hardware_code.py",
+    "circle_sim": "sim_codes/circle_aarav.py",
+    "multiple_circles_sim": "sim_codes/multiple_circles_aarav.py",
+    "triangle_sim": "sim_codes/triangle_sim.py",
+    "waypoint_sim": "sim_codes/waypoint_sim.py",
+}
+
+# Record peak Python memory of every run (disable with --no-memory)
+TRACE_MEMORY = True
+
+
+@contextlib.contextmanager
+def _patched_sleep(stats):
+    """Route time.sleep through the fake clock so fixed pauses are measured, not waited for."""
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        stats.charge(seconds, "sleeps")
+
+    stats.sleeps = 0.0
+    time.sleep = sleep
+    try:
+        yield
+    finally:
+        time.sleep = real_sleep
+
+
+@contextlib.contextmanager
+def _fake_controller_features(batch):
+    """
+    The fake controller queues moves sent with wait=False and, with ``batch``, has the multi-pose
+    call move_to_poses. Neither is part of owl_client, so StrokeExecutor only uses them when told.
+    """
+    saved = executor.QUEUE_MOVES, executor.BATCH_METHODS
+    executor.QUEUE_MOVES = True
+    executor.BATCH_METHODS = ("move_to_poses",) if batch else ()
+    try:
+        yield
+    finally:
+        executor.QUEUE_MOVES, executor.BATCH_METHODS = saved
+
+
+@contextlib.contextmanager
+def _measure(name, latency, batch=False):
+    """Install the fakes and collect one result dict for the enclosed run."""
+    result = {"name": name}
+    # tracemalloc slows allocation-heavy code noticeably, so it is optional
+    trace = TRACE_MEMORY
+    with fakes.install(latency, batch) as stats, _patched_sleep(stats), _fake_controller_features(batch):
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield result, stats
+        finally:
+            wall = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if trace else None
+            if trace:
+                tracemalloc.stop()
+
+    waited = stats.communication + stats.planning + stats.sleeps
+    generation = wall if latency.virtual else max(0.0, wall - waited)
+    total = generation + waited
+    waypoints = stats.waypoints + stats.planned_waypoints
+    result.update(
+        waypoints=waypoints,
+        waypoints_per_sec=waypoints / total if total > 0 else None,
+        total_time=total,
+        generation_time=generation,
+        communication_time=stats.communication,
+        planning_time=stats.planning,
+        sleep_time=stats.sleeps,
+        controller_calls=stats.controller_calls,
+        planner_calls=stats.planner_calls,
+        peak_memory_bytes=peak,
+    )
+
+
+def run_script(name, latency, batch=False):
+    """Run one of ``SCRIPTS`` as __main__ with the fakes installed."""
+    path = os.path.join(SCRIPTS_DIR, SCRIPTS[name])
+    argv = sys.argv
+    with _measure(name, latency, batch) as (result, stats):
+        sys.argv = [path, "--quiet"]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runpy.run_path(path, run_name="__main__")
+        finally:
+            sys.argv = argv
+    return result
+
+
+def mandala(copies, rings=4, steps=72, center=(0.623, 0.0589, 0.42)):
+    """
+    Synthetic rangoli: ``rings`` rings of ``copies`` small circles and
+    rotated squares around the design center, drawn with fixed-step circles
+    like the original scripts.
+    """
+    cx, cy, cz = center
+    strokes = []
+    for ring in range(1, rings + 1):
+        radius = 0.025 * ring
+        for k in range(copies):
+            angle = 2.0 * np.pi * k / copies
+            x, y = cx + radius * np.cos(angle), cy + radius * np.sin(angle)
+            strokes.append(geometry.circle_stroke(x, y, cz, 0.008, steps))
+            strokes.append(geometry.rotated_square_stroke(x, y, cz, 0.01, np.degrees(angle)))
+    return strokes
+
+
+def run_synthetic_baseline(copies, latency):
+    """Draw a mandala the way the hardware scripts did: blocking moves plus sleeps."""
+    with _measure("synthetic_baseline_%d" % copies, latency) as (result, stats):
+        from owl_client import OwlClient, Pose, TrajectoryPlanMode
+
+        client = OwlClient("10.42.0.54")
+        for stroke in mandala(copies):
+            poses = geometry.to_owl_poses(stroke, Pose)
+            client.move_to_pose(poses[0], 35, wait=True, relative=False, moveType=TrajectoryPlanMode.STRAIGHT)
+            time.sleep(0.5)
+            for pose in poses:
+                client.move_to_pose(pose, 35, wait=True, relative=False, moveType=TrajectoryPlanMode.STRAIGHT)
+                time.sleep(0.1)
+    return result
+
+
+def run_synthetic_optimized(copies, latency, tolerance_mm=0.1, batch=False):
+    """Draw the same mandala through ordering, simplification and the pipelined executor."""
+    name = "synthetic_optimized%s_%d" % ("_batch" if batch else "", copies)
+    with _measure(name, latency, batch) as (result, stats):
+        from owl_client import OwlClient, Pose, TrajectoryPlanMode
+
+        strokes = [simplify.simplify_stroke(s, tolerance_mm) for s in mandala(copies)]
+        plan = optimize_stroke_order(strokes)
+        client = OwlClient("10.42.0.54")
+        executor = StrokeExecutor(client, 35, move_type=TrajectoryPlanMode.STRAIGHT, pose_cls=Pose)
+        executor.execute_all(plan.strokes)
+        result["travel_saved"] = plan.travel_saved
+    return result
+
+
+def run_all(scripts, synthetic, latency, batch=False):
+    results = []
+    # Every script gets a cold plan cache, kept out of the user's ROS_HOME
+    ros_home = os.environ.get("ROS_HOME")
+    root = tempfile.mkdtemp(prefix="rangoli_bench_")
+    try:
+        from rangoli import plan_cache
+
+        for name in scripts:
+            os.environ["ROS_HOME"] = tempfile.mkdtemp(dir=root)
+            plan_cache._default_cache = None
+            results.append(run_script(name, latency, batch))
+        for copies in synthetic:
+            results.append(run_synthetic_baseline(copies, latency))
+            results.append(run_synthetic_optimized(copies, latency))
+            results.append(run_synthetic_optimized(copies, latency, batch=True))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        plan_cache._default_cache = None
+        if ros_home is None:
+            os.environ.pop("ROS_HOME", None)
+        else:
+            os.environ["ROS_HOME"] = ros_home
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scripts", nargs="*", default=sorted(SCRIPTS), choices=sorted(SCRIPTS),
+                        help="existing programs to run (default: all)")
+    parser.add_argument("--synthetic", nargs="*", type=int, default=[8, 64],
+                        help="motif copies per ring for the synthetic mandalas")
+    parser.add_argument("--send", type=float, default=0.002, help="controller call latency (s)")
+    parser.add_argument("--settle", type=float, default=0.05, help="extra latency of a blocking move (s)")
+    parser.add_argument("--per-metre", type=float, default=0.0, help="motion time per metre (s)")
+    parser.add_argument("--plan-call", type=float, default=0.05, help="planner call latency (s)")
+    parser.add_argument("--plan-per-waypoint", type=float, default=0.002, help="planner latency per waypoint (s)")
+    parser.add_argument("--real-time", action="store_true", help="really sleep instead of accounting time")
+    parser.add_argument("--batch", action="store_true", help="give the fake OwlClient a multi-pose call")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc, which inflates generation time")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+
+    latency = fakes.Latency(args.send, args.settle, args.per_metre, args.plan_call,
+                            args.plan_per_waypoint, virtual=not args.real_time)
+    results = run_all(args.scripts, args.synthetic, latency, args.batch)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Round off the corners of polygonal strokes so they can be drawn without stopping.
+
+Squares, triangles and other polygons reach the controller as straight moves
+that meet at sharp corners. The arm has to stop at each corner, and on dense
+geometric designs those stops take most of the cycle time. ``blend_corners``
+replaces every corner with a tangent circular arc (a fillet):
+
+* the arc starts and ends at most ``radius_mm`` from the corner (the blend
+  radius, measured along the edges as for a UR-style blend zone) and never
+  takes more than an edge's share of its length;
+* with ``deviation_mm`` it also passes the corner at most that far away, so
+  the drawing stays within a known distance of the original design. A corner
+  turning by ``theta`` then blends over at most
+  ``deviation * tan(theta / 2) / (sec(theta / 2) - 1)`` along each edge,
+  where ``deviation`` is ``deviation_mm`` less the chord tolerance (about 2.4
+  times that for a right angle), so a small deviation overrides a larger
+  ``radius_mm``. Without it only the radius and the edge lengths limit the
+  arc, which passes a right angle at about 0.41 times the radius;
+* it is sampled with ``simplify.arc_steps`` at ``tolerance_mm`` chord error.
+
+The path then has a continuous tangent, and no arc vertex turns by more
+than half of ``corner_deg``, so ``rangoli.speed_profile`` (with the same
+``corner_deg``) no longer stops there. A closed stroke is restarted half-way
+along its first edge, so its first corner is blended too. Turns up to
+``corner_deg`` (densely sampled curves) and full reversals are left as they
+are.
+"""
+
+import numpy as np
+
+from rangoli.geometry import X, RX
+from rangoli.simplify import arc_steps
+
+
+def _unwrapped(stroke):
+    stroke = np.array(stroke, dtype=float)
+    stroke[:, RX:] = np.unwrap(stroke[:, RX:], axis=0)
+    return stroke
+
+
+def _fillet(a, p, b, d, tolerance_mm, corner):
+    """
+    Arc rows replacing corner ``p`` between neighbours ``a`` and ``b``,
+    tangent to both edges at distance ``d`` from the corner. Each arc vertex
+    turns by at most half of ``corner`` radians.
+    """
+    u = (p - a)[X:RX]
+    w = (b - p)[X:RX]
+    lu, lw = np.linalg.norm(u), np.linalg.norm(w)
+    u, w = u / lu, w / lw
+    theta = np.arccos(np.clip(np.dot(u, w), -1.0, 1.0))
+    n = w - np.dot(w, u) * u
+    n /= np.linalg.norm(n)
+    r = d / np.tan(0.5 * theta)
+
+    start = p + (a - p) * (d / lu)
+    end = p + (b - p) * (d / lw)
+    centre = start[X:RX] + r * n
+    steps = arc_steps(r, tolerance_mm, sweep=theta, min_steps=max(2, int(np.ceil(2.0 * theta / corner))))
+    phi = np.linspace(0.0, theta, steps + 1)
+    rows = start + (end - start) * (phi / theta)[:, None]
+    rows[:, X:RX] = centre - r * np.cos(phi)[:, None] * n + r * np.sin(phi)[:, None] * u
+    return rows
+
+
+def blend_corners(stroke, radius_mm, deviation_mm=None, tolerance_mm=0.1, corner_deg=20.0, closed=None):
+    """
+    Replace the corners of a stroke by tangent arcs.
+    @param: stroke        (N, 6) stroke array
+    @param: radius_mm     Largest distance from a corner at which its arc may start
+    @param: deviation_mm  Largest distance between a corner and its arc; None for no limit
+    @param: tolerance_mm  Chord error of the sampled arcs
+    @param: corner_deg    Turns below this are not blended
+    @param: closed        Whether the stroke ends where it starts; detected when None
+    @returns: (M, 6) stroke array with the same end points (the mid-point of the
+              first edge for closed strokes)
+    """
+    if radius_mm <= 0 or (deviation_mm is not None and deviation_mm <= 0):
+        raise ValueError("radius_mm and deviation_mm must be positive, got %r and %r" % (radius_mm, deviation_mm))
+    radius = radius_mm / 1000.0
+    # The sampled arc sags up to one chord tolerance further from the corner
+    deviation = np.inf if deviation_mm is None else max(deviation_mm - tolerance_mm, 0.5 * deviation_mm) / 1000.0
+    stroke = np.asarray(stroke, dtype=float)
+    if len(stroke) < 3:
+        return stroke
+    stroke = _unwrapped(stroke)
+    keep = np.concatenate(([True], np.linalg.norm(np.diff(stroke[:, X:RX], axis=0), axis=1) > 1e-12))
+    stroke = stroke[keep]
+    if closed is None:
+        closed = len(stroke) > 3 and np.linalg.norm(stroke[0, X:RX] - stroke[-1, X:RX]) <= 1e-9
+    if closed:
+        ring = stroke[:-1]
+        mid = 0.5 * (ring[0] + ring[1])
+        stroke = np.vstack((mid, ring[1:], ring[:1], mid))
+    if len(stroke) < 3:
+        return stroke
+
+    points = stroke[:, X:RX]
+    edges = np.diff(points, axis=0)
+    lengths = np.linalg.norm(edges, axis=1)
+    cos_turn = np.sum(edges[:-1] * edges[1:], axis=1) / (lengths[:-1] * lengths[1:])
+    theta = np.arccos(np.clip(cos_turn, -1.0, 1.0))
+    corner_rad = np.radians(corner_deg)
+    corner = (theta > corner_rad) & (theta < np.pi - 1e-6)
+
+    # An edge blended at both ends gives each arc half of its length
+    blended = np.concatenate(([False], corner, [False]))
+    share = lengths / np.where(blended[:-1] & blended[1:], 2.0, 1.0)
+    half = 0.5 * theta
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # The arc passes the corner at r (sec(theta/2) - 1) = d (sec(theta/2) - 1) / tan(theta/2)
+        by_deviation = deviation * np.tan(half) / (1.0 / np.cos(half) - 1.0)
+    reach = np.minimum.reduce([np.full(len(theta), radius), share[:-1], share[1:], by_deviation])
+
+    rows = [stroke[:1]]
+    for i in range(1, len(stroke) - 1):
+        if corner[i - 1] and reach[i - 1] > 1e-9:
+            rows.append(_fillet(stroke[i - 1], stroke[i], stroke[i + 1], reach[i - 1], tolerance_mm,
+                                corner_rad))
+        else:
+            rows.append(stroke[i:i + 1])
+    rows.append(stroke[-1:])
+    blended = np.concatenate(rows)
+    # Arcs that use up a whole edge meet the next one at the same point
+    keep = np.concatenate(([True], np.linalg.norm(np.diff(blended[:, X:RX], axis=0), axis=1) > 1e-12))
+    return blended[keep]
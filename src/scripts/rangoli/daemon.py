@@ -0,0 +1,462 @@
+"""Resident drawing service that keeps robot connections warm across jobs.
+
+Every drawing script pays for ``roscpp_initialize``/``init_node``/
+``MoveGroupCommander`` or a fresh ``OwlClient`` connection before its first
+motion. The daemon sets one backend up once and then executes jobs
+submitted over a local Unix socket, in order, reporting per-job timings.
+
+Run it and submit jobs from ``src/scripts``::
+
+    python3 -m rangoli.daemon serve --backend hardware --ip 10.42.0.54
+    python3 -m rangoli.daemon submit '{"shape": "circle", "radius": 0.05}' --wait
+    python3 -m rangoli.daemon submit '{"strokes_file": "design.npz"}'
+    python3 -m rangoli.daemon submit '{"pattern": [{"shape": "circle", "radius": 0.05},
+                                                   {"shape": "triangle", "circumradius": 0.04}]}'
+    python3 -m rangoli.daemon submit '{"pattern": [...one petal...], "folds": 8}'
+
+Any job may add ``"folds": N`` (and optionally ``"center": [x, y]``) to draw
+its strokes as one sector of an N-fold rotationally symmetric design. The
+sim backend then plans the sector only (see ``rangoli.symmetry``).
+
+With ``serve --reach-index workspace.reach`` every job is first checked
+against a ``rangoli.reachability`` index, before any planning or motion. A
+job whose strokes leave the reachable workspace or come close to a
+singularity fails straight away, and its ``"preflight"`` entry lists the
+offending stroke indices (sector strokes for symmetric jobs).
+
+With ``serve --journal-dir DIR`` progress is journalled (see
+``rangoli.journal``). A job that is interrupted by a fault, e-stop or daemon
+crash and then submitted again continues from the last stroke (on hardware:
+the last waypoint) it reached, instead of starting over.
+
+With ``serve --backend sim --parallel N`` the sim backend plans each job as
+one path cut into segments at pen lifts and corners, planned concurrently on
+N worker processes and stitched (see ``rangoli.parallel_plan``), instead of
+stroke by stroke. The worker pool stays up between jobs.
+
+The protocol is one JSON object per line in each direction. Requests are
+``{"op": "submit", "job": {...}}`` (answered immediately with the job id, so
+submission is pipelined with execution), ``{"op": "wait", "id": n}``,
+``{"op": "status"}`` and ``{"op": "shutdown"}``.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+
+from rangoli import geometry, svg
+from rangoli.journal import JobJournal, design_key, draw_strokes
+from rangoli.path import DEFAULT_CENTER, Path, Stroke, compile_pattern, primitive_stroke
+from rangoli.stroke_order import optimize_stroke_order
+from rangoli.symmetry import rotate_stroke
+
+DEFAULT_SOCKET = "/tmp/rangoli_daemon.sock"
+
+
+def job_strokes(job):
+    """
+    Build the strokes for a job description.
+    Shape jobs:   {"shape": "circle" | "square" | "rotated_square" | "triangle" | "polygon", ...parameters}
+                  (see ``rangoli.path.primitive_stroke``)
+    Pattern jobs: {"pattern": [shape job, ...]}
+    SVG jobs:     {"svg_file": path, "size_m": 0.2, "tolerance_mm": 0.1}
+    File jobs:    {"strokes_file": path to an (N, 6) .npy, an .npz of strokes or a saved Path}
+    With "folds" the strokes are one sector; see ``expand_symmetry``.
+    """
+    if "strokes_file" in job:
+        path = job["strokes_file"]
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                if "offsets" in data.files:
+                    return list(Path.load(path))
+                return [data[name] for name in sorted(data.files)]
+        return [np.load(path)]
+    if "pattern" in job:
+        return list(compile_pattern(job["pattern"]))
+    if "svg_file" in job:
+        return list(svg.iter_strokes(job["svg_file"], job.get("tolerance_mm", 0.1), job.get("size_m", 0.2)))
+    return [primitive_stroke(job)]
+
+
+def job_symmetry(job):
+    """(folds, center (x, y)) of a job; folds is 1 for asymmetric jobs."""
+    center = job.get("center", DEFAULT_CENTER[:2])
+    return int(job.get("folds", 1)), (float(center[0]), float(center[1]))
+
+
+def expand_symmetry(strokes, folds, center):
+    """All ``folds`` rotated copies of the sector strokes, copy by copy, keeping Stroke metadata."""
+    expanded = []
+    for k in range(folds):
+        angle = 2.0 * np.pi * k / folds
+        for s in strokes:
+            rotated = rotate_stroke(s, angle, center)
+            expanded.append(Stroke(rotated, s.pen, s.speed, s.tool) if isinstance(s, Stroke) else rotated)
+    return expanded
+
+
+class HardwareBackend(object):
+    """One OwlClient connection and stroke executor reused for every job."""
+
+    def __init__(self, ip, tool_speed=35, max_queued=None):
+        """
+        @param: max_queued  Waypoints sent without waiting before a blocking move; every blocking
+                            move is a journal checkpoint, so set it when journalling
+        """
+        from owl_client import Pose, TrajectoryPlanMode
+        from rangoli.executor import StrokeExecutor
+        from rangoli.session import RobotSession
+
+        # Waits until the controller is running, and reconnects after drops
+        self.client = RobotSession(ip)
+        self.executor = StrokeExecutor(self.client, tool_speed, move_type=TrajectoryPlanMode.STRAIGHT,
+                                       pose_cls=Pose, max_queued=max_queued)
+
+    def draw(self, strokes, journal=None):
+        draw_strokes(self.executor, strokes, journal)
+
+
+class SimBackend(object):
+    """One MoveIt node and MoveGroupCommander reused for every job."""
+
+    def __init__(self, group_name="arm", eef_step=0.01, parallel=None):
+        """
+        @param: parallel  Plan every job as segments on this many worker processes
+                          (rangoli.parallel_plan) instead of stroke by stroke
+        """
+        from rangoli.moveit_interface import MoveGroupInterface
+
+        self.interface = MoveGroupInterface(group_name, node_name="rangoli_drawing_daemon", quiet=True)
+        self.eef_step = eef_step
+        self._chain = None
+        self.planner = None
+        if parallel:
+            from rangoli.parallel_plan import ParallelCartesianPlanner
+
+            self.planner = ParallelCartesianPlanner(self.interface.move_group, workers=parallel, eef_step=eef_step)
+
+    def draw(self, strokes, journal=None):
+        from rangoli import plan_cache
+
+        if self.planner is not None:
+            return self._draw_parallel(strokes, journal)
+        move_group = self.interface.move_group
+        for index, stroke in enumerate(strokes):
+            done = journal.start_of(index) if journal is not None else 0
+            if done is None:
+                continue
+            # A resumed stroke is planned from the last waypoint it reached
+            waypoints = geometry.to_ros_poses(stroke[max(done - 1, 0):])
+            plan, fraction = plan_cache.cached_compute_cartesian_path(move_group, waypoints, self.eef_step)
+            if fraction < 1.0:
+                raise ValueError("Only %.1f%% of the stroke could be planned" % (fraction * 100))
+            move_group.execute(plan, wait=True)
+            if journal is not None:
+                journal.stroke_done(index)
+        move_group.stop()
+        if journal is not None:
+            journal.complete()
+
+    def _draw_parallel(self, strokes, journal=None):
+        """Plan the strokes not yet drawn as one segment-parallel path and execute it."""
+        move_group = self.interface.move_group
+        pending = []
+        for index, stroke in enumerate(strokes):
+            done = journal.start_of(index) if journal is not None else 0
+            if done is not None:
+                pending.append((index, stroke[max(done - 1, 0):]))
+        if pending:
+            plan, fraction = self.planner.plan([stroke for _, stroke in pending])
+            if fraction < 1.0:
+                raise ValueError("Only %.1f%% of the design could be planned" % (fraction * 100))
+            print("============ Planned %d strokes on %d workers (%d seams replanned)" % (
+                len(pending), self.planner.workers, self.planner.replanned_seams))
+            move_group.execute(plan, wait=True)
+            if journal is not None:
+                for index, _ in pending:
+                    journal.stroke_done(index)
+        move_group.stop()
+        if journal is not None:
+            journal.complete()
+
+    @property
+    def chain(self):
+        """KinematicChain of the group for deriving symmetric copies, or False without one."""
+        if self._chain is None:
+            import rospy
+
+            from rangoli.kinematics import KinematicChain
+
+            try:
+                self._chain = KinematicChain.from_parameter_server(self.interface.move_group.get_name())
+            except (KeyError, ValueError, rospy.ROSException) as e:
+                print("============ No kinematic description (%s), only base-axis symmetry is used" % e)
+                self._chain = False
+        return self._chain
+
+    def draw_symmetric(self, strokes, folds, center):
+        """Plan the sector strokes once and derive the other ``folds - 1`` copies."""
+        from rangoli.symmetry import SymmetricPlanner
+
+        planner = SymmetricPlanner(self.interface.move_group, folds, center, chain=self.chain or None,
+                                   eef_step=self.eef_step)
+        plans = planner.plan(strokes)
+        fraction = min(p.fraction for p in plans)
+        if fraction < 1.0:
+            raise ValueError("Only %.1f%% of the design could be planned" % (fraction * 100))
+        print("============ Planned %d strokes x %d copies with %d planner calls (%d copies derived)" % (
+            len(strokes), folds, planner.planner_calls, planner.derived))
+        planner.execute(plans)
+
+
+class DrawingDaemon(object):
+    """Job queue executed in submission order on a single worker thread."""
+
+    def __init__(self, backend, optimize_order=True, reach_index=None, journal_dir=None):
+        """
+        @param: reach_index  rangoli.reachability.ReachabilityIndex every job is checked against first
+        @param: journal_dir  Directory of job journals, so interrupted jobs resume when submitted again
+        """
+        self.backend = backend
+        self.optimize_order = optimize_order
+        self.reach_index = reach_index
+        self.journal_dir = journal_dir
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._worker = threading.Thread(target=self._run, name="rangoli-drawing-worker")
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, job):
+        with self._cond:
+            job_id = next(self._ids)
+            self.jobs[job_id] = {"id": job_id, "job": job, "state": "queued", "submitted": time.time()}
+            self._pending.append(job_id)
+            self._cond.notify_all()
+        return job_id
+
+    def wait(self, job_id, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.jobs[job_id]["state"] in ("queued", "running"):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self.report(job_id)
+
+    def report(self, job_id):
+        record = self.jobs[job_id]
+        return {k: v for k, v in record.items() if k != "job"}
+
+    def status(self):
+        with self._cond:
+            return {"pending": list(self._pending), "jobs": [self.report(i) for i in sorted(self.jobs)]}
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait for the worker to finish the remaining jobs after ``stop()``."""
+        self._worker.join(timeout)
+
+    def _preflight(self, record, strokes, folds, center):
+        """Check a job against the reachability index, raising ValueError if any stroke fails."""
+        start = time.time()
+        checked = expand_symmetry(strokes, folds, center) if folds > 1 else strokes
+        result = self.reach_index.preflight(checked)
+        # Report the job's own stroke indices, i.e. the sector strokes of symmetric jobs
+        unreachable = sorted(set(i % len(strokes) for i in result.unreachable))
+        singular = sorted(set(i % len(strokes) for i in result.singular))
+        record["preflight"] = {"ok": result.ok, "unreachable": unreachable, "singular": singular,
+                               "samples": result.samples, "time": time.time() - start}
+        if not result.ok:
+            raise ValueError("preflight failed: unreachable strokes %s, near-singular strokes %s"
+                             % (unreachable, singular))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping and not self._pending:
+                    return
+                job_id = self._pending.pop(0)
+                record = self.jobs[job_id]
+                record["state"] = "running"
+
+            timings = {}
+            start = time.time()
+            timings["queued"] = start - record["submitted"]
+            try:
+                strokes = job_strokes(record["job"])
+                folds, center = job_symmetry(record["job"])
+                if self.reach_index is not None and strokes:
+                    self._preflight(record, strokes, folds, center)
+                if self.optimize_order and len(strokes) > 1:
+                    plan = optimize_stroke_order(strokes)
+                    # Carry pen/speed/tool over to the reordered, possibly reversed strokes
+                    strokes = [Stroke(s, strokes[i].pen, strokes[i].speed, strokes[i].tool)
+                               if isinstance(strokes[i], Stroke) else s
+                               for s, i in zip(plan.strokes, plan.order)]
+                symmetric = folds > 1 and hasattr(self.backend, "draw_symmetric")
+                if folds > 1 and not symmetric:
+                    strokes = expand_symmetry(strokes, folds, center)
+                timings["generation"] = time.time() - start
+                if symmetric:
+                    self.backend.draw_symmetric(strokes, folds, center)
+                elif self.journal_dir is not None:
+                    path = os.path.join(self.journal_dir, "%s.journal" % design_key(strokes)[:16])
+                    with JobJournal(path, strokes) as journal:
+                        if journal.resumed:
+                            record["resumed"] = list(journal.resume)
+                            print("============ Job %d resumes at stroke %d, waypoint %d" % (
+                                job_id, journal.resume.stroke, journal.resume.waypoint))
+                        self.backend.draw(strokes, journal)
+                else:
+                    self.backend.draw(strokes)
+                timings["execution"] = time.time() - start - timings["generation"]
+                state, error = "done", None
+            except Exception as e:
+                state, error = "failed", "%s: %s" % (type(e).__name__, e)
+            timings["total"] = time.time() - record["submitted"]
+
+            with self._cond:
+                record.update(state=state, timings=timings)
+                if error:
+                    record["error"] = error
+                self._cond.notify_all()
+            print("============ Job %d %s in %.3f s %s" % (job_id, state, timings["total"], error or ""))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.drawing_daemon
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode())
+                op = request.get("op")
+                if op == "submit":
+                    reply = {"ok": True, "id": daemon.submit(request["job"])}
+                elif op == "wait":
+                    reply = dict(daemon.wait(request["id"], request.get("timeout")), ok=True)
+                elif op == "status":
+                    reply = dict(daemon.status(), ok=True)
+                elif op == "shutdown":
+                    daemon.stop()
+                    threading.Thread(target=self.server.shutdown).start()
+                    reply = {"ok": True}
+                else:
+                    reply = {"ok": False, "error": "unknown op %r" % (op,)}
+            except Exception as e:
+                reply = {"ok": False, "error": "%s: %s" % (type(e).__name__, e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(daemon, socket_path=DEFAULT_SOCKET):
+    """Accept jobs on ``socket_path`` until a shutdown request arrives."""
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = _Server(socket_path, _Handler)
+    server.drawing_daemon = daemon
+    print("============ Drawing daemon listening on %s" % socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        daemon.stop()
+        daemon.join()
+
+
+def request(message, socket_path=DEFAULT_SOCKET):
+    """Send one request to a running daemon and return its reply."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        stream = sock.makefile("rwb")
+        stream.write((json.dumps(message) + "\n").encode())
+        stream.flush()
+        return json.loads(stream.readline().decode())
+    finally:
+        sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    sub = parser.add_subparsers(dest="command")
+
+    serve_parser = sub.add_parser("serve", help="start the daemon")
+    serve_parser.add_argument("--backend", choices=("hardware", "sim"), default="hardware")
+    serve_parser.add_argument("--ip", default="10.42.0.54")
+    serve_parser.add_argument("--tool-speed", type=float, default=35)
+    serve_parser.add_argument("--no-optimize-order", action="store_true")
+    serve_parser.add_argument("--reach-index", help="reachability index to preflight every job against")
+    serve_parser.add_argument("--journal-dir", help="journal job progress here, so interrupted jobs resume")
+    serve_parser.add_argument("--parallel", type=int, metavar="N",
+                              help="sim backend: plan each job as segments on N worker processes")
+
+    submit_parser = sub.add_parser("submit", help="queue a job (JSON text or a .json file)")
+    submit_parser.add_argument("job")
+    submit_parser.add_argument("--wait", action="store_true")
+
+    sub.add_parser("status", help="list queued and finished jobs")
+    sub.add_parser("shutdown", help="finish queued jobs and stop")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        if args.backend == "hardware":
+            # With a journal, checkpoint at least every 8 waypoints, as hardware_code.py --journal does
+            backend = HardwareBackend(args.ip, args.tool_speed, max_queued=8 if args.journal_dir else None)
+        else:
+            backend = SimBackend(parallel=args.parallel)
+        reach_index = None
+        if args.reach_index:
+            from rangoli.reachability import ReachabilityIndex
+
+            reach_index = ReachabilityIndex(args.reach_index)
+        if args.journal_dir:
+            os.makedirs(args.journal_dir, exist_ok=True)
+        serve(DrawingDaemon(backend, optimize_order=not args.no_optimize_order, reach_index=reach_index,
+                            journal_dir=args.journal_dir), args.socket)
+    elif args.command == "submit":
+        if os.path.exists(args.job):
+            with open(args.job) as f:
+                job = json.load(f)
+        else:
+            job = json.loads(args.job)
+        reply = request({"op": "submit", "job": job}, args.socket)
+        if args.wait and reply.get("ok"):
+            reply = request({"op": "wait", "id": reply["id"]}, args.socket)
+        print(json.dumps(reply, indent=2))
+    elif args.command in ("status", "shutdown"):
+        print(json.dumps(request({"op": args.command}, args.socket), indent=2))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
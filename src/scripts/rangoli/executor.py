@@ -0,0 +1,168 @@
+"""Submit whole strokes to an OwlClient with as few blocking calls as possible.
+
+The scripts used to call ``move_to_pose(..., wait=True)`` followed by
+``time.sleep(0.1)`` for every waypoint, so the arm stopped and idled between
+points. ``StrokeExecutor`` instead:
+
+* hands the whole stroke to a multi-pose call if one is named in
+  ``BATCH_METHODS``, otherwise
+* with queuing switched on, submits waypoints with ``wait=False`` so the next
+  command is already queued on the controller while the current one runs,
+  blocking only on the last waypoint of the stroke (and every ``max_queued``
+  waypoints, to bound the controller queue), otherwise
+* sends one blocking move per waypoint, without the sleeps.
+
+The documented owl_client API is the single-pose
+``move_to_pose(pose, toolSpeed, wait, relative, moveType)``. It has no
+multi-pose call, so ``BATCH_METHODS`` is empty, and it does not say whether a
+move sent with ``wait=False`` is queued behind the running one or replaces
+it. If it replaces it, queued waypoints are skipped. Queuing is therefore off
+unless ``OWL_QUEUE_MOVES=1`` is set (or ``queue_moves=True`` passed) on a
+controller where it has been checked that every queued waypoint is reached.
+
+With a ``rangoli.speed_profile.SpeedProfile`` every move gets its own tool
+speed (fast on straight runs, slower where the path bends); multi-pose calls
+then take each run of equal speeds.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from rangoli import geometry
+from rangoli.speed_profile import speed_runs
+
+# Multi-pose calls looked up on the client, in order of preference. They are
+# called as method(poses, tool_speed, wait=..., moveType=...). owl_client has
+# none; add the name here once the controller provides one.
+BATCH_METHODS = ()
+
+# Whether moves sent with wait=False are known to queue on the controller
+QUEUE_MOVES = os.environ.get("OWL_QUEUE_MOVES") == "1"
+
+
+class StrokeExecutor(object):
+    """Executes strokes on an OwlClient, counting the controller calls made."""
+
+    def __init__(self, client, tool_speed, move_type=None, pose_cls=None,
+                 max_queued=None, dwell=0.0, use_batch=True, speed_profile=None, queue_moves=None):
+        """
+        @param: client      A connected OwlClient (or anything with the same move_to_pose)
+        @param: tool_speed  Tool speed passed to every move
+        @param: move_type   TrajectoryPlanMode, STRAIGHT by default
+        @param: pose_cls    Pose class used to convert stroke arrays, owl_client.Pose by default
+        @param: max_queued  Block every this many waypoints; None queues the whole stroke
+        @param: queue_moves Send waypoints with wait=False; QUEUE_MOVES by default, and
+                            every waypoint blocks when False
+        @param: dwell       Optional pause after each stroke, in seconds
+        @param: use_batch   Use a multi-pose client call when available
+        @param: speed_profile  SpeedProfile giving each waypoint of array strokes its own speed;
+                               a Stroke's own speed still takes precedence
+        """
+        if move_type is None:
+            from owl_client import TrajectoryPlanMode
+            move_type = TrajectoryPlanMode.STRAIGHT
+
+        self.client = client
+        self.tool_speed = tool_speed
+        self.move_type = move_type
+        self.pose_cls = pose_cls
+        self.max_queued = max_queued
+        self.dwell = dwell
+        self.speed_profile = speed_profile
+        self.queue_moves = QUEUE_MOVES if queue_moves is None else queue_moves
+        # Last commanded position, where the first move of the next stroke starts from
+        self.position = None
+        self.batch_call = None
+        if use_batch:
+            for name in BATCH_METHODS:
+                if callable(getattr(client, name, None)):
+                    self.batch_call = getattr(client, name)
+                    break
+        # Instrumented clients (rangoli.latency) attribute calls to strokes
+        self._begin_stroke = getattr(client, "begin_stroke", None)
+        self.calls = 0
+
+    def _poses(self, stroke):
+        if isinstance(stroke, (list, tuple)):
+            return list(stroke)
+        # Stroke arrays and rangoli.path.Stroke objects
+        return geometry.to_owl_poses(stroke, self.pose_cls)
+
+    @staticmethod
+    def _end_position(stroke):
+        if isinstance(stroke, (list, tuple)):
+            last = stroke[-1]
+            return np.array([last.x, last.y, last.z]) if hasattr(last, "z") else None
+        return np.asarray(stroke)[-1, geometry.X:geometry.RX].copy()
+
+    def begin_stroke(self):
+        """Mark a stroke boundary on clients that record one, e.g. before the approach move."""
+        if self._begin_stroke is not None:
+            self._begin_stroke()
+
+    def move_to(self, pose, wait=True, speed=None):
+        """Single move, e.g. the approach to the start of a stroke."""
+        if isinstance(pose, np.ndarray):
+            self.position = pose.reshape(6)[geometry.X:geometry.RX].copy()
+            pose = self._poses(pose.reshape(1, 6))[0]
+        else:
+            self.position = None
+        self.client.move_to_pose(pose, self.tool_speed if speed is None else speed, wait=wait,
+                                 relative=False, moveType=self.move_type)
+        self.calls += 1
+
+    def execute(self, stroke, wait=True, new_stroke=True, progress=None):
+        """
+        Draw one stroke.
+        @param: stroke      (N, 6) stroke array, rangoli.path.Stroke (whose speed, if set,
+                            overrides tool_speed and the speed profile) or a list of Pose objects
+        @param: wait        Block until the last waypoint has been reached
+        @param: new_stroke  Mark a stroke boundary first; pass False after calling begin_stroke yourself
+        @param: progress    Called as progress(k) after every blocking move, with the number k of
+                            waypoints of this stroke reached so far (see rangoli.journal)
+        @returns: The number of controller calls used for this stroke
+        """
+        poses = self._poses(stroke)
+        if not poses:
+            return 0
+        speed = getattr(stroke, "speed", None)
+        speeds = None
+        if speed is None and self.speed_profile is not None and not isinstance(stroke, (list, tuple)):
+            speeds = self.speed_profile.stroke_speeds(np.asarray(stroke), previous=self.position)
+        if speed is None:
+            speed = self.tool_speed
+        if new_stroke:
+            self.begin_stroke()
+
+        calls_before = self.calls
+        if self.batch_call is not None and speeds is None:
+            self.batch_call(poses, speed, wait=wait, moveType=self.move_type)
+            self.calls += 1
+            if wait and progress is not None:
+                progress(len(poses))
+        elif self.batch_call is not None:
+            for start, end, run_speed in speed_runs(speeds):
+                self.batch_call(poses[start:end], run_speed, wait=wait and end == len(poses),
+                                moveType=self.move_type)
+                self.calls += 1
+            if wait and progress is not None:
+                progress(len(poses))
+        else:
+            last = len(poses) - 1
+            for i, pose in enumerate(poses):
+                block = not self.queue_moves or (i == last and wait) or (
+                    self.max_queued is not None and (i + 1) % self.max_queued == 0)
+                self.move_to(pose, wait=block, speed=speed if speeds is None else float(speeds[i]))
+                if block and progress is not None:
+                    progress(i + 1)
+
+        self.position = self._end_position(stroke)
+        if self.dwell > 0:
+            time.sleep(self.dwell)
+        return self.calls - calls_before
+
+    def execute_all(self, strokes):
+        """Draw several strokes back to back, returning the total number of controller calls."""
+        return sum(self.execute(stroke) for stroke in strokes)
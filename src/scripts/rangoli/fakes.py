@@ -0,0 +1,402 @@
+"""Stand-in OwlClient and MoveIt implementations for benchmarking without a robot.
+
+``install()`` puts fake ``owl_client``, ``rospy``, ``moveit_commander``,
+``geometry_msgs``, ``moveit_msgs``, ``std_msgs`` and ``tf`` modules into
+``sys.modules`` so the unmodified drawing scripts can be run on a plain Linux
+box. Every controller or planner call is charged a configurable latency,
+either really slept or only accounted on a virtual clock, and counted in a
+shared ``FakeStats``.
+"""
+
+import copy
+import math
+import pickle
+import sys
+import time
+import types
+from contextlib import contextmanager
+
+import numpy as np
+
+# Captured at import so benchmarks can patch time.sleep without affecting the fakes
+_real_sleep = time.sleep
+
+# Package modules that import ROS at module level and so must be re-imported
+# whenever a new set of fakes is installed
+_ROS_BOUND = ("rangoli.moveit_interface",)
+
+
+class Latency(object):
+    """Per-call costs, in seconds, charged by the fakes."""
+
+    def __init__(self, send=0.002, settle=0.05, per_metre=0.0, plan_call=0.05,
+                 plan_per_waypoint=0.002, virtual=True):
+        """
+        @param: send               Every controller call (command round trip)
+        @param: settle             Extra cost of a blocking move (deceleration and done handshake)
+        @param: per_metre          Motion time per metre, charged when a blocking move drains the queue
+        @param: plan_call          Fixed cost of each compute_cartesian_path call
+        @param: plan_per_waypoint  compute_cartesian_path cost per waypoint
+        @param: virtual            Only account the time instead of sleeping
+        """
+        self.send = send
+        self.settle = settle
+        self.per_metre = per_metre
+        self.plan_call = plan_call
+        self.plan_per_waypoint = plan_per_waypoint
+        self.virtual = virtual
+
+
+class FakeStats(object):
+    """Counters shared by all fakes created under one ``install()``."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.controller_calls = 0
+        self.waypoints = 0
+        self.planner_calls = 0
+        self.planned_waypoints = 0
+        self.communication = 0.0
+        self.planning = 0.0
+        self.distance = 0.0
+
+    def charge(self, seconds, kind="communication"):
+        setattr(self, kind, getattr(self, kind) + seconds)
+        if not self.latency.virtual and seconds > 0:
+            _real_sleep(seconds)
+
+    def as_dict(self):
+        return {k: v for k, v in vars(self).items() if k != "latency"}
+
+
+# ---------------------------------------------------------------- owl_client
+
+
+class Pose(object):
+    def __init__(self):
+        self.x = self.y = self.z = 0.0
+        self.rx = self.ry = self.rz = 0.0
+
+
+class TrajectoryPlanMode(object):
+    JOINT = 0
+    STRAIGHT = 1
+
+
+class FakeOwlClient(object):
+    """Accepts moves instantly apart from the configured latency."""
+
+    def __init__(self, ip, stats=None, batch=False):
+        self.ip = ip
+        self.stats = stats or FakeStats(Latency())
+        self.position = np.zeros(3)
+        self.queued_distance = 0.0
+        if batch:
+            self.move_to_poses = self._move_to_poses
+
+    def is_running(self):
+        self.stats.charge(self.stats.latency.send)
+        return True
+
+    def _travel(self, pose):
+        target = np.array((pose.x, pose.y, pose.z))
+        self.queued_distance += float(np.linalg.norm(target - self.position))
+        self.position = target
+
+    def _drain(self):
+        latency = self.stats.latency
+        self.stats.distance += self.queued_distance
+        self.stats.charge(latency.settle + latency.per_metre * self.queued_distance)
+        self.queued_distance = 0.0
+
+    def move_to_pose(self, pose, toolSpeed, wait=True, relative=False, moveType=TrajectoryPlanMode.JOINT):
+        self.stats.controller_calls += 1
+        self.stats.waypoints += 1
+        self.stats.charge(self.stats.latency.send)
+        self._travel(pose)
+        if wait:
+            self._drain()
+        return True
+
+    def _move_to_poses(self, poses, toolSpeed, wait=True, moveType=TrajectoryPlanMode.JOINT):
+        self.stats.controller_calls += 1
+        self.stats.waypoints += len(poses)
+        self.stats.charge(self.stats.latency.send)
+        for pose in poses:
+            self._travel(pose)
+        if wait:
+            self._drain()
+        return True
+
+
+# ---------------------------------------------------------------- ROS messages
+
+
+class _Message(object):
+    """Minimal genpy-like message: picklable, with serialize/deserialize."""
+
+    def serialize(self, buff):
+        buff.write(pickle.dumps(self.__dict__, protocol=2))
+
+    def deserialize(self, data):
+        self.__dict__.update(pickle.loads(data))
+        return self
+
+
+class Point(_Message):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+
+class Quaternion(_Message):
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x, self.y, self.z, self.w = x, y, z, w
+
+
+class RosPose(_Message):
+    def __init__(self):
+        self.position = Point()
+        self.orientation = Quaternion()
+
+
+class PoseStamped(_Message):
+    def __init__(self):
+        self.header = types.SimpleNamespace(frame_id="")
+        self.pose = RosPose()
+
+
+class Duration(float):
+    """rospy.Duration stand-in; a float number of seconds."""
+
+    def __new__(cls, secs=0.0, nsecs=0):
+        return float.__new__(cls, secs + nsecs * 1e-9)
+
+    def __add__(self, other):
+        return Duration(float(self) + float(other))
+
+    def to_sec(self):
+        return float(self)
+
+
+class JointTrajectoryPoint(_Message):
+    def __init__(self, positions=(), time_from_start=0.0):
+        self.positions = list(positions)
+        self.velocities = []
+        self.accelerations = []
+        self.time_from_start = Duration(time_from_start)
+
+
+class RobotTrajectory(_Message):
+    def __init__(self):
+        self.joint_trajectory = types.SimpleNamespace(joint_names=[], points=[])
+
+
+class RobotState(_Message):
+    def __init__(self):
+        self.joint_state = types.SimpleNamespace(name=[], position=[])
+
+
+class DisplayTrajectory(_Message):
+    def __init__(self):
+        self.trajectory_start = None
+        self.trajectory = []
+
+
+# ---------------------------------------------------------------- MoveIt
+
+
+JOINT_NAMES = ["joint%d" % i for i in range(1, 7)]
+
+
+class FakeMoveGroupCommander(object):
+    """Plans every Cartesian path fully, charging latency per call and per waypoint."""
+
+    def __init__(self, name, stats=None):
+        self.name = name
+        self.stats = stats or FakeStats(Latency())
+        self.pose = RosPose()
+        self.pose.position.x, self.pose.position.y, self.pose.position.z = 0.5, 0.1, 0.4
+        self.pose.orientation = Quaternion(1.0, 0.0, 0.0, 0.0)
+        self.joints = [0.0] * len(JOINT_NAMES)
+        self.target = None
+
+    def get_name(self):
+        return self.name
+
+    def get_planning_frame(self):
+        return "world"
+
+    def get_end_effector_link(self):
+        return "tcp"
+
+    def get_active_joints(self):
+        return list(JOINT_NAMES)
+
+    def get_current_joint_values(self):
+        return list(self.joints)
+
+    def get_current_pose(self):
+        stamped = PoseStamped()
+        stamped.pose = copy.deepcopy(self.pose)
+        return stamped
+
+    def set_start_state(self, state):
+        self.joints = list(state.joint_state.position)
+
+    def set_start_state_to_current_state(self):
+        pass
+
+    def set_pose_target(self, pose):
+        self.target = pose
+
+    def go(self, joints=None, wait=True):
+        self.stats.charge(self.stats.latency.plan_call)
+        if joints is not None:
+            self.joints = list(joints)
+        elif self.target is not None:
+            self.pose = copy.deepcopy(self.target)
+        return True
+
+    def stop(self):
+        pass
+
+    def clear_pose_targets(self):
+        self.target = None
+
+    def compute_cartesian_path(self, waypoints, eef_step, *args, **kwargs):
+        latency = self.stats.latency
+        self.stats.planner_calls += 1
+        self.stats.planned_waypoints += len(waypoints)
+        self.stats.charge(latency.plan_call + latency.plan_per_waypoint * len(waypoints), "planning")
+
+        # One trajectory point per eef_step of path length, with made-up joint values
+        points = [(self.pose.position.x, self.pose.position.y, self.pose.position.z)]
+        points += [(p.position.x, p.position.y, p.position.z) for p in waypoints]
+        length = float(np.sum(np.linalg.norm(np.diff(np.array(points), axis=0), axis=1))) if waypoints else 0.0
+        count = max(2, int(math.ceil(length / eef_step)) + 1)
+        plan = RobotTrajectory()
+        plan.length = length  # fake-only, used to charge motion time on execute
+        plan.joint_trajectory.joint_names = list(JOINT_NAMES)
+        for s in np.linspace(0.0, 1.0, count):
+            plan.joint_trajectory.points.append(
+                JointTrajectoryPoint([j + s for j in self.joints], time_from_start=s * length / 0.1))
+        return plan, 1.0
+
+    def retime_trajectory(self, state, plan, *args, **kwargs):
+        return plan
+
+    def execute(self, plan, wait=True):
+        latency = self.stats.latency
+        points = plan.joint_trajectory.points
+        if points:
+            length = getattr(plan, "length", 0.0)
+            self.stats.distance += length
+            self.stats.charge(latency.settle + latency.per_metre * length)
+            self.joints = list(points[-1].positions)
+        return True
+
+
+class RobotCommander(object):
+    def get_group_names(self):
+        return ["arm"]
+
+    def get_current_state(self):
+        state = RobotState()
+        state.joint_state.name = list(JOINT_NAMES)
+        state.joint_state.position = [0.0] * len(JOINT_NAMES)
+        return state
+
+
+class PlanningSceneInterface(object):
+    pass
+
+
+class Publisher(object):
+    def __init__(self, *args, **kwargs):
+        self.published = 0
+
+    def publish(self, message):
+        self.published += 1
+
+
+# ---------------------------------------------------------------- module installation
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def fake_modules(stats, batch=False):
+    """The dict of fake modules to place in ``sys.modules``."""
+    from rangoli.geometry import quaternion_from_euler
+
+    class ROSInterruptException(Exception):
+        pass
+
+    class ROSException(Exception):
+        pass
+
+    def get_param(name, *default):
+        # There is no parameter server: only defaults are returned
+        if default:
+            return default[0]
+        raise KeyError(name)
+
+    def pose_to_list(pose):
+        return [pose.position.x, pose.position.y, pose.position.z,
+                pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w]
+
+    geometry_msgs_msg = _module("geometry_msgs.msg", Point=Point, Quaternion=Quaternion, Pose=RosPose,
+                                PoseStamped=PoseStamped)
+    moveit_msgs_msg = _module("moveit_msgs.msg", RobotTrajectory=RobotTrajectory, RobotState=RobotState,
+                              DisplayTrajectory=DisplayTrajectory)
+    conversions = _module("moveit_commander.conversions", pose_to_list=pose_to_list)
+    transformations = _module("tf.transformations",
+                              quaternion_from_euler=lambda r, p, y: quaternion_from_euler((r, p, y)))
+    std_msgs_msg = _module("std_msgs.msg", String=str)
+
+    return {
+        "owl_client": _module("owl_client", Pose=Pose, TrajectoryPlanMode=TrajectoryPlanMode,
+                              OwlClient=lambda ip: FakeOwlClient(ip, stats, batch)),
+        "rospy": _module("rospy", init_node=lambda *a, **k: None, Publisher=Publisher,
+                         logerr=lambda *a: None, loginfo=lambda *a: None, logwarn=lambda *a: None,
+                         Duration=Duration, ROSInterruptException=ROSInterruptException,
+                         ROSException=ROSException, get_param=get_param),
+        "moveit_commander": _module("moveit_commander", roscpp_initialize=lambda argv: None,
+                                    RobotCommander=RobotCommander, PlanningSceneInterface=PlanningSceneInterface,
+                                    MoveGroupCommander=lambda name: FakeMoveGroupCommander(name, stats),
+                                    conversions=conversions),
+        "moveit_commander.conversions": conversions,
+        "geometry_msgs": _module("geometry_msgs", msg=geometry_msgs_msg),
+        "geometry_msgs.msg": geometry_msgs_msg,
+        "moveit_msgs": _module("moveit_msgs", msg=moveit_msgs_msg),
+        "moveit_msgs.msg": moveit_msgs_msg,
+        "std_msgs": _module("std_msgs", msg=std_msgs_msg),
+        "std_msgs.msg": std_msgs_msg,
+        "tf": _module("tf", transformations=transformations),
+        "tf.transformations": transformations,
+    }
+
+
+@contextmanager
+def install(latency=None, batch=False):
+    """
+    Temporarily replace the robot and ROS modules with fakes.
+    @returns: the FakeStats shared by every fake created inside the block
+    """
+    stats = FakeStats(latency or Latency())
+    modules = fake_modules(stats, batch)
+    saved = {name: sys.modules.get(name) for name in tuple(modules) + _ROS_BOUND}
+    for name in _ROS_BOUND:
+        sys.modules.pop(name, None)
+    sys.modules.update(modules)
+    try:
+        yield stats
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
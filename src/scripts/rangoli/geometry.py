@@ -0,0 +1,182 @@
+"""Vectorised waypoint generation shared by the hardware and sim scripts.
+
+Every generator returns a whole stroke as an ``(N, 6)`` float64 array whose
+columns are ``x, y, z, rx, ry, rz`` (metres and radians, the same fields as
+``owl_client.Pose``). Robot pose objects are only created at the edge, by
+``to_owl_poses`` and ``to_ros_poses``.
+"""
+
+import numpy as np
+
+# Column indices of a stroke array
+X, Y, Z, RX, RY, RZ = range(6)
+
+# The drawing orientation used throughout: tool pointing straight down
+DRAW_ROLL = np.pi
+
+
+def make_stroke(x, y, z, rx=DRAW_ROLL, ry=0.0, rz=0.0):
+    """
+    Stack per-column values into an (N, 6) stroke. Scalars are broadcast.
+    @returns: np.ndarray of shape (N, 6)
+    """
+    columns = np.broadcast_arrays(*(np.asarray(c, dtype=float) for c in (x, y, z, rx, ry, rz)))
+    return np.stack(columns, axis=-1).reshape(-1, 6)
+
+
+def circle_stroke(center_x, center_y, center_z, radius, steps=72, start_angle=0.0,
+                  rx=DRAW_ROLL, ry=0.0, rz=0.0):
+    """
+    Closed circle in the x-y plane, ``steps + 1`` points with the last equal to the first.
+    """
+    angles = start_angle + np.linspace(0.0, 2.0 * np.pi, steps + 1)
+    return make_stroke(center_x + radius * np.cos(angles),
+                       center_y + radius * np.sin(angles),
+                       center_z, rx, ry, rz)
+
+
+def polyline_stroke(points_xy, center_z, rx=DRAW_ROLL, ry=0.0, rz=0.0, closed=False):
+    """
+    Stroke through the given (M, 2) x-y points at a constant height.
+    With ``closed=True`` the first point is appended again at the end.
+    """
+    points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+    if closed:
+        points_xy = np.vstack((points_xy, points_xy[:1]))
+    return make_stroke(points_xy[:, 0], points_xy[:, 1], center_z, rx, ry, rz)
+
+
+def rotate_xy(points_xy, angle_rad, center=(0.0, 0.0)):
+    """Rotate (M, 2) points by ``angle_rad`` about ``center`` in one matrix product."""
+    c, s = np.cos(angle_rad), np.sin(angle_rad)
+    center = np.asarray(center, dtype=float)
+    rotation = np.array([[c, s], [-s, c]])  # transposed, since points are rows
+    return (np.asarray(points_xy, dtype=float) - center) @ rotation + center
+
+
+def rotated_square_stroke(center_x, center_y, center_z, side_length, angle_deg, rz=None):
+    """
+    Closed square rotated by ``angle_deg`` about its center, starting at the
+    (-half, -half) corner as in ``hardware_code.py``. The yaw defaults to the
+    square's rotation.
+    """
+    half_side = side_length / 2.0
+    angle_rad = np.radians(angle_deg)
+    corners = np.array([(-half_side, -half_side),
+                        (-half_side, half_side),
+                        (half_side, half_side),
+                        (half_side, -half_side)])
+    corners = rotate_xy(corners, angle_rad) + (center_x, center_y)
+    return polyline_stroke(corners, center_z, rz=angle_rad if rz is None else rz, closed=True)
+
+
+def square_stroke(center_x, center_y, center_z, side_length):
+    """Closed axis-aligned square with a fixed zero yaw."""
+    return rotated_square_stroke(center_x, center_y, center_z, side_length, 0.0, rz=0.0)
+
+
+def polygon_stroke(center_x, center_y, center_z, circumradius, sides, angle_deg=0.0,
+                   rx=DRAW_ROLL, ry=0.0, rz=0.0):
+    """Closed regular polygon with its first vertex at ``angle_deg``."""
+    angles = np.radians(angle_deg) + np.linspace(0.0, 2.0 * np.pi, sides + 1)
+    return make_stroke(center_x + circumradius * np.cos(angles),
+                       center_y + circumradius * np.sin(angles),
+                       center_z, rx, ry, rz)
+
+
+def relative_stroke(start, deltas):
+    """
+    Waypoints reached by applying successive (dx, dy, dz) moves from ``start``,
+    the way the sim tutorials build paths from the current pose. The start
+    itself is not included, matching ``compute_cartesian_path`` usage.
+    @param: start   A stroke row (x, y, z, rx, ry, rz)
+    @param: deltas  (M, 3) array of position increments
+    """
+    start = np.asarray(start, dtype=float)
+    stroke = np.repeat(start[None, :], len(deltas), axis=0)
+    stroke[:, X:RX] += np.cumsum(np.asarray(deltas, dtype=float).reshape(-1, 3), axis=0)
+    return stroke
+
+
+def quaternion_from_euler(rpy):
+    """
+    Vectorised equivalent of ``tf.transformations.quaternion_from_euler`` (sxyz axes).
+    @param: rpy  (..., 3) roll, pitch, yaw
+    @returns: (..., 4) quaternions in x, y, z, w order
+    """
+    half = np.asarray(rpy, dtype=float) * 0.5
+    cr, cp, cy = np.cos(half[..., 0]), np.cos(half[..., 1]), np.cos(half[..., 2])
+    sr, sp, sy = np.sin(half[..., 0]), np.sin(half[..., 1]), np.sin(half[..., 2])
+    return np.stack((sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy,
+                     cr * cp * cy + sr * sp * sy), axis=-1)
+
+
+def euler_from_quaternion(q):
+    """
+    Inverse of ``quaternion_from_euler``.
+    @param: q  (..., 4) quaternions in x, y, z, w order
+    @returns: (..., 3) roll, pitch, yaw
+    """
+    q = np.asarray(q, dtype=float)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    roll = np.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2.0 * (w * y - z * x), -1.0, 1.0))
+    yaw = np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    return np.stack((roll, pitch, yaw), axis=-1)
+
+
+def to_owl_poses(stroke, pose_cls=None):
+    """
+    Convert a stroke into a list of ``owl_client.Pose`` objects.
+    ``pose_cls`` can be passed to avoid importing owl_client.
+    """
+    if pose_cls is None:
+        from owl_client import Pose as pose_cls
+
+    poses = []
+    for x, y, z, rx, ry, rz in np.asarray(stroke, dtype=float).tolist():
+        pose = pose_cls()
+        pose.x, pose.y, pose.z = x, y, z
+        pose.rx, pose.ry, pose.rz = rx, ry, rz
+        poses.append(pose)
+    return poses
+
+
+def to_ros_poses(stroke, orientation=None):
+    """
+    Convert a stroke into a list of ``geometry_msgs.msg.Pose`` messages.
+    If ``orientation`` (a Quaternion message) is given it is used for every
+    waypoint instead of the stroke's rx/ry/rz columns.
+    """
+    import geometry_msgs.msg
+
+    stroke = np.asarray(stroke, dtype=float)
+    if orientation is None:
+        quaternions = quaternion_from_euler(stroke[:, RX:]).tolist()
+    else:
+        quaternions = [(orientation.x, orientation.y, orientation.z, orientation.w)] * len(stroke)
+
+    poses = []
+    for (x, y, z), (qx, qy, qz, qw) in zip(stroke[:, X:RX].tolist(), quaternions):
+        pose = geometry_msgs.msg.Pose()
+        pose.position.x, pose.position.y, pose.position.z = x, y, z
+        pose.orientation.x, pose.orientation.y = qx, qy
+        pose.orientation.z, pose.orientation.w = qz, qw
+        poses.append(pose)
+    return poses
+
+
+def ros_pose_to_row(pose):
+    """Convert a ``geometry_msgs.msg.Pose`` into a single stroke row."""
+    q = pose.orientation
+    rx, ry, rz = euler_from_quaternion((q.x, q.y, q.z, q.w))
+    return np.array([pose.position.x, pose.position.y, pose.position.z, rx, ry, rz])
+
+
+def ros_poses_to_array(poses):
+    """(N, 7) x, y, z, qx, qy, qz, qw array from a list of geometry_msgs Pose messages."""
+    return np.array([(p.position.x, p.position.y, p.position.z,
+                      p.orientation.x, p.orientation.y, p.orientation.z, p.orientation.w)
+                     for p in poses], dtype=float).reshape(-1, 7)
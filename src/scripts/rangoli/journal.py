@@ -0,0 +1,184 @@
+"""Append-only job journal, so that interrupted drawings resume instead of restarting.
+
+A KeyboardInterrupt, fault or e-stop half-way through a 30-minute design used
+to mean drawing it again from waypoint 0. ``JobJournal`` records progress as
+the drawing goes:
+
+* the first line is a JSON header with the design key, a hash of the stroke
+  arrays in drawing order, so a journal is only resumed for the same design;
+* every checkpoint appends one short ``"<stroke> <waypoints done>"`` line,
+  flushed and (by default) fsynced. Appending a few bytes is cheap, and a
+  crash can at worst tear the last line, which is then ignored;
+* a final ``done`` line marks the design as finished, so the next run of the
+  same design starts from the beginning again.
+
+Checkpoints are taken wherever the robot is known to have reached a
+waypoint: at the end of every stroke and at every blocking move inside it
+(``StrokeExecutor(max_queued=...)``). On resume ``resume_approach`` first
+hovers ``clearance`` metres above the last waypoint reached and then lowers
+the pen onto it, so the drawing continues without redrawing anything.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry
+
+ResumePoint = namedtuple("ResumePoint", ["stroke", "waypoint"])
+ResumePoint.__doc__ = """First stroke still to draw and the number of its waypoints already reached."""
+
+
+def design_key(strokes, decimals=6):
+    """Hash of the strokes, in drawing order."""
+    digest = hashlib.sha1()
+    for stroke in strokes:
+        rows = np.asarray(stroke, dtype=float).reshape(-1, 6)
+        # Adding 0.0 turns -0.0 into 0.0 so both hash alike
+        digest.update(np.ascontiguousarray(np.round(rows, decimals) + 0.0).tobytes())
+        digest.update(b"%d;" % len(rows))
+    return digest.hexdigest()
+
+
+def resume_approach(stroke, waypoint, clearance=0.02):
+    """
+    Safe way back onto a stroke: hover above the last reached waypoint, then lower onto it.
+    @param: waypoint   Number of waypoints of the stroke already reached
+    @param: clearance  Hover height above the waypoint in metres
+    @returns: (2, 6) stroke array of the two approach poses
+    """
+    target = np.asarray(stroke, dtype=float)[max(waypoint - 1, 0)]
+    hover = target.copy()
+    hover[geometry.Z] += clearance
+    return np.stack((hover, target))
+
+
+class JobJournal(object):
+    """Progress of one design, kept in an append-only file."""
+
+    def __init__(self, path, strokes, sync=True):
+        """
+        @param: path     Journal file; resumed if it belongs to the same unfinished design
+        @param: strokes  Strokes in drawing order
+        @param: sync     fsync every checkpoint, so progress survives a power cut as well
+        """
+        self.path = path
+        self.key = design_key(strokes)
+        self.strokes = len(strokes)
+        self.sync = sync
+        self.resume = ResumePoint(0, 0)
+        previous = self._read()
+        if previous is not None:
+            self.resume = previous
+            # Drop a torn last line, so the next checkpoint starts on a line of its own
+            with open(path, "rb+") as f:
+                f.truncate(f.read().rfind(b"\n") + 1)
+            self._file = open(path, "a")
+        else:
+            self._start()
+        self.resumed = self.resume != (0, 0)
+
+    def _read(self):
+        """Resume point of an unfinished journal of this design, or None."""
+        try:
+            with open(self.path) as f:
+                lines = f.read().split("\n")
+        except (IOError, OSError):
+            return None
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return None
+        if header.get("key") != self.key:
+            return None
+        point = ResumePoint(0, 0)
+        # The last element is "" after a complete line, or a torn write that is ignored
+        for line in lines[1:-1]:
+            if line == "done":
+                return None
+            fields = line.split()
+            if len(fields) == 2 and all(f.isdigit() for f in fields):
+                point = ResumePoint(int(fields[0]), int(fields[1]))
+        return point
+
+    def _start(self):
+        header = json.dumps({"version": 1, "key": self.key, "strokes": self.strokes, "started": time.time()})
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(header + "\n")
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a")
+
+    def _append(self, line):
+        self._file.write(line + "\n")
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def checkpoint(self, stroke, waypoint):
+        """Record that ``waypoint`` waypoints of stroke ``stroke`` have been reached."""
+        self._append("%d %d" % (stroke, waypoint))
+
+    def stroke_done(self, stroke):
+        """Record a finished stroke."""
+        self.checkpoint(stroke + 1, 0)
+
+    def start_of(self, stroke):
+        """Waypoints of ``stroke`` already drawn (0, or the resume waypoint), or None if it is done."""
+        if stroke < self.resume.stroke:
+            return None
+        return self.resume.waypoint if stroke == self.resume.stroke else 0
+
+    def complete(self):
+        """Mark the design as finished and close the journal."""
+        self._append("done")
+        self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return "JobJournal(%r, resume at stroke %d waypoint %d of %d strokes)" % (
+            self.path, self.resume.stroke, self.resume.waypoint, self.strokes)
+
+
+def draw_strokes(executor, strokes, journal=None, clearance=0.02):
+    """
+    Draw strokes with a StrokeExecutor, checkpointing into ``journal`` and skipping
+    whatever it records as already drawn.
+    @returns: The number of controller calls made
+    """
+    calls = 0
+    for index, stroke in enumerate(strokes):
+        done = journal.start_of(index) if journal is not None else 0
+        if done is None:
+            continue
+        if journal is not None and journal.resumed and index == journal.resume.stroke:
+            # Back onto the design from wherever the interruption left the arm
+            executor.begin_stroke()
+            for pose in resume_approach(stroke, done, clearance):
+                executor.move_to(pose)
+                calls += 1
+            first = max(done, 1)
+            if first < len(stroke):
+                progress = (lambda k, index=index, first=first: journal.checkpoint(index, first + k))
+                calls += executor.execute(stroke[first:], new_stroke=False, progress=progress)
+        else:
+            progress = (lambda k, index=index: journal.checkpoint(index, k)) if journal is not None else None
+            calls += executor.execute(stroke, progress=progress)
+        if journal is not None:
+            journal.stroke_done(index)
+    if journal is not None:
+        journal.complete()
+    return calls
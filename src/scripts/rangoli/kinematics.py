@@ -0,0 +1,466 @@
+"""Vectorised inverse kinematics for the arm, for precomputing joint trajectories offline.
+
+``KinematicChain`` reads the serial chain of a planning group from the
+robot's URDF (a file, an XML string or the ``robot_description`` parameter,
+with the group's base and tip links taken from the SRDF) and evaluates
+forward kinematics and Jacobians for whole ``(N, J)`` arrays of joint values
+at once.
+
+``KinematicChain.solve`` turns an ``(N, 6)`` stroke array into an ``(N, J)``
+joint array in one call. Every pose is solved with damped least squares,
+batched over all rows, so no per-pose service or planner call is involved.
+Rows are seeded from nearby solutions, which keeps consecutive solutions on
+the same branch wherever the path allows it. First, anchor rows at most
+``seed_spacing`` apart along the path are solved in sequence, each seeded
+from the previous anchor. Then the gaps between solved rows are bisected in
+batched rounds, each midpoint seeded from the solved row before it. No seed
+is therefore more than ``seed_spacing`` from its row, and a path of length
+``L`` takes ``L / seed_spacing`` single-row solves plus about
+``log2(N * seed_spacing / L)`` batched rounds. The result flags:
+
+* ``reachable``: the residual is within tolerance and the joints are within
+  their limits;
+* ``branch_switch``: the configuration changed between a row and its
+  predecessor, i.e. some joint jumped by more than ``jump_tolerance`` or the
+  sign of the Jacobian determinant flipped (a singularity was crossed).
+
+From ``src/scripts``, to precompute the joints of a saved ``Path``::
+
+    python3 -m rangoli.kinematics design.npz --urdf owl.urdf --output joints.npz
+
+``KinematicChain.seed_fn`` can also stand in for the ``/compute_ik`` service
+in ``ParallelCartesianPlanner``.
+"""
+
+import argparse
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry
+
+Joint = namedtuple("Joint", ["name", "type", "parent", "child", "origin", "axis", "lower", "upper"])
+Joint.__doc__ = """One URDF joint; origin is the 4x4 parent-to-joint transform, limits are +-inf when absent."""
+
+IKSolution = namedtuple("IKSolution", ["joints", "reachable", "branch_switch", "position_error",
+                                       "orientation_error", "iterations"])
+IKSolution.__doc__ = """Joint values (N, J) with per-row flags and residuals (metres and radians)."""
+
+MOVABLE = ("revolute", "continuous", "prismatic")
+
+
+def rotation_from_euler(rpy):
+    """
+    Rotation matrices for roll, pitch, yaw (sxyz axes, as ``quaternion_from_euler``).
+    @param: rpy  (..., 3) angles
+    @returns: (..., 3, 3) matrices
+    """
+    rpy = np.asarray(rpy, dtype=float)
+    cr, cp, cy = np.cos(rpy[..., 0]), np.cos(rpy[..., 1]), np.cos(rpy[..., 2])
+    sr, sp, sy = np.sin(rpy[..., 0]), np.sin(rpy[..., 1]), np.sin(rpy[..., 2])
+    return np.stack((np.stack((cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr), axis=-1),
+                     np.stack((sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr), axis=-1),
+                     np.stack((-sp, cp * sr, cp * cr), axis=-1)), axis=-2)
+
+
+def _axis_rotation(axis, angle):
+    """Rodrigues: (N, 3, 3) rotations by ``angle`` (N,) about the unit ``axis`` (3,)."""
+    k = np.array([[0.0, -axis[2], axis[1]],
+                  [axis[2], 0.0, -axis[0]],
+                  [-axis[1], axis[0], 0.0]])
+    s, c = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + s * k + (1.0 - c) * (k @ k)
+
+
+def _floats(text, default):
+    return np.array([float(v) for v in text.split()]) if text else np.array(default, dtype=float)
+
+
+def _read_xml(source):
+    """Root element of an XML string or file."""
+    if source.lstrip().startswith("<"):
+        return ET.fromstring(source)
+    return ET.parse(source).getroot()
+
+
+def parse_urdf(source):
+    """
+    Joints of a URDF document.
+    @param: source  URDF file name or XML string
+    @returns: list of Joint in document order
+    """
+    joints = []
+    for element in _read_xml(source).iter("joint"):
+        if element.find("parent") is None:
+            continue  # transmission joints share the tag name
+        origin = element.find("origin")
+        xyz = _floats(origin.get("xyz") if origin is not None else None, (0.0, 0.0, 0.0))
+        rpy = _floats(origin.get("rpy") if origin is not None else None, (0.0, 0.0, 0.0))
+        transform = np.eye(4)
+        transform[:3, :3] = rotation_from_euler(rpy)
+        transform[:3, 3] = xyz
+        axis = element.find("axis")
+        axis = _floats(axis.get("xyz") if axis is not None else None, (1.0, 0.0, 0.0))
+        limit = element.find("limit")
+        joint_type = element.get("type")
+        lower, upper = -np.inf, np.inf
+        if limit is not None and joint_type != "continuous":
+            lower = float(limit.get("lower", -np.inf))
+            upper = float(limit.get("upper", np.inf))
+        joints.append(Joint(element.get("name"), joint_type, element.find("parent").get("link"),
+                            element.find("child").get("link"), transform, axis / np.linalg.norm(axis),
+                            lower, upper))
+    return joints
+
+
+def srdf_chain(source, group="arm"):
+    """
+    Base and tip links of a planning group in an SRDF document. Groups given as
+    a list of joints are resolved by ``KinematicChain`` from the joint names.
+    @returns: (base_link, tip_link) or (None, None) for a joint-list group, and the joint names
+    """
+    for element in _read_xml(source).iter("group"):
+        if element.get("name") != group:
+            continue
+        chain = element.find("chain")
+        if chain is not None:
+            return chain.get("base_link"), chain.get("tip_link"), []
+        return None, None, [j.get("name") for j in element.findall("joint")]
+    raise KeyError("no group %r in the SRDF" % group)
+
+
+class KinematicChain(object):
+    """Serial chain from a base link to a tip link, evaluated on batches of joint values."""
+
+    def __init__(self, joints, base_link=None, tip_link=None):
+        """
+        @param: joints     All joints of the robot, as from parse_urdf
+        @param: base_link  Chain root; the URDF's root link by default
+        @param: tip_link   Chain end; the end of the longest chain below the base by default
+        """
+        by_child = {j.child: j for j in joints}
+        children = {}
+        for j in joints:
+            children.setdefault(j.parent, []).append(j)
+        if base_link is None:
+            roots = {j.parent for j in joints} - set(by_child)
+            base_link = sorted(roots)[0]
+        if tip_link is None:
+            tip_link = self._deepest(base_link, children)
+
+        chain = []
+        link = tip_link
+        while link != base_link:
+            if link not in by_child:
+                raise ValueError("link %r is not below %r" % (tip_link, base_link))
+            chain.append(by_child[link])
+            link = by_child[link].parent
+        chain.reverse()
+
+        # Fold fixed joints into the origin of the next movable joint, or the tail
+        self.base_link = base_link
+        self.tip_link = tip_link
+        self.joints = []
+        self.origins = []
+        pending = np.eye(4)
+        for j in chain:
+            pending = pending @ j.origin
+            if j.type in MOVABLE:
+                self.joints.append(j)
+                self.origins.append(pending)
+                pending = np.eye(4)
+        self.tail = pending
+        self.joint_names = [j.name for j in self.joints]
+        self.lower = np.array([j.lower for j in self.joints])
+        self.upper = np.array([j.upper for j in self.joints])
+        self.prismatic = np.array([j.type == "prismatic" for j in self.joints])
+
+    @staticmethod
+    def _deepest(link, children):
+        # Most movable joints first, then most joints overall, so fixed tool frames are kept
+        best = (0, 0, link)
+        stack = [(0, 0, link)]
+        while stack:
+            movable, depth, current = stack.pop()
+            for j in children.get(current, ()):
+                key = (movable + (j.type in MOVABLE), depth + 1, j.child)
+                best = max(best, key)
+                stack.append(key)
+        return best[2]
+
+    @classmethod
+    def from_urdf(cls, source, base_link=None, tip_link=None):
+        return cls(parse_urdf(source), base_link, tip_link)
+
+    @classmethod
+    def from_parameter_server(cls, group="arm", param="robot_description"):
+        """Chain of a MoveIt planning group from ``robot_description`` and its SRDF."""
+        import rospy
+
+        joints = parse_urdf(rospy.get_param(param))
+        base_link, tip_link, names = srdf_chain(rospy.get_param(param + "_semantic"), group)
+        if names:
+            by_name = {j.name: j for j in joints}
+            movable = [by_name[n] for n in names if by_name[n].type in MOVABLE]
+            base_link, tip_link = movable[0].parent, movable[-1].child
+        return cls(joints, base_link, tip_link)
+
+    def __len__(self):
+        return len(self.joints)
+
+    def __repr__(self):
+        return "KinematicChain(%s -> %s, %d joints)" % (self.base_link, self.tip_link, len(self))
+
+    # ------------------------------------------------------------ kinematics
+
+    def _frames(self, q):
+        """Tip transforms (N, 4, 4) plus joint axes and positions (N, J, 3) in the base frame."""
+        q = np.asarray(q, dtype=float).reshape(-1, len(self))
+        n = len(q)
+        transform = np.broadcast_to(np.eye(4), (n, 4, 4)).copy()
+        axes = np.empty((n, len(self), 3))
+        positions = np.empty((n, len(self), 3))
+        motion = np.broadcast_to(np.eye(4), (n, 4, 4)).copy()
+        for i, joint in enumerate(self.joints):
+            transform = transform @ self.origins[i]
+            axes[:, i] = transform[:, :3, :3] @ joint.axis
+            positions[:, i] = transform[:, :3, 3]
+            if self.prismatic[i]:
+                motion[:, :3, :3] = np.eye(3)
+                motion[:, :3, 3] = q[:, i, None] * joint.axis
+            else:
+                motion[:, :3, :3] = _axis_rotation(joint.axis, q[:, i])
+                motion[:, :3, 3] = 0.0
+            transform = transform @ motion
+        return transform @ self.tail, axes, positions
+
+    def forward(self, q):
+        """
+        Forward kinematics.
+        @param: q  (N, J) joint values
+        @returns: (N, 4, 4) tip transforms in the base frame
+        """
+        return self._frames(q)[0]
+
+    def forward_stroke(self, q):
+        """Tip poses of (N, J) joint values as an (N, 6) stroke array."""
+        tip = self.forward(q)
+        rows = np.empty((len(tip), 6))
+        rows[:, geometry.X:geometry.RX] = tip[:, :3, 3]
+        rows[:, geometry.RX] = np.arctan2(tip[:, 2, 1], tip[:, 2, 2])
+        rows[:, geometry.RY] = np.arcsin(np.clip(-tip[:, 2, 0], -1.0, 1.0))
+        rows[:, geometry.RZ] = np.arctan2(tip[:, 1, 0], tip[:, 0, 0])
+        return rows
+
+    def jacobian(self, q):
+        """
+        Geometric Jacobians, linear rows first.
+        @returns: (tip transforms (N, 4, 4), Jacobians (N, 6, J))
+        """
+        tip, axes, positions = self._frames(q)
+        jac = np.zeros((len(tip), 6, len(self)))
+        revolute = ~self.prismatic
+        jac[:, :3, revolute] = np.cross(axes[:, revolute], tip[:, None, :3, 3] - positions[:, revolute]
+                                        ).transpose(0, 2, 1)
+        jac[:, 3:, revolute] = axes[:, revolute].transpose(0, 2, 1)
+        jac[:, :3, self.prismatic] = axes[:, self.prismatic].transpose(0, 2, 1)
+        return tip, jac
+
+    # ------------------------------------------------------------ inverse kinematics
+
+    @staticmethod
+    def _error(tip, position, rotation):
+        """Stacked (N, 6) position and orientation error of the tips against the targets."""
+        error = np.empty((len(tip), 6))
+        error[:, :3] = position - tip[:, :3, 3]
+        # Orientation error as the axis-angle of rotation @ tip^T
+        delta = rotation @ tip[:, :3, :3].transpose(0, 2, 1)
+        angle = np.arccos(np.clip((np.trace(delta, axis1=1, axis2=2) - 1.0) * 0.5, -1.0, 1.0))
+        vee = np.stack((delta[:, 2, 1] - delta[:, 1, 2],
+                        delta[:, 0, 2] - delta[:, 2, 0],
+                        delta[:, 1, 0] - delta[:, 0, 1]), axis=1)
+        sin = np.sin(angle)
+        scale = np.where(sin > 1e-6, angle / np.where(sin > 1e-6, 2.0 * sin, 1.0), 0.5)
+        error[:, 3:] = vee * scale[:, None]
+        # Near a half turn the skew part vanishes: take the axis from the symmetric part
+        flip = angle > np.pi - 1e-3
+        if np.any(flip):
+            sym = (delta[flip] + np.eye(3)) * 0.5
+            column = np.argmax(np.diagonal(sym, axis1=1, axis2=2), axis=1)
+            axis = sym[np.arange(len(column)), :, column]
+            axis /= np.linalg.norm(axis, axis=1, keepdims=True)
+            error[flip, 3:] = axis * angle[flip, None]
+        return error
+
+    def _dls(self, q, position, rotation, max_iterations, position_tolerance, orientation_tolerance,
+             damping, max_step):
+        """Damped least squares on every row at once; rows drop out as they converge."""
+        q = q.copy()
+        iterations = np.zeros(len(q), dtype=np.int32)
+        active = np.arange(len(q))
+        finite_lower = np.isfinite(self.lower)
+        finite_upper = np.isfinite(self.upper)
+        for _ in range(max_iterations):
+            tip, jac = self.jacobian(q[active])
+            error = self._error(tip, position[active], rotation[active])
+            done = ((np.linalg.norm(error[:, :3], axis=1) <= position_tolerance)
+                    & (np.linalg.norm(error[:, 3:], axis=1) <= orientation_tolerance))
+            active, jac, error = active[~done], jac[~done], error[~done]
+            if len(active) == 0:
+                break
+            # dq = J^T (J J^T + lambda^2 I)^-1 e
+            jjt = jac @ jac.transpose(0, 2, 1) + damping * damping * np.eye(6)
+            step = (jac.transpose(0, 2, 1) @ np.linalg.solve(jjt, error[:, :, None]))[:, :, 0]
+            largest = np.max(np.abs(step), axis=1, keepdims=True)
+            step *= np.minimum(1.0, max_step / np.maximum(largest, 1e-12))
+            moved = q[active] + step
+            moved = np.where(finite_lower, np.maximum(moved, self.lower), moved)
+            moved = np.where(finite_upper, np.minimum(moved, self.upper), moved)
+            q[active] = moved
+            iterations[active] += 1
+        return q, iterations
+
+    def solve(self, poses, seed=None, max_iterations=100, position_tolerance=1e-4,
+              orientation_tolerance=1e-3, damping=0.01, max_step=0.3, jump_tolerance=0.5, seed_spacing=0.02):
+        """
+        Joint values reaching every pose of a stroke.
+        @param: poses            (N, 6) stroke array in the chain's base frame
+        @param: seed             (J,) joint values the first row starts from; zeros or the
+                                 middle of the limits by default. An (N, J) array seeds every
+                                 row directly, e.g. from a cached solution of a similar path
+        @param: max_step         Largest joint change per iteration (rad or m)
+        @param: jump_tolerance   Joint change between consecutive rows flagged as a branch switch
+        @param: seed_spacing     Largest path length (m) between sequentially solved anchor rows; None
+                                 solves only the first row first and bisects from there, for rows
+                                 that do not form a path
+        @returns: IKSolution
+        """
+        poses = np.asarray(poses, dtype=float).reshape(-1, 6)
+        n = len(poses)
+        position = poses[:, geometry.X:geometry.RX]
+        rotation = rotation_from_euler(poses[:, geometry.RX:])
+        if seed is None:
+            bounded = np.isfinite(self.lower) & np.isfinite(self.upper)
+            seed = np.zeros(len(self))
+            seed[bounded] = 0.5 * (self.lower[bounded] + self.upper[bounded])
+        options = (max_iterations, position_tolerance, orientation_tolerance, damping, max_step)
+
+        seed = np.asarray(seed, dtype=float)
+        if seed.ndim == 2:
+            joints, iterations = self._dls(seed.reshape(n, len(self)), position, rotation, *options)
+        else:
+            joints = np.empty((n, len(self)))
+            iterations = np.zeros(n, dtype=np.int32)
+            anchors = np.zeros(1, dtype=int)
+            if seed_spacing is not None and n > 1:
+                arc = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(position, axis=0), axis=1))))
+                anchors = np.concatenate(([0], np.flatnonzero(np.diff(np.floor(arc / seed_spacing)) > 0) + 1))
+            # Anchors in sequence, each from the previous one
+            previous = seed.reshape(1, -1)
+            for a in anchors:
+                joints[a:a + 1], iterations[a:a + 1] = self._dls(previous, position[a:a + 1],
+                                                                 rotation[a:a + 1], *options)
+                previous = joints[a:a + 1]
+            solved = np.zeros(n, dtype=bool)
+            solved[anchors] = True
+            # Then bisect every gap, seeding its midpoint from the solved row before it
+            while not solved.all():
+                known = np.flatnonzero(solved)
+                after = np.append(known[1:], n)
+                gap = after - known > 1
+                base = known[gap]
+                rows = (base + after[gap]) // 2
+                joints[rows], iterations[rows] = self._dls(joints[base], position[rows], rotation[rows],
+                                                           *options)
+                solved[rows] = True
+
+        tip, jac = self.jacobian(joints)
+        error = self._error(tip, position, rotation)
+        position_error = np.linalg.norm(error[:, :3], axis=1)
+        orientation_error = np.linalg.norm(error[:, 3:], axis=1)
+        reachable = ((position_error <= position_tolerance) & (orientation_error <= orientation_tolerance)
+                     & np.all(joints >= self.lower - 1e-9, axis=1) & np.all(joints <= self.upper + 1e-9, axis=1))
+
+        branch_switch = np.zeros(n, dtype=bool)
+        if n > 1:
+            branch_switch[1:] = np.max(np.abs(np.diff(joints, axis=0)), axis=1) > jump_tolerance
+            if jac.shape[1] == jac.shape[2]:
+                sign = np.sign(np.linalg.det(jac))
+                branch_switch[1:] |= (sign[1:] * sign[:-1]) < 0
+        return IKSolution(joints, reachable, branch_switch, position_error, orientation_error, iterations)
+
+    def solve_strokes(self, strokes, seed=None, **kwargs):
+        """
+        Solve several strokes as one continuous path, in drawing order. The first
+        row of each stroke follows a pen-up travel move, which may turn the wrist
+        freely, so branch switches are only reported within strokes.
+        @returns: (IKSolution over all rows, offsets) where stroke i is rows offsets[i]:offsets[i + 1]
+        """
+        strokes = [np.asarray(s, dtype=float).reshape(-1, 6) for s in strokes]
+        offsets = np.cumsum([0] + [len(s) for s in strokes])
+        solution = self.solve(np.concatenate(strokes), seed, **kwargs)
+        solution.branch_switch[offsets[:-1][offsets[:-1] < offsets[-1]]] = False
+        return solution, offsets
+
+    def seed_fn(self, row, seed_positions):
+        """``ParallelCartesianPlanner`` seed function: joint values for one pose, or None."""
+        solution = self.solve(np.asarray(row).reshape(1, 6), seed_positions)
+        return solution.joints[0] if solution.reachable[0] else None
+
+
+def save_solution(path, chain, solution, offsets=None):
+    """Write precomputed joints, flags and joint names to an .npz file."""
+    np.savez(path, joint_names=np.array(chain.joint_names), joints=solution.joints,
+             reachable=solution.reachable, branch_switch=solution.branch_switch,
+             position_error=solution.position_error, orientation_error=solution.orientation_error,
+             offsets=np.array([0, len(solution.joints)]) if offsets is None else offsets)
+
+
+def load_solution(path):
+    """
+    @returns: (joint_names, IKSolution, offsets)
+    """
+    with np.load(path) as f:
+        return ([str(name) for name in f["joint_names"]],
+                IKSolution(f["joints"], f["reachable"], f["branch_switch"], f["position_error"],
+                           f["orientation_error"], np.zeros(len(f["joints"]), dtype=np.int32)),
+                f["offsets"])
+
+
+def main(argv=None):
+    from rangoli.path import Path
+
+    parser = argparse.ArgumentParser(description="Precompute joint trajectories for a saved Path")
+    parser.add_argument("path", help="Path .npz file, as written by Path.save")
+    parser.add_argument("--urdf", help="URDF file; read from the parameter server by default")
+    parser.add_argument("--group", default="arm", help="planning group, used with the parameter server")
+    parser.add_argument("--base-link")
+    parser.add_argument("--tip-link")
+    parser.add_argument("--seed", type=float, nargs="*", help="joint values to start from")
+    parser.add_argument("--output", default="joints.npz")
+    args = parser.parse_args(argv)
+
+    if args.urdf:
+        chain = KinematicChain.from_urdf(args.urdf, args.base_link, args.tip_link)
+    else:
+        chain = KinematicChain.from_parameter_server(args.group)
+    design = Path.load(args.path)
+    start = time.perf_counter()
+    solution, offsets = chain.solve_strokes(design.stroke_arrays(), args.seed)
+    elapsed = time.perf_counter() - start
+    save_solution(args.output, chain, solution, offsets)
+    print("============ Solved %d poses for %r in %.3f s: %d unreachable, %d branch switches" % (
+        len(solution.joints), chain, elapsed, np.count_nonzero(~solution.reachable),
+        np.count_nonzero(solution.branch_switch)))
+    for name, flags in (("unreachable", ~solution.reachable), ("branch switch", solution.branch_switch)):
+        rows = np.flatnonzero(flags)
+        if len(rows):
+            strokes = np.unique(np.searchsorted(offsets, rows, side="right") - 1)
+            print("============ %s at %d rows in strokes %s" % (name, len(rows), strokes.tolist()))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
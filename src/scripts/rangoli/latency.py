@@ -0,0 +1,210 @@
+"""Per-call latency instrumentation for hardware runs.
+
+``InstrumentedClient`` wraps an OwlClient and times every ``move_to_pose``,
+``is_running`` and multi-pose call into a ``LatencyRecorder``, a set of
+preallocated NumPy columns used as a ring buffer, so recording costs two
+``perf_counter`` calls and a few array stores. Calls are tagged with the
+current stroke (``StrokeExecutor`` marks stroke boundaries on clients that
+support it) so the report can split each stroke's wall time into:
+
+* ``send``: non-blocking moves, i.e. command send and controller acceptance
+* ``wait``: blocking moves, dominated by motion completion
+* ``status``: ``is_running`` polls
+* ``sleep``: fixed pauses taken through ``LatencyRecorder.sleep``
+* ``host``: everything else, i.e. our own code between calls
+
+At the end of a run ``report()`` prints p50/p95/p99 per call kind, an
+HDR-style log-linear histogram and the per-stroke breakdown.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Call kinds stored in the ring buffer
+SEND, WAIT, STATUS, BATCH, SLEEP = range(5)
+KIND_NAMES = ("send", "wait", "status", "batch", "sleep")
+
+PERCENTILES = (50.0, 95.0, 99.0)
+
+
+def log_histogram(values, lowest=1e-6, sub_buckets=8):
+    """
+    HDR-style histogram: power-of-two ranges above ``lowest``, each split into
+    ``sub_buckets`` linear buckets, so the relative bucket width is at most
+    1 / sub_buckets across any number of orders of magnitude.
+    @param: values       Latencies in seconds
+    @param: lowest       Smallest distinguishable value; everything below lands in the first bucket
+    @param: sub_buckets  Linear buckets per power of two
+    @returns: (upper_edges, counts) of the non-empty buckets, in increasing order
+    """
+    scaled = np.maximum(np.asarray(values, dtype=float) / lowest, 1.0)
+    exponent = np.floor(np.log2(scaled))
+    sub = np.minimum(np.floor((scaled / 2.0 ** exponent - 1.0) * sub_buckets), sub_buckets - 1)
+    index = (exponent * sub_buckets + sub).astype(np.int64)
+    buckets, counts = np.unique(index, return_counts=True)
+    exponent, sub = np.divmod(buckets, sub_buckets)
+    upper = lowest * 2.0 ** exponent * (1.0 + (sub + 1.0) / sub_buckets)
+    return upper, counts
+
+
+def _covered(start, end):
+    """Total length of the union of the intervals [start, end)."""
+    order = np.argsort(start, kind="stable")
+    start, end = start[order], end[order]
+    reached = np.concatenate(([-np.inf], np.maximum.accumulate(end)[:-1]))
+    return float(np.sum(np.maximum(0.0, end - np.maximum(start, reached))))
+
+
+class LatencyRecorder(object):
+    """Ring buffer of timed calls; the oldest records are overwritten once full."""
+
+    def __init__(self, capacity=1 << 16, clock=time.perf_counter):
+        self.capacity = capacity
+        self.clock = clock
+        self.kind = np.zeros(capacity, dtype=np.uint8)
+        self.stroke = np.zeros(capacity, dtype=np.int32)
+        self.start = np.zeros(capacity)
+        self.end = np.zeros(capacity)
+        self.count = 0
+        self._lock = threading.Lock()
+        self.current_stroke = -1
+        self.stroke_started = OrderedDict()  # stroke index -> start time
+
+    def record(self, kind, start, end):
+        # Locked because status polls may come from another thread (rangoli.async_client)
+        with self._lock:
+            i = self.count % self.capacity
+            self.kind[i] = kind
+            self.stroke[i] = self.current_stroke
+            self.start[i] = start
+            self.end[i] = end
+            self.count += 1
+
+    def begin_stroke(self):
+        """Tag subsequent calls with a new stroke index."""
+        self.current_stroke += 1
+        self.stroke_started[self.current_stroke] = self.clock()
+        return self.current_stroke
+
+    def sleep(self, seconds):
+        """``time.sleep`` that shows up in the report as ``sleep`` instead of ``host`` time."""
+        start = self.clock()
+        time.sleep(seconds)
+        self.record(SLEEP, start, self.clock())
+
+    def records(self):
+        """(kind, stroke, start, end) arrays of the retained records in call order."""
+        n = min(self.count, self.capacity)
+        order = np.arange(self.count - n, self.count) % self.capacity
+        return self.kind[order], self.stroke[order], self.start[order], self.end[order]
+
+    def save(self, path):
+        """Write the retained records to an .npz file for offline analysis."""
+        kind, stroke, start, end = self.records()
+        np.savez(path, kind=kind, stroke=stroke, start=start, end=end,
+                 kind_names=np.array(KIND_NAMES), dropped=self.count - len(kind))
+
+    def percentiles(self):
+        """{kind name: {"calls", "p50", "p95", "p99", "max", "total"}} in seconds."""
+        kind, _, start, end = self.records()
+        duration = end - start
+        stats = OrderedDict()
+        for k, name in enumerate(KIND_NAMES):
+            values = duration[kind == k]
+            if len(values) == 0:
+                continue
+            p = np.percentile(values, PERCENTILES)
+            stats[name] = OrderedDict(
+                [("calls", len(values))]
+                + [("p%d" % q, float(v)) for q, v in zip(PERCENTILES, p)]
+                + [("max", float(values.max())), ("total", float(values.sum()))])
+        return stats
+
+    def stroke_breakdown(self):
+        """
+        Per-stroke time split.
+        @returns: list of dicts with stroke, calls, wall and one total per kind plus host
+        """
+        kind, stroke, start, end = self.records()
+        duration = end - start
+        rows = []
+        for s in np.unique(stroke):
+            mask = stroke == s
+            first = self.stroke_started.get(int(s), start[mask].min())
+            wall = float(end[mask].max() - first)
+            row = OrderedDict([("stroke", int(s)), ("calls", int(np.count_nonzero(mask))), ("wall", wall)])
+            for k, name in enumerate(KIND_NAMES):
+                row[name] = float(duration[mask & (kind == k)].sum())
+            # Calls may overlap (status polled from another thread), so use their union
+            row["host"] = wall - _covered(start[mask], end[mask])
+            rows.append(row)
+        return rows
+
+    def report(self, histogram=True, strokes=True):
+        """Print percentiles, histograms and the per-stroke breakdown."""
+        kind, _, start, end = self.records()
+        dropped = self.count - len(kind)
+        print("============ Latency report: %d calls%s" % (
+            self.count, " (oldest %d dropped)" % dropped if dropped else ""))
+        for name, s in self.percentiles().items():
+            print("%-7s %6d calls  p50 %8.3f ms  p95 %8.3f ms  p99 %8.3f ms  max %8.3f ms  total %8.3f s" % (
+                name, s["calls"], s["p50"] * 1e3, s["p95"] * 1e3, s["p99"] * 1e3, s["max"] * 1e3, s["total"]))
+            if histogram:
+                values = (end - start)[kind == KIND_NAMES.index(name)]
+                upper, counts = log_histogram(values)
+                cumulative = np.cumsum(counts) / float(len(values))
+                for u, c, f in zip(upper, counts, cumulative):
+                    print("    <= %10.3f ms %7d  %7.3f%%" % (u * 1e3, c, f * 100.0))
+        if strokes:
+            names = KIND_NAMES + ("host",)
+            print("stroke  calls    wall s  " + "  ".join("%8s" % n for n in names))
+            for row in self.stroke_breakdown():
+                print("%6d %6d %9.3f  " % (row["stroke"], row["calls"], row["wall"])
+                      + "  ".join("%8.3f" % row[n] for n in names))
+
+
+class InstrumentedClient(object):
+    """Drop-in OwlClient proxy that times every controller call."""
+
+    def __init__(self, client, recorder=None):
+        self._client = client
+        self.recorder = recorder or LatencyRecorder()
+        # Only expose multi-pose calls the wrapped client really has, so
+        # StrokeExecutor's feature detection still sees the truth
+        from rangoli.executor import BATCH_METHODS
+        for name in BATCH_METHODS:
+            method = getattr(client, name, None)
+            if callable(method):
+                setattr(self, name, self._timed_batch(method))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _timed_batch(self, method):
+        def call(*args, **kwargs):
+            clock = self.recorder.clock
+            start = clock()
+            result = method(*args, **kwargs)
+            self.recorder.record(BATCH, start, clock())
+            return result
+        return call
+
+    def begin_stroke(self):
+        return self.recorder.begin_stroke()
+
+    def move_to_pose(self, pose, toolSpeed, wait=True, **kwargs):
+        clock = self.recorder.clock
+        start = clock()
+        result = self._client.move_to_pose(pose, toolSpeed, wait=wait, **kwargs)
+        self.recorder.record(WAIT if wait else SEND, start, clock())
+        return result
+
+    def is_running(self):
+        clock = self.recorder.clock
+        start = clock()
+        result = self._client.is_running()
+        self.recorder.record(STATUS, start, clock())
+        return result
@@ -0,0 +1,201 @@
+"""Lean MoveIt interface with lazily created components and startup timings.
+
+The tutorial class the sim scripts started from eagerly builds a
+RobotCommander, a PlanningSceneInterface and a display publisher, and dumps
+the full robot state on every start. ``MoveGroupInterface`` only brings up
+``moveit_commander``, the ROS node and the ``MoveGroupCommander``; everything
+else is created on first access. Every phase is timed in
+``startup_timings`` so start-to-first-motion latency can be tracked.
+
+With ``record_path`` set, ``record_plan`` appends executed plans to a
+trajectory file (``rangoli.trajectory_file``) for replay on the robot.
+
+``sampled_poses`` records the end-effector pose on a thread while a plan
+executes, and ``report_path_deviation`` checks every sample against the
+commanded path in one ``rangoli.verify.path_deviation`` call.
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import moveit_commander
+import moveit_msgs.msg
+import rospy
+
+
+class MoveGroupInterface(object):
+    """MoveGroupCommander for one planning group plus lazily created helpers."""
+
+    def __init__(self, group_name="arm", node_name="move_group_python_interface_tutorial",
+                 quiet=False, argv=None, record_path=None):
+        """
+        @param: group_name   Planning group to command
+        @param: node_name    Name of the (anonymous) ROS node
+        @param: quiet        Skip printing the planning frame, groups and robot state
+        @param: argv         Arguments for roscpp_initialize, sys.argv by default
+        @param: record_path  Trajectory file that record_plan writes executed plans to
+        """
+        super(MoveGroupInterface, self).__init__()
+        self.quiet = quiet
+        self.startup_timings = OrderedDict()
+        self._robot = None
+        self._scene = None
+        self._display_trajectory_publisher = None
+        self._planning_frame = None
+        self._eef_link = None
+        self._group_names = None
+        self.record_path = record_path
+        self._recorder = None
+
+        with self.timed("roscpp_initialize"):
+            moveit_commander.roscpp_initialize(sys.argv if argv is None else argv)
+        with self.timed("init_node"):
+            rospy.init_node(node_name, anonymous=True)
+        with self.timed("move_group"):
+            self.move_group = moveit_commander.MoveGroupCommander(group_name)
+
+        # Misc variables
+        self.box_name = ""
+
+        if not quiet:
+            self.print_basic_info()
+
+    @contextmanager
+    def timed(self, phase):
+        """Record the wall-clock duration of ``phase`` in ``startup_timings``."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = self.startup_timings.get(phase, 0.0) + time.time() - start
+
+    @property
+    def robot(self):
+        """RobotCommander, created on first use."""
+        if self._robot is None:
+            with self.timed("robot"):
+                self._robot = moveit_commander.RobotCommander()
+        return self._robot
+
+    @property
+    def scene(self):
+        """PlanningSceneInterface, created on first use."""
+        if self._scene is None:
+            with self.timed("scene"):
+                self._scene = moveit_commander.PlanningSceneInterface()
+        return self._scene
+
+    @property
+    def display_trajectory_publisher(self):
+        """
+        DisplayTrajectory publisher for RViz, created on first use. It is
+        latched so the first message is not lost while RViz connects.
+        """
+        if self._display_trajectory_publisher is None:
+            with self.timed("display_publisher"):
+                self._display_trajectory_publisher = rospy.Publisher(
+                    "/move_group/display_planned_path",
+                    moveit_msgs.msg.DisplayTrajectory,
+                    queue_size=20,
+                    latch=True,
+                )
+        return self._display_trajectory_publisher
+
+    @property
+    def planning_frame(self):
+        if self._planning_frame is None:
+            self._planning_frame = self.move_group.get_planning_frame()
+        return self._planning_frame
+
+    @property
+    def eef_link(self):
+        if self._eef_link is None:
+            self._eef_link = self.move_group.get_end_effector_link()
+        return self._eef_link
+
+    @property
+    def group_names(self):
+        if self._group_names is None:
+            self._group_names = self.robot.get_group_names()
+        return self._group_names
+
+    @property
+    def recorder(self):
+        """TrajectoryRecorder for ``record_path``, created on first use."""
+        if self._recorder is None:
+            from rangoli.kinematics import KinematicChain
+            from rangoli.trajectory_file import TrajectoryRecorder
+
+            with self.timed("recorder"):
+                try:
+                    chain = KinematicChain.from_parameter_server(self.move_group.get_name())
+                except (KeyError, ValueError, rospy.ROSException) as e:
+                    rospy.logwarn("No kinematic description (%s), recording joints only" % e)
+                    chain = None
+                self._recorder = TrajectoryRecorder(self.record_path, chain, group=self.move_group.get_name(),
+                                                    frame=self.planning_frame)
+        return self._recorder
+
+    def record_plan(self, plan, fraction=None):
+        """Append an executed plan to ``record_path``, if recording."""
+        if self.record_path is not None:
+            self.recorder.add(plan, fraction)
+            print("============ Recorded plan to %s" % self.record_path)
+
+    @contextmanager
+    def sampled_poses(self, rate=50.0):
+        """Sample the end-effector pose at ``rate`` Hz while the block runs, e.g. during execute()."""
+        samples = []
+        stop = threading.Event()
+
+        def sample():
+            while not stop.is_set():
+                samples.append(self.move_group.get_current_pose().pose)
+                stop.wait(1.0 / rate)
+
+        thread = threading.Thread(target=sample, name="pose-sampler", daemon=True)
+        thread.start()
+        try:
+            yield samples
+        finally:
+            stop.set()
+            thread.join()
+
+    def report_path_deviation(self, path, samples, tolerance=0.001, angle_tolerance=0.01):
+        """
+        Check sampled poses against the commanded path and print the worst deviation.
+        @param: path       Commanded poses, including the start pose the plan begins from
+        @param: samples    Poses sampled during execution (see sampled_poses)
+        @param: tolerance  Position tolerance in metres; angle_tolerance is in radians
+        @returns: rangoli.verify.PoseErrors, or None without samples
+        """
+        from rangoli import verify
+
+        if not samples:
+            return None
+        errors = verify.path_deviation(path, samples, tolerance, angle_tolerance)
+        print("============ Path check: %d samples, max deviation %.2f mm, %.2f deg, %d outside tolerance" % (
+            len(samples), errors.position_error.max() * 1e3, math.degrees(errors.angular_error.max()),
+            len(samples) - int(errors.ok.sum())))
+        return errors
+
+    def print_basic_info(self):
+        """The planning frame, end-effector link, planning groups and full robot state."""
+        robot = self.robot  # timed separately
+        with self.timed("basic_info"):
+            print("============ Planning frame: %s" % self.planning_frame)
+            print("============ End effector link: %s" % self.eef_link)
+            print("============ Available Planning Groups:", self.group_names)
+            print("============ Printing robot state")
+            print(robot.get_current_state())
+            print("")
+
+    def report_timings(self):
+        """Print one line with the duration of every startup phase so far."""
+        phases = ", ".join("%s %.3f s" % item for item in self.startup_timings.items())
+        total = sum(self.startup_timings.values())
+        print("============ Startup timings: %s (total %.3f s)" % (phases, total))
@@ -0,0 +1,247 @@
+"""Plan long Cartesian paths as segments in parallel and stitch the results.
+
+``compute_cartesian_path`` on one long waypoint list is single threaded and
+its cost grows with the path length. ``ParallelCartesianPlanner`` instead:
+
+1. flattens the design's strokes into one waypoint sequence and cuts it into
+   segments, preferring pen-lift (stroke start) and corner boundaries;
+2. predicts the joint state at every cut with the ``/compute_ik`` service,
+   each solution seeded with the previous one so the branch stays consistent;
+3. plans all segments concurrently in a process pool, one MoveIt node per
+   worker process, each segment starting from its predicted joint state;
+4. stitches the trajectories and checks joint continuity at every seam,
+   replanning a segment from the actual end of its predecessor when the
+   prediction was off.
+"""
+
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rangoli import geometry
+from rangoli.simplify import corner_indices
+
+
+def split_segments(strokes, segments, corner_deg=30.0, max_waypoints=None):
+    """
+    Cut the concatenated strokes into about ``segments`` ranges of waypoints.
+    @returns: (waypoints, bounds) where waypoints is the flattened (N, 6) path and
+              bounds is a list of (start, end) index ranges covering it
+    """
+    strokes = [np.asarray(s, dtype=float) for s in strokes]
+    waypoints = np.concatenate(strokes)
+    n = len(waypoints)
+
+    # Preferred cuts: every pen lift and every corner
+    offsets = np.cumsum([0] + [len(s) for s in strokes])
+    preferred = set(offsets[1:-1].tolist())
+    for offset, stroke in zip(offsets, strokes):
+        preferred.update((offset + corner_indices(stroke, corner_deg)).tolist())
+    preferred = np.array(sorted(preferred), dtype=int)
+
+    target = max(1, int(np.ceil(n / float(max(1, segments)))))
+    if max_waypoints is not None:
+        target = min(target, max_waypoints)
+
+    bounds = []
+    start = 0
+    while start < n:
+        end = min(n, start + target)
+        if end < n:
+            # Snap to the nearest preferred cut within half a segment, if any
+            near = preferred[(preferred > start) & (np.abs(preferred - end) <= target // 2)]
+            if len(near):
+                end = int(near[np.argmin(np.abs(near - end))])
+        bounds.append((start, end))
+        start = end
+    return waypoints, bounds
+
+
+# Per-process state of pool workers
+_worker = {}
+
+
+def _init_worker(group_name):
+    import sys
+
+    import moveit_commander
+    import rospy
+
+    moveit_commander.roscpp_initialize(sys.argv[:1])
+    rospy.init_node("rangoli_parallel_planner", anonymous=True, disable_signals=True)
+    _worker["move_group"] = moveit_commander.MoveGroupCommander(group_name)
+
+
+def _robot_state(joint_names, positions):
+    from moveit_msgs.msg import RobotState
+
+    state = RobotState()
+    state.joint_state.name = list(joint_names)
+    state.joint_state.position = [float(q) for q in positions]
+    return state
+
+
+def _plan_segment(rows, joint_names, start_positions, eef_step):
+    """Pool task: plan one segment from a given start state, returning serialised bytes."""
+    move_group = _worker["move_group"]
+    move_group.set_start_state(_robot_state(joint_names, start_positions))
+    plan, fraction = move_group.compute_cartesian_path(geometry.to_ros_poses(rows), eef_step)
+    return _serialize(plan), fraction
+
+
+def _serialize(plan):
+    buff = io.BytesIO()
+    plan.serialize(buff)
+    return buff.getvalue()
+
+
+def _deserialize(data):
+    from moveit_msgs.msg import RobotTrajectory
+
+    return RobotTrajectory().deserialize(data)
+
+
+def _positions(plan, index):
+    return np.array(plan.joint_trajectory.points[index].positions, dtype=float)
+
+
+class ParallelCartesianPlanner(object):
+    """Segment-parallel replacement for ``move_group.compute_cartesian_path``."""
+
+    def __init__(self, move_group, workers=None, eef_step=0.01, seam_tolerance=0.05,
+                 corner_deg=30.0, seed_fn=None):
+        """
+        @param: move_group      The caller's MoveGroupCommander, used for IK seeds and stitching
+        @param: workers         Pool size, os.cpu_count() by default
+        @param: seam_tolerance  Largest joint jump (rad) accepted where two segments meet
+        @param: seed_fn         Optional f(pose_row, seed_positions) -> positions or None,
+                                replacing the /compute_ik service for seam prediction
+        """
+        self.move_group = move_group
+        self.workers = workers or os.cpu_count() or 1
+        self.eef_step = eef_step
+        self.seam_tolerance = seam_tolerance
+        self.corner_deg = corner_deg
+        self.seed_fn = seed_fn or self._compute_ik
+        self.joint_names = list(move_group.get_active_joints())
+        self.replanned_seams = 0
+        self._ik = None
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # Worker processes are spawned rather than forked, since the parent
+            # already runs rospy threads
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.move_group.get_name(),),
+            )
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _compute_ik(self, row, seed):
+        import rospy
+        from geometry_msgs.msg import PoseStamped
+        from moveit_msgs.msg import MoveItErrorCodes
+        from moveit_msgs.srv import GetPositionIK, GetPositionIKRequest
+
+        if self._ik is None:
+            rospy.wait_for_service("/compute_ik")
+            self._ik = rospy.ServiceProxy("/compute_ik", GetPositionIK)
+
+        request = GetPositionIKRequest()
+        request.ik_request.group_name = self.move_group.get_name()
+        request.ik_request.robot_state = _robot_state(self.joint_names, seed)
+        request.ik_request.avoid_collisions = True
+        request.ik_request.timeout = rospy.Duration(0.05)
+        target = PoseStamped()
+        target.header.frame_id = self.move_group.get_planning_frame()
+        target.pose = geometry.to_ros_poses(np.asarray(row).reshape(1, 6))[0]
+        request.ik_request.pose_stamped = target
+
+        response = self._ik(request)
+        if response.error_code.val != MoveItErrorCodes.SUCCESS:
+            return None
+        solution = dict(zip(response.solution.joint_state.name, response.solution.joint_state.position))
+        return np.array([solution[name] for name in self.joint_names])
+
+    def predict_seeds(self, waypoints, bounds, start_positions):
+        """Predicted joint state at the start of every segment."""
+        seeds = [np.asarray(start_positions, dtype=float)]
+        for start, _ in bounds[1:]:
+            seed = self.seed_fn(waypoints[start - 1], seeds[-1])
+            # Fall back to the previous seed; the seam check will catch a bad guess
+            seeds.append(seeds[-1] if seed is None else np.asarray(seed, dtype=float))
+        return seeds
+
+    def plan(self, strokes, start_positions=None, retime=True):
+        """
+        Plan the strokes (drawn in order, straight moves between them).
+        @returns: (plan, fraction) like compute_cartesian_path
+        """
+        if start_positions is None:
+            start_positions = self.move_group.get_current_joint_values()
+        waypoints, bounds = split_segments(strokes, self.workers, self.corner_deg)
+        seeds = self.predict_seeds(waypoints, bounds, start_positions)
+
+        futures = [self.pool.submit(_plan_segment, waypoints[a:b], self.joint_names, seed, self.eef_step)
+                   for (a, b), seed in zip(bounds, seeds)]
+
+        plans = []
+        done = 0
+        for k, ((a, b), future) in enumerate(zip(bounds, futures)):
+            data, fraction = future.result()
+            plan = _deserialize(data)
+            if k > 0 and len(plan.joint_trajectory.points):
+                jump = np.max(np.abs(_positions(plan, 0) - _positions(plans[-1], -1)))
+                if jump > self.seam_tolerance:
+                    # The predicted start was off: replan from where the previous segment really ends
+                    self.replanned_seams += 1
+                    data, fraction = self.pool.submit(_plan_segment, waypoints[a:b], self.joint_names,
+                                                      _positions(plans[-1], -1), self.eef_step).result()
+                    plan = _deserialize(data)
+            plans.append(plan)
+            done += fraction * (b - a)
+            if fraction < 1.0:
+                break
+
+        stitched = self.stitch(plans)
+        if retime and len(stitched.joint_trajectory.points) > 1:
+            robot = _robot_state(self.joint_names, start_positions)
+            stitched = self.move_group.retime_trajectory(robot, stitched)
+        return stitched, done / float(len(waypoints))
+
+    @staticmethod
+    def stitch(plans):
+        """Concatenate segment plans, dropping each repeated seam point and shifting times."""
+        stitched = _deserialize(_serialize(plans[0]))
+        points = stitched.joint_trajectory.points
+        for plan in plans[1:]:
+            offset = points[-1].time_from_start if points else None
+            for point in plan.joint_trajectory.points[1:]:
+                if offset is not None:
+                    point.time_from_start = point.time_from_start + offset
+                points.append(point)
+        return stitched
+
+
+def plan_cartesian_path_parallel(move_group, strokes, workers=None, eef_step=0.01):
+    """One-shot helper: plan ``strokes`` with a temporary pool and return (plan, fraction)."""
+    with ParallelCartesianPlanner(move_group, workers, eef_step) as planner:
+        return planner.plan(strokes)
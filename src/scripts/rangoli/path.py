@@ -0,0 +1,236 @@
+"""Compact array-backed strokes and paths, and a compiler for shape primitives.
+
+A ``Path`` keeps every waypoint of a design in one contiguous ``(N, 6)``
+float64 or float32 array (columns as in ``rangoli.geometry``), with stroke
+boundaries in an ``offsets`` array and per-stroke metadata (pen state, tool
+speed, tool) in small parallel arrays. A 100k-point design therefore costs
+about 4.8 MB as float64 or 2.4 MB as float32, instead of one Python object
+per pose and coordinate.
+
+Indexing a ``Path`` gives a ``Stroke``, whose ``points`` are a view into the
+path's buffer. Slicing either of them is zero-copy, and the transforms
+(``translate``, ``rotate``, ``scale``) work in place on the whole buffer.
+``Stroke`` implements ``__array__``, so it can be passed anywhere an
+``(N, 6)`` stroke array is accepted.
+
+``compile_pattern`` turns a list of primitives, written as the same dicts
+the drawing daemon accepts, into a ``Path``::
+
+    path = compile_pattern([
+        {"shape": "circle", "radius": 0.05},
+        {"shape": "rotated_square", "side_length": 0.06, "angle_deg": 45},
+        {"shape": "triangle", "circumradius": 0.04, "speed": 20},
+    ], dtype=np.float32)
+"""
+
+import numpy as np
+
+from rangoli import geometry, simplify
+
+# Workspace conventions shared with the hardware scripts
+DEFAULT_CENTER = (0.623, 0.0589, 0.42)
+
+
+class Stroke(object):
+    """One continuous stroke: an (N, 6) array view plus pen, speed and tool metadata."""
+
+    __slots__ = ("points", "pen", "speed", "tool")
+
+    def __init__(self, points, pen=True, speed=None, tool=0):
+        """
+        @param: points  (N, 6) array; kept as given, not copied
+        @param: pen     True for drawing, False for a pen-up travel move
+        @param: speed   Tool speed for this stroke, None for the executor's default
+        @param: tool    Tool index
+        """
+        self.points = points
+        self.pen = pen
+        self.speed = speed
+        self.tool = tool
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Stroke(self.points[index], self.pen, self.speed, self.tool)
+        return self.points[index]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or np.dtype(dtype) == self.points.dtype:
+            return self.points.copy() if copy else self.points
+        return self.points.astype(dtype)
+
+    def __repr__(self):
+        return "Stroke(%d points, pen=%s, speed=%s, tool=%d)" % (len(self), self.pen, self.speed, self.tool)
+
+    @property
+    def start(self):
+        return self.points[0]
+
+    @property
+    def end(self):
+        return self.points[-1]
+
+    def length(self):
+        """Path length in metres."""
+        return float(np.sum(np.linalg.norm(np.diff(self.points[:, geometry.X:geometry.RX], axis=0), axis=1)))
+
+
+class Path(object):
+    """A sequence of strokes stored in one contiguous waypoint buffer."""
+
+    __slots__ = ("data", "offsets", "pen", "speed", "tool")
+
+    def __init__(self, data, offsets, pen=None, speed=None, tool=None):
+        """
+        @param: data     (N, 6) waypoint buffer
+        @param: offsets  (M + 1,) stroke boundaries into data, starting at 0 and ending at N
+        @param: pen      (M,) bool, default all down
+        @param: speed    (M,) float, NaN for the executor's default speed
+        @param: tool     (M,) int
+        """
+        self.data = data
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        m = len(self.offsets) - 1
+        self.pen = np.ones(m, dtype=bool) if pen is None else np.asarray(pen, dtype=bool)
+        self.speed = np.full(m, np.nan) if speed is None else np.asarray(speed, dtype=float)
+        self.tool = np.zeros(m, dtype=np.int16) if tool is None else np.asarray(tool, dtype=np.int16)
+
+    @classmethod
+    def from_strokes(cls, strokes, dtype=np.float64):
+        """
+        Pack strokes (arrays or ``Stroke`` objects) into a single buffer.
+        Metadata is taken from ``Stroke`` objects; plain arrays are pen-down at default speed.
+        """
+        strokes = list(strokes)
+        lengths = [len(s) for s in strokes]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        data = np.empty((offsets[-1], 6), dtype=dtype)
+        for s, a, b in zip(strokes, offsets[:-1], offsets[1:]):
+            data[a:b] = np.asarray(s)
+        return cls(data, offsets,
+                   pen=[getattr(s, "pen", True) for s in strokes],
+                   speed=[np.nan if getattr(s, "speed", None) is None else s.speed for s in strokes],
+                   tool=[getattr(s, "tool", 0) for s in strokes])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("Path slices must be contiguous")
+            stop = max(start, stop)
+            a, b = self.offsets[start], self.offsets[stop]
+            return Path(self.data[a:b], self.offsets[start:stop + 1] - a,
+                        self.pen[start:stop], self.speed[start:stop], self.tool[start:stop])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("stroke index out of range")
+        speed = self.speed[index]
+        return Stroke(self.data[self.offsets[index]:self.offsets[index + 1]], bool(self.pen[index]),
+                      None if np.isnan(speed) else float(speed), int(self.tool[index]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "Path(%d strokes, %d points, %s)" % (len(self), self.n_points, self.data.dtype)
+
+    @property
+    def n_points(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes + self.pen.nbytes + self.speed.nbytes + self.tool.nbytes
+
+    def stroke_arrays(self):
+        """The strokes as plain (N, 6) array views, for functions that take lists of arrays."""
+        return [self.data[a:b] for a, b in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def astype(self, dtype):
+        """Copy of the path with the waypoint buffer converted, e.g. to float32."""
+        return Path(self.data.astype(dtype), self.offsets.copy(), self.pen.copy(), self.speed.copy(),
+                    self.tool.copy())
+
+    def translate(self, dx=0.0, dy=0.0, dz=0.0):
+        """Shift every waypoint in place. @returns: self"""
+        self.data[:, geometry.X:geometry.RX] += np.asarray((dx, dy, dz), dtype=self.data.dtype)
+        return self
+
+    def rotate(self, angle_deg, center=(DEFAULT_CENTER[0], DEFAULT_CENTER[1])):
+        """Rotate every waypoint (and its yaw) about a vertical axis through ``center``, in place. @returns: self"""
+        angle = np.radians(angle_deg)
+        self.data[:, geometry.X:geometry.Z] = geometry.rotate_xy(self.data[:, geometry.X:geometry.Z], angle, center)
+        self.data[:, geometry.RZ] += angle
+        return self
+
+    def scale(self, factor, center=(DEFAULT_CENTER[0], DEFAULT_CENTER[1])):
+        """Scale x and y about ``center`` in place. @returns: self"""
+        xy = self.data[:, geometry.X:geometry.Z]
+        xy -= center
+        xy *= factor
+        xy += center
+        return self
+
+    def bounds(self):
+        """(min_xyz, max_xyz) over all waypoints."""
+        xyz = self.data[:, geometry.X:geometry.RX]
+        return xyz.min(axis=0), xyz.max(axis=0)
+
+    def save(self, path):
+        np.savez(path, data=self.data, offsets=self.offsets, pen=self.pen, speed=self.speed, tool=self.tool)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["data"], f["offsets"], f["pen"], f["speed"], f["tool"])
+
+
+def primitive_stroke(spec):
+    """
+    Build the stroke array for one shape primitive.
+    Shapes: circle (radius, tolerance_mm or steps), square (side_length),
+    rotated_square (side_length, angle_deg), triangle and polygon
+    (circumradius, angle_deg; polygon also sides) and polyline (points, closed).
+    All take center_x/center_y/center_z, defaulting to the hardware workspace center.
+    """
+    cx = spec.get("center_x", DEFAULT_CENTER[0])
+    cy = spec.get("center_y", DEFAULT_CENTER[1])
+    cz = spec.get("center_z", DEFAULT_CENTER[2])
+    shape = spec.get("shape")
+    if shape == "circle":
+        if "steps" in spec:
+            return geometry.circle_stroke(cx, cy, cz, spec["radius"], spec["steps"])
+        return simplify.adaptive_circle_stroke(cx, cy, cz, spec["radius"], spec.get("tolerance_mm", 0.1))
+    if shape == "square":
+        return geometry.square_stroke(cx, cy, cz, spec["side_length"])
+    if shape == "rotated_square":
+        return geometry.rotated_square_stroke(cx, cy, cz, spec["side_length"], spec.get("angle_deg", 0.0))
+    if shape == "triangle":
+        return geometry.polygon_stroke(cx, cy, cz, spec["circumradius"], 3, spec.get("angle_deg", 90.0))
+    if shape == "polygon":
+        return geometry.polygon_stroke(cx, cy, cz, spec["circumradius"], spec["sides"], spec.get("angle_deg", 0.0))
+    if shape == "polyline":
+        return geometry.polyline_stroke(spec["points"], cz, closed=spec.get("closed", False))
+    raise ValueError("Unknown primitive: %r" % (spec,))
+
+
+def compile_pattern(primitives, dtype=np.float64):
+    """
+    Compile shape primitives into a ``Path``, one stroke per primitive.
+    Besides the shape parameters (see ``primitive_stroke``) every primitive
+    may set ``pen``, ``speed`` and ``tool``.
+    """
+    primitives = list(primitives)
+    path = Path.from_strokes((primitive_stroke(p) for p in primitives), dtype=dtype)
+    for i, p in enumerate(primitives):
+        path.pen[i] = p.get("pen", True)
+        path.speed[i] = p.get("speed", np.nan)
+        path.tool[i] = p.get("tool", 0)
+    return path
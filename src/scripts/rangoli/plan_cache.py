@@ -0,0 +1,215 @@
+"""Persistent on-disk cache for ``MoveGroupCommander.compute_cartesian_path``.
+
+Plans are keyed on a hash of the quantized waypoints (0.1 mm, 1e-3 for
+quaternion components), the eef_step, the planning group and the starting
+joint state (1e-3 rad). The steps are well above Gazebo and controller
+noise, so rerunning an unchanged design from the same start pose skips the
+planner entirely. Each entry is a
+single file holding the plan fraction followed by the serialised
+``moveit_msgs/RobotTrajectory``. The cache directory is bounded in size;
+the least recently used entries are evicted first.
+"""
+
+import hashlib
+import io
+import os
+import struct
+
+import numpy as np
+
+from rangoli import geometry
+
+_HEADER = struct.Struct("<d")  # fraction
+_SUFFIX = ".plan"
+
+
+def default_cache_dir():
+    """``$ROS_HOME/my_owl_codes/plan_cache``, ``~/.ros`` if ROS_HOME is unset."""
+    ros_home = os.environ.get("ROS_HOME", os.path.join(os.path.expanduser("~"), ".ros"))
+    return os.path.join(ros_home, "my_owl_codes", "plan_cache")
+
+
+def plan_key(waypoints, eef_step, group_name, joint_names, joint_values, position_tolerance=1e-4,
+             angle_tolerance=1e-3, extra=()):
+    """
+    Cache key for one planning request. Waypoints and joint values are quantized well above
+    simulator and controller noise, so rerunning a design whose waypoints come from
+    ``get_current_pose()`` still finds the plan of the previous run.
+    @param: waypoints           List of Pose messages or an (N, 7) array
+    @param: position_tolerance  Quantization step of waypoint positions, in metres (0.1 mm)
+    @param: angle_tolerance     Quantization step of joint values (rad) and quaternion components
+    @param: extra               Any other planner arguments that affect the result
+    """
+    if not isinstance(waypoints, np.ndarray):
+        waypoints = geometry.ros_poses_to_array(waypoints)
+    waypoints = np.asarray(waypoints, dtype=float)
+    digest = hashlib.sha1()
+    # Integer bins, so -0.0 and 0.0 hash alike
+    digest.update(np.round(waypoints[:, :3] / position_tolerance).astype(np.int64).tobytes())
+    digest.update(np.round(waypoints[:, 3:] / angle_tolerance).astype(np.int64).tobytes())
+    digest.update(np.round(np.asarray(joint_values, dtype=float) / angle_tolerance).astype(np.int64).tobytes()
+                  + b"\0")
+    digest.update(repr((float(eef_step), str(group_name), tuple(joint_names), tuple(extra))).encode())
+    return digest.hexdigest()
+
+
+class PlanCache(object):
+    """Size-bounded LRU store of (RobotTrajectory, fraction) pairs."""
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024, position_tolerance=1e-4,
+                 angle_tolerance=1e-3):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.position_tolerance = position_tolerance
+        self.angle_tolerance = angle_tolerance
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key):
+        """Return (plan, fraction) or None, refreshing the entry's LRU position on a hit."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+
+        from moveit_msgs.msg import RobotTrajectory
+
+        try:
+            (fraction,) = _HEADER.unpack_from(data)
+            plan = RobotTrajectory().deserialize(data[_HEADER.size:])
+        except Exception:
+            # Truncated or written by an incompatible message version
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        os.utime(path, None)
+        self.hits += 1
+        return plan, fraction
+
+    def put(self, key, plan, fraction):
+        buff = io.BytesIO()
+        buff.write(_HEADER.pack(fraction))
+        plan.serialize(buff)
+
+        # Write under a temporary name and rename, so readers never see half a file
+        path = self._path(key)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(buff.getvalue())
+        os.replace(tmp, path)
+        self.stores += 1
+        self.evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        """Total bytes currently held on disk."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in ``max_bytes``."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / float(lookups) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": len(self._entries()),
+            "bytes": self.size(),
+        }
+
+    def report(self):
+        """Print one line with the hit/miss counts of this run and the size of the cache."""
+        stats = self.stats()
+        print("============ Plan cache: %d hits, %d misses (%.0f%% hit rate), %d entries, %.1f MB" % (
+            stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["entries"], stats["bytes"] / 1e6))
+
+    def compute_cartesian_path(self, move_group, waypoints, eef_step, start_positions=None, **kwargs):
+        """
+        Drop-in for ``move_group.compute_cartesian_path(waypoints, eef_step)``
+        that consults the cache first. Extra keyword arguments are passed
+        through to the planner and also become part of the key.
+        @param: start_positions  Plan from these joint values (of the active joints) instead of
+                                 the current state
+        """
+        joint_names = move_group.get_active_joints()
+        if start_positions is None:
+            joint_values = move_group.get_current_joint_values()
+        else:
+            joint_values = start_positions
+        key = plan_key(waypoints, eef_step, move_group.get_name(), joint_names, joint_values,
+                       self.position_tolerance, self.angle_tolerance, sorted(kwargs.items()))
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        if start_positions is None:
+            plan, fraction = move_group.compute_cartesian_path(waypoints, eef_step, **kwargs)
+        else:
+            from rangoli.parallel_plan import _robot_state
+
+            move_group.set_start_state(_robot_state(joint_names, start_positions))
+            try:
+                plan, fraction = move_group.compute_cartesian_path(waypoints, eef_step, **kwargs)
+            finally:
+                move_group.set_start_state_to_current_state()
+        self.put(key, plan, fraction)
+        return plan, fraction
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide cache in ``default_cache_dir()``, created on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PlanCache()
+    return _default_cache
+
+
+def cached_compute_cartesian_path(move_group, waypoints, eef_step, cache=None, **kwargs):
+    """``PlanCache.compute_cartesian_path`` on ``cache`` or the default cache."""
+    return (cache or default_cache()).compute_cartesian_path(move_group, waypoints, eef_step, **kwargs)
@@ -0,0 +1,339 @@
+"""Offline reachability index of the arm's workspace for instant design preflight.
+
+Unreachable or near-singular points used to show up only as a
+``compute_cartesian_path`` fraction below 1.0, or as a fault half-way
+through a design on the robot. ``build_index`` instead samples a box of the
+workspace once, on a regular grid, at the drawing orientation (roll = pi,
+pitch = 0) and a set of yaw angles, with batched ``rangoli.kinematics``
+calls:
+
+1. all cell centers are solved as one path, in serpentine order, with a
+   small iteration budget;
+2. a flood fill then re-solves every cell that was missed, seeded from a
+   neighbour reached in the previous round, until no new cell is reached;
+3. the remaining cells get a few tries from random seeds, which finds
+   reachable islands the flood could not get to.
+
+Every reachable cell stores its Yoshikawa manipulability
+``sqrt(det(J J^T))``. Unreachable cells store -1.
+
+The index file has the same layout as ``rangoli.trajectory_file``::
+
+    8 bytes   magic b"RGREACH1"
+    4 bytes   little-endian uint32 length of the JSON header
+    header    JSON: origin, resolution, shape, yaws, roll, pitch, max_score, chain
+    padding   to a multiple of 64 bytes
+    data      yaws x nx x ny x nz little-endian float32 scores, C order
+
+``ReachabilityIndex`` memory-maps it. ``preflight`` samples every stroke
+segment at half the grid resolution and looks all samples up at once. A
+sample takes the lowest score of the 8 cells around it, at the nearest yaw,
+so it only passes if its whole neighbourhood is reachable. A design of
+thousands of waypoints is checked in milliseconds, and the strokes that
+leave the reachable workspace or come close to a singularity are returned
+by index.
+
+Poses are taken in the chain's base frame, as by ``KinematicChain.solve``.
+
+From ``src/scripts``::
+
+    python3 -m rangoli.reachability build --urdf owl.urdf --output owl.reach
+    python3 -m rangoli.reachability check design.npz --index owl.reach
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry
+
+MAGIC = b"RGREACH1"
+ALIGN = 64
+UNREACHABLE = -1.0
+
+Preflight = namedtuple("Preflight", ["ok", "bad_strokes", "unreachable", "singular", "min_scores", "samples"])
+Preflight.__doc__ = """Outcome of checking a design: bad_strokes is the sorted union of the indices of
+strokes with unreachable samples and of strokes with near-singular ones; min_scores holds
+each stroke's lowest score (-1 where unreachable)."""
+
+
+def manipulability(jac):
+    """Yoshikawa manipulability sqrt(det(J J^T)) of (N, 6, J) Jacobians."""
+    return np.sqrt(np.abs(np.linalg.det(jac @ jac.transpose(0, 2, 1))))
+
+
+def _grid_axes(bounds, resolution):
+    bounds = np.asarray(bounds, dtype=float).reshape(3, 2)
+    return [np.arange(lo, hi + 0.5 * resolution, resolution) for lo, hi in bounds]
+
+
+def _serpentine(shape):
+    """Flat C-order cell indices in an order where consecutive cells are neighbours."""
+    ix, iy, iz = (a.ravel() for a in np.indices(shape))
+    iy = np.where(ix % 2 == 1, shape[1] - 1 - iy, iy)
+    iz = np.where((ix * shape[1] + iy) % 2 == 1, shape[2] - 1 - iz, iz)
+    return np.ravel_multi_index((ix, iy, iz), shape)
+
+
+def _flood(chain, poses, joints, reachable, shape, max_iterations):
+    """Re-solve unreached cells from newly reached neighbours until none is added."""
+    grid = reachable.reshape(shape)
+    fresh = grid.copy()
+    flat_joints = joints.reshape(-1, len(chain))
+    while fresh.any():
+        seeds = np.full(shape, -1, dtype=np.int64)
+        flat = np.arange(grid.size).reshape(shape)
+        for axis in range(3):
+            for shift in (1, -1):
+                neighbour = np.roll(fresh, shift, axis)
+                source = np.roll(flat, shift, axis)
+                # np.roll wraps around; the wrapped slice has no real neighbour
+                edge = [slice(None)] * 3
+                edge[axis] = 0 if shift == 1 else -1
+                neighbour[tuple(edge)] = False
+                pick = neighbour & ~grid & (seeds < 0)
+                seeds[pick] = source[pick]
+        targets = np.flatnonzero(seeds >= 0)
+        fresh = np.zeros(shape, dtype=bool)
+        if not len(targets):
+            break
+        solution = chain.solve(poses[targets], flat_joints[seeds.ravel()[targets]], max_iterations=max_iterations)
+        solved = targets[solution.reachable]
+        flat_joints[solved] = solution.joints[solution.reachable]
+        grid.reshape(-1)[solved] = True
+        fresh.reshape(-1)[solved] = True
+    return flat_joints, grid.reshape(-1)
+
+
+def build_index(chain, bounds, resolution=0.01, yaws=(0.0,), roll=geometry.DRAW_ROLL, pitch=0.0,
+                restarts=2, max_iterations=30, seed=None, random_state=0, log=print):
+    """
+    Solve every cell center of a workspace grid.
+    @param: chain       rangoli.kinematics.KinematicChain of the arm
+    @param: bounds      (xmin, xmax, ymin, ymax, zmin, zmax) in metres, in the chain's base frame
+    @param: resolution  Cell size in metres
+    @param: yaws        Tool yaw angles to index, in radians
+    @param: restarts        Random-seed retries for the cells the flood fill did not reach
+    @param: max_iterations  Solver iterations per attempt; a cell seeded from a neighbour needs a few
+    @returns: (scores (len(yaws), nx, ny, nz) float32, header dict)
+    """
+    axes = _grid_axes(bounds, resolution)
+    shape = tuple(len(a) for a in axes)
+    centers = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+    order = _serpentine(shape)
+    rng = np.random.RandomState(random_state)
+    lower = np.where(np.isfinite(chain.lower), chain.lower, -np.pi)
+    upper = np.where(np.isfinite(chain.upper), chain.upper, np.pi)
+
+    scores = np.full((len(yaws),) + shape, UNREACHABLE, dtype=np.float32)
+    for k, yaw in enumerate(yaws):
+        start = time.perf_counter()
+        poses = np.empty((len(centers), 6))
+        poses[:, geometry.X:geometry.RX] = centers
+        poses[:, geometry.RX:] = (roll, pitch, yaw)
+        joints = np.zeros((len(centers), len(chain)))
+        # Grid cells are not a path, and the flood fill below reseeds cells from their neighbours
+        solution = chain.solve(poses[order], seed, max_iterations=max_iterations, seed_spacing=None)
+        joints[order] = solution.joints
+        reachable = np.zeros(len(centers), dtype=bool)
+        reachable[order] = solution.reachable
+        joints, reachable = _flood(chain, poses, joints, reachable, shape, max_iterations)
+        for _ in range(restarts):
+            missing = np.flatnonzero(~reachable)
+            if not len(missing):
+                break
+            retry = chain.solve(poses[missing], rng.uniform(lower, upper, (len(missing), len(chain))),
+                                max_iterations=3 * max_iterations)
+            if not retry.reachable.any():
+                continue
+            joints[missing[retry.reachable]] = retry.joints[retry.reachable]
+            reachable[missing[retry.reachable]] = True
+            joints, reachable = _flood(chain, poses, joints, reachable, shape, max_iterations)
+        _, jac = chain.jacobian(joints[reachable])
+        scores[k].reshape(-1)[reachable] = manipulability(jac)
+        log("============ Yaw %.1f deg: %d of %d cells reachable (%.1f s)" % (
+            np.degrees(yaw), np.count_nonzero(reachable), len(order), time.perf_counter() - start))
+
+    header = dict(origin=[float(a[0]) for a in axes], resolution=float(resolution), shape=list(shape),
+                  yaws=[float(y) for y in yaws], roll=float(roll), pitch=float(pitch),
+                  max_score=float(scores.max()), chain=repr(chain),
+                  joint_names=list(chain.joint_names))
+    return scores, header
+
+
+def write_index(path, scores, header):
+    """Write an index file atomically."""
+    header = dict(header, version=1, dtype="<f4")
+    text = json.dumps(header).encode("utf-8")
+    prefix = len(MAGIC) + 4
+    text += b" " * (-(prefix + len(text)) % ALIGN)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(text)) + text)
+        f.write(np.ascontiguousarray(scores, dtype="<f4").tobytes())
+    os.replace(tmp, path)
+
+
+def _stroke_samples(strokes, step):
+    """
+    Every waypoint plus interior samples of every segment, at most ``step`` apart.
+    @returns: (positions (K, 3), yaws (K,), stroke index of each sample (K,))
+    """
+    rows = [np.asarray(s, dtype=float).reshape(-1, 6) for s in strokes]
+    ids = np.repeat(np.arange(len(rows)), [len(r) for r in rows])
+    rows = np.concatenate(rows) if rows else np.zeros((0, 6))
+    positions = rows[:, geometry.X:geometry.RX]
+    yaw = rows[:, geometry.RZ]
+    if len(rows) < 2:
+        return positions, yaw, ids
+
+    a = np.flatnonzero(ids[1:] == ids[:-1])
+    lengths = np.linalg.norm(positions[a + 1] - positions[a], axis=1)
+    counts = np.maximum(1, np.ceil(lengths / step).astype(int)) - 1
+    seg = np.repeat(a, counts)
+    # j / (count + 1) for j = 1..count within every segment
+    j = np.arange(len(seg)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    t = (j / np.repeat(counts + 1, counts))[:, None]
+    turn = (yaw[seg + 1] - yaw[seg] + np.pi) % (2.0 * np.pi) - np.pi
+    return (np.concatenate((positions, positions[seg] + t * (positions[seg + 1] - positions[seg]))),
+            np.concatenate((yaw, yaw[seg] + t[:, 0] * turn)),
+            np.concatenate((ids, ids[seg])))
+
+
+class ReachabilityIndex(object):
+    """Read-only, memory-mapped reachability index."""
+
+    def __init__(self, path, mmap=True):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a reachability index" % path)
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length).decode("utf-8"))
+        offset = len(MAGIC) + 4 + length
+        self.yaws = np.asarray(self.header["yaws"], dtype=float)
+        shape = (len(self.yaws),) + tuple(self.header["shape"])
+        if mmap:
+            self.scores = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                self.scores = np.frombuffer(f.read(), dtype="<f4").reshape(shape)
+        self.path = path
+        self.origin = np.asarray(self.header["origin"], dtype=float)
+        self.resolution = float(self.header["resolution"])
+        self.shape = np.asarray(self.header["shape"])
+
+    def __repr__(self):
+        return "ReachabilityIndex(%r, %s cells at %g m, %d yaws)" % (
+            self.path, "x".join(str(n) for n in self.shape), self.resolution, len(self.yaws))
+
+    def lookup(self, positions, yaws=None):
+        """
+        Score of each position: the lowest score of the 8 cells around it at the
+        nearest indexed yaw, or -1 outside the indexed box.
+        @param: positions  (K, 3) positions
+        @param: yaws       (K,) tool yaws; the first indexed yaw when None
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        if yaws is None or len(self.yaws) == 1:
+            layer = np.zeros(len(positions), dtype=int)
+        else:
+            delta = (np.asarray(yaws, dtype=float)[:, None] - self.yaws[None, :] + np.pi) % (2.0 * np.pi) - np.pi
+            layer = np.argmin(np.abs(delta), axis=1)
+
+        cell = (positions - self.origin) / self.resolution
+        inside = np.all((cell >= -0.5) & (cell <= self.shape - 0.5), axis=1)
+        low = np.clip(np.floor(cell).astype(int), 0, self.shape - 1)
+        high = np.minimum(low + 1, self.shape - 1)
+        scores = np.full(len(positions), np.inf, dtype=np.float32)
+        for corner in range(8):
+            pick = [(high if corner >> axis & 1 else low)[:, axis] for axis in range(3)]
+            scores = np.minimum(scores, self.scores[layer, pick[0], pick[1], pick[2]])
+        scores[~inside] = UNREACHABLE
+        return scores
+
+    def preflight(self, strokes, min_score=None, singular_fraction=0.05, step=None):
+        """
+        Check a whole design before planning it.
+        @param: strokes            Stroke arrays (or rangoli.path.Stroke objects) in drawing order
+        @param: min_score          Manipulability below which a sample counts as near-singular;
+                                   ``singular_fraction`` of the best indexed score by default
+        @param: step               Largest spacing of the samples along segments, half a cell by default
+        @returns: Preflight
+        """
+        if min_score is None:
+            min_score = singular_fraction * self.header["max_score"]
+        positions, yaws, ids = _stroke_samples(strokes, step or 0.5 * self.resolution)
+        scores = self.lookup(positions, yaws)
+        count = len(strokes)
+        unreachable = np.unique(ids[scores < 0]).tolist()
+        singular = np.unique(ids[(scores >= 0) & (scores < min_score)]).tolist()
+        min_scores = np.full(count, np.inf)
+        np.minimum.at(min_scores, ids, scores)
+        bad = sorted(set(unreachable) | set(singular))
+        return Preflight(not bad, bad, unreachable, singular, min_scores, len(scores))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a workspace reachability index")
+    sub = parser.add_subparsers(dest="command")
+
+    build_parser = sub.add_parser("build", help="solve a workspace grid and write the index")
+    build_parser.add_argument("--urdf", help="URDF file; read from the parameter server by default")
+    build_parser.add_argument("--group", default="arm", help="planning group, used with the parameter server")
+    build_parser.add_argument("--base-link")
+    build_parser.add_argument("--tip-link")
+    build_parser.add_argument("--bounds", type=float, nargs=6, default=(0.3, 0.95, -0.35, 0.45, 0.3, 0.5),
+                              metavar=("XMIN", "XMAX", "YMIN", "YMAX", "ZMIN", "ZMAX"))
+    build_parser.add_argument("--resolution", type=float, default=0.01, help="cell size in metres")
+    build_parser.add_argument("--yaw-steps", type=int, default=8, help="yaws indexed, evenly over a turn")
+    build_parser.add_argument("--output", default="workspace.reach")
+
+    check_parser = sub.add_parser("check", help="preflight a saved Path against an index")
+    check_parser.add_argument("path", help="Path .npz file, as written by Path.save")
+    check_parser.add_argument("--index", default="workspace.reach")
+    check_parser.add_argument("--min-score", type=float, help="manipulability below which points are near-singular")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        from rangoli.kinematics import KinematicChain
+
+        if args.urdf:
+            chain = KinematicChain.from_urdf(args.urdf, args.base_link, args.tip_link)
+        else:
+            chain = KinematicChain.from_parameter_server(args.group)
+        yaws = 2.0 * np.pi * np.arange(args.yaw_steps) / args.yaw_steps
+        scores, header = build_index(chain, args.bounds, args.resolution, yaws)
+        write_index(args.output, scores, header)
+        print("============ Wrote %s" % ReachabilityIndex(args.output))
+    elif args.command == "check":
+        from rangoli.path import Path
+
+        index = ReachabilityIndex(args.index)
+        strokes = Path.load(args.path).stroke_arrays()
+        start = time.perf_counter()
+        result = index.preflight(strokes, args.min_score)
+        elapsed = time.perf_counter() - start
+        print("============ Checked %d samples of %d strokes in %.1f ms" % (
+            result.samples, len(strokes), elapsed * 1000.0))
+        if result.unreachable:
+            print("============ Unreachable strokes %s" % result.unreachable)
+        if result.singular:
+            print("============ Near-singular strokes %s" % result.singular)
+        if not result.ok:
+            return 1
+        print("============ Design is reachable")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
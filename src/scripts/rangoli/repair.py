@@ -0,0 +1,183 @@
+"""Repair Cartesian plans that stop short instead of replanning them from scratch.
+
+``compute_cartesian_path`` returns ``fraction < 1`` as soon as one segment
+cannot be followed: an IK failure, a joint-space jump or a collision at a
+single bad waypoint. The sim scripts used to throw such plans away.
+``CartesianRepairer`` instead:
+
+1. keeps the planned prefix. It bisects for the longest prefix of waypoints
+   that plans completely, with the first probe placed from the returned
+   fraction;
+2. replans only a small window starting at the first failing waypoint, from
+   the joint state at the end of the prefix, trying in turn a finer
+   ``eef_step``, small yaw offsets (harmless for a round pen) and small
+   tilts;
+3. stitches the window onto the prefix and plans the rest of the path from
+   the end of the window, repeating for every further failure.
+
+Every request goes through ``rangoli.plan_cache``, so a repaired design
+that is planned again comes straight from the cache.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry, plan_cache
+
+RepairResult = namedtuple("RepairResult", ["plan", "fraction", "repairs", "planner_calls", "failed_at"])
+RepairResult.__doc__ = """Stitched plan and the fraction of waypoints it covers; repairs lists
+(waypoint index, strategy) and failed_at is the waypoint that could not be repaired, or None."""
+
+
+def repair_strategies(eef_step, min_eef_step=0.001, yaw_deg=(5.0, 15.0), tilt_deg=(2.0, 5.0)):
+    """
+    Window replanning attempts in order of preference.
+    @returns: list of (name, eef_step, (droll, dpitch, dyaw) in radians)
+    """
+    strategies = []
+    step = eef_step / 2.0
+    while step >= min_eef_step - 1e-12:
+        strategies.append(("eef_step %g" % step, step, (0.0, 0.0, 0.0)))
+        step /= 2.0
+    for deg in yaw_deg:
+        for sign in (1.0, -1.0):
+            strategies.append(("yaw %+g deg" % (sign * deg), eef_step, (0.0, 0.0, np.radians(sign * deg))))
+    for deg in tilt_deg:
+        for axis in (0, 1):
+            for sign in (1.0, -1.0):
+                delta = [0.0, 0.0, 0.0]
+                delta[axis] = np.radians(sign * deg)
+                strategies.append(("%s %+g deg" % ("roll" if axis == 0 else "pitch", sign * deg), eef_step,
+                                   tuple(delta)))
+    return strategies
+
+
+class CartesianRepairer(object):
+    """Plans a waypoint path, repairing local failures instead of discarding the plan."""
+
+    def __init__(self, move_group, eef_step=0.01, cache=None, window=3, max_repairs=20, retime=True,
+                 strategies=None, log=print):
+        """
+        @param: move_group   MoveGroupCommander to plan with
+        @param: window       Waypoints replanned from the first failing one
+        @param: max_repairs  Give up after this many repaired windows
+        @param: strategies   As from repair_strategies(eef_step), which is the default
+        """
+        self.move_group = move_group
+        self.eef_step = eef_step
+        self.cache = cache
+        self.window = window
+        self.max_repairs = max_repairs
+        self.retime = retime
+        self.strategies = strategies if strategies is not None else repair_strategies(eef_step)
+        self.log = log
+        self.joint_names = list(move_group.get_active_joints())
+        self.planner_calls = 0
+
+    def _plan(self, rows, start, eef_step=None):
+        self.planner_calls += 1
+        return plan_cache.cached_compute_cartesian_path(
+            self.move_group, geometry.to_ros_poses(rows), self.eef_step if eef_step is None else eef_step,
+            cache=self.cache, start_positions=start)
+
+    def _end(self, plan):
+        """Joint values at the end of a plan, in active joint order."""
+        trajectory = plan.joint_trajectory
+        values = dict(zip(trajectory.joint_names, trajectory.points[-1].positions))
+        return [values[name] for name in self.joint_names]
+
+    def _longest_prefix(self, rows, start, fraction):
+        """
+        Bisect for the longest prefix of ``rows`` that plans completely from ``start``.
+        @returns: (length, plan of that prefix or None)
+        """
+        lo, hi, best = 0, len(rows), None
+        probe = min(max(1, int(fraction * len(rows))), len(rows) - 1)
+        while hi - lo > 1:
+            plan, f = self._plan(rows[:probe], start)
+            if f >= 1.0:
+                lo, best = probe, plan
+            else:
+                hi = probe
+            probe = (lo + hi) // 2
+        return lo, best
+
+    def _repair_window(self, rows, start):
+        """(plan, strategy name) of the first strategy that plans ``rows`` completely, or (None, None)."""
+        for name, eef_step, delta in self.strategies:
+            window = np.array(rows, dtype=float)
+            window[:, geometry.RX:] += delta
+            plan, fraction = self._plan(window, start, eef_step)
+            if fraction >= 1.0:
+                return plan, name
+        return None, None
+
+    def plan(self, waypoints):
+        """
+        Plan ``waypoints`` (an (N, 6) stroke array or a list of Pose messages) from the current state.
+        @returns: RepairResult
+        """
+        from rangoli.parallel_plan import ParallelCartesianPlanner, _robot_state
+
+        if isinstance(waypoints, np.ndarray):
+            rows = np.asarray(waypoints, dtype=float).reshape(-1, 6)
+        else:
+            rows = np.array([geometry.ros_pose_to_row(p) for p in waypoints]).reshape(-1, 6)
+        total = len(rows)
+        start_positions = list(self.move_group.get_current_joint_values())
+
+        # The common case: the path plans completely (or comes from the cache) in one request
+        self.planner_calls += 1
+        first, fraction = plan_cache.cached_compute_cartesian_path(
+            self.move_group, waypoints if not isinstance(waypoints, np.ndarray) else geometry.to_ros_poses(rows),
+            self.eef_step, cache=self.cache)
+        if fraction >= 1.0 or total == 0:
+            return RepairResult(first, fraction, [], self.planner_calls, None)
+
+        plans, repairs = [], []
+        done, start, failed_at = 0, None, None
+        while True:
+            if plans:
+                plan, fraction = self._plan(rows[done:], start)
+                if fraction >= 1.0:
+                    plans.append(plan)
+                    done = total
+                    break
+            length, prefix = self._longest_prefix(rows[done:], start, fraction)
+            if prefix is not None:
+                plans.append(prefix)
+                start = self._end(prefix)
+            done += length
+
+            window = rows[done:done + self.window]
+            repaired, name = (None, None)
+            if len(repairs) < self.max_repairs:
+                repaired, name = self._repair_window(window, start)
+            if repaired is None:
+                failed_at = done
+                self.log("============ Could not repair the path at waypoint %d of %d" % (done, total))
+                break
+            self.log("============ Repaired waypoints %d-%d with %s" % (done, done + len(window) - 1, name))
+            repairs.append((done, name))
+            plans.append(repaired)
+            start = self._end(repaired)
+            done += len(window)
+            if done >= total:
+                break
+
+        if not plans:
+            return RepairResult(first, fraction, repairs, self.planner_calls, failed_at)
+        stitched = ParallelCartesianPlanner.stitch(plans)
+        if self.retime and len(stitched.joint_trajectory.points) > 1:
+            stitched = self.move_group.retime_trajectory(_robot_state(self.joint_names, start_positions), stitched)
+        return RepairResult(stitched, done / float(total), repairs, self.planner_calls, failed_at)
+
+
+def plan_with_repair(move_group, waypoints, eef_step, cache=None, **kwargs):
+    """
+    Drop-in for ``plan_cache.cached_compute_cartesian_path`` that repairs local failures.
+    @returns: (plan, fraction) where fraction is the share of waypoints covered
+    """
+    result = CartesianRepairer(move_group, eef_step, cache, **kwargs).plan(waypoints)
+    return result.plan, result.fraction
@@ -0,0 +1,284 @@
+"""Managed OwlClient session with warmup, heartbeats and transparent reconnect.
+
+``RobotSession`` is a drop-in replacement for ``OwlClient(ip)``:
+
+* **Warmup**: connecting waits until the controller reports running and
+  makes a few round trips to measure the link's latency.
+* **Heartbeats**: a second connection polls ``is_running`` in the
+  background. A poll that fails or takes longer than ``stall_timeout``
+  marks the link as lost, even while the command connection is blocked in a
+  long move.
+* **Stall detection**: every command runs on a worker thread with a timeout,
+  ``call_timeout`` for status and non-blocking moves and ``motion_timeout``
+  for blocking ones. A timeout or a heartbeat failure abandons the call.
+* **Reconnect and resume**: after a loss both connections are reopened,
+  retrying with the delays in ``reconnect_delays``. Only a blocking move
+  that returned counts as acknowledged; non-blocking moves queued after it
+  may have been dropped with the connection. They are sent again first, in
+  order, and then the call that failed. Moves are absolute poses, so
+  repeating a waypoint the controller may already have reached just
+  re-targets the same point. Drawing therefore resumes from the last
+  acknowledged waypoint instead of the start of the design. Relative moves
+  are never retried, and a loss with a relative move still queued raises.
+  Joint moves (``move_to_joint``, exposed when the client has it) are
+  absolute as well and retried the same way.
+
+Streamed setpoints (``rangoli.streaming``) are sent inside ``streaming()``.
+Each one supersedes the one before, so only the latest is kept for re-sending
+instead of every setpoint since the stream started, and a drop does not make
+the arm retrace the stream from its start.
+
+Multi-pose calls are deliberately not exposed. ``StrokeExecutor`` then sends
+waypoint by waypoint, which is what makes resuming at waypoint granularity
+possible.
+
+The address may be an IP for the real controller, or ``host:port`` for the
+TCP stand-in in ``rangoli.standin_robot``.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class SessionError(Exception):
+    """The robot could not be reached again, or a call cannot be safely retried."""
+
+
+class ConnectionLost(Exception):
+    """The link dropped or stalled during a call."""
+
+
+def connect_client(address):
+    """Open a client for ``address``: "host:port" is the TCP stand-in, anything else a real OwlClient."""
+    if ":" in str(address):
+        from rangoli.standin_robot import TcpOwlClient
+        return TcpOwlClient(address)
+    from owl_client import OwlClient
+    return OwlClient(address)
+
+
+class RobotSession(object):
+    """OwlClient proxy that survives connection drops."""
+
+    def __init__(self, address, factory=connect_client, call_timeout=2.0, motion_timeout=120.0,
+                 heartbeat_interval=0.25, stall_timeout=1.0, ready_timeout=30.0,
+                 reconnect_delays=(0.0, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0), warmup_calls=3,
+                 max_retries=5, log=print):
+        """
+        @param: address             Robot IP or stand-in "host:port"
+        @param: factory             f(address) -> client with move_to_pose and is_running
+        @param: heartbeat_interval  Seconds between heartbeats; None disables them
+        @param: stall_timeout       Heartbeat round trip after which the link counts as stalled
+        @param: reconnect_delays    Pause before each reconnect attempt
+        @param: max_retries         Attempts per call before giving up
+        """
+        self.address = address
+        self.factory = factory
+        self.call_timeout = call_timeout
+        self.motion_timeout = motion_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.stall_timeout = stall_timeout
+        self.ready_timeout = ready_timeout
+        self.reconnect_delays = reconnect_delays
+        self.warmup_calls = warmup_calls
+        self.max_retries = max_retries
+        self.log = log
+
+        self.acked = 0                # moves confirmed by a returned blocking move
+        self.last_acked_pose = None
+        self._queued = []             # (name, args, kwargs) sent without waiting since then
+        self._stream_from = None      # index in _queued of the streamed setpoint, inside streaming()
+        self.reconnects = 0
+        self.downtime = 0.0           # seconds spent reconnecting
+        self.rtt = None               # median warmup round trip
+        self._client = None
+        self._heartbeat_client = None
+        self._worker = None
+        self._lost = threading.Event()
+        self._closed = threading.Event()
+        self._reconnect_lock = threading.Lock()
+        self._heartbeat = None
+
+        self._lost.set()
+        self.reconnect(initial=True)
+        if callable(getattr(self._client, "move_to_joint", None)):
+            self.move_to_joint = self._move_to_joint
+        if heartbeat_interval is not None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="owl-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------ connection
+
+    def _open(self):
+        """Connect both links, wait for the controller and measure the round trip."""
+        self._worker = ThreadPoolExecutor(1, thread_name_prefix="owl-session")
+        # The session is still marked lost while it opens, so these calls do not watch the heartbeat
+        self._client = self._run(self.factory, (self.address,), self.call_timeout, heartbeat=False)
+        if self.heartbeat_interval is not None:
+            self._heartbeat_client = self._run(self.factory, (self.address,), self.call_timeout, heartbeat=False)
+
+        deadline = time.time() + self.ready_timeout
+        while not self._run(self._client.is_running, (), self.call_timeout, heartbeat=False):
+            if time.time() > deadline:
+                raise SessionError("robot at %s not running after %.1f s" % (self.address, self.ready_timeout))
+            time.sleep(0.2)
+
+        rtts = []
+        for _ in range(self.warmup_calls):
+            start = time.perf_counter()
+            self._run(self._client.is_running, (), self.call_timeout, heartbeat=False)
+            rtts.append(time.perf_counter() - start)
+        if rtts:
+            self.rtt = sorted(rtts)[len(rtts) // 2]
+        for name, args, kwargs in self._queued:
+            # Unacknowledged queued moves, in the order they were first sent
+            self._run(getattr(self._client, name), args, self.call_timeout, kwargs, heartbeat=False)
+        self._lost.clear()
+
+    def _discard(self):
+        """Abandon both links; a call stuck on the old worker thread is left to die with it."""
+        if self._worker is not None:
+            self._worker.shutdown(wait=False)
+        for client in (self._client, self._heartbeat_client):
+            close = getattr(client, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+        self._client = self._heartbeat_client = None
+
+    def reconnect(self, initial=False):
+        """Reopen the session, retrying with ``reconnect_delays``."""
+        with self._reconnect_lock:
+            if self._client is not None and not self._lost.is_set():
+                return  # another thread already reconnected
+            start = time.time()
+            self._discard()
+            if any(kwargs.get("relative") for _, _, kwargs in self._queued):
+                raise SessionError("a relative move queued on %s cannot be re-sent safely" % self.address)
+            error = None
+            for delay in self.reconnect_delays:
+                time.sleep(delay)
+                try:
+                    self._open()
+                except Exception as e:
+                    error = e
+                    self._discard()
+                    continue
+                if initial:
+                    return
+                self.reconnects += 1
+                self.downtime += time.time() - start
+                self.log("============ Reconnected to %s in %.3f s, resuming after waypoint %d (%d re-sent)" % (
+                    self.address, time.time() - start, self.acked, len(self._queued)))
+                return
+            raise SessionError("could not reconnect to %s: %s" % (self.address, error))
+
+    def close(self):
+        self._closed.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=2.0)
+        self._discard()
+
+    def _heartbeat_loop(self):
+        executor = ThreadPoolExecutor(1, thread_name_prefix="owl-heartbeat")
+        while not self._closed.wait(self.heartbeat_interval):
+            client = self._heartbeat_client
+            if client is None or self._lost.is_set():
+                continue
+            future = executor.submit(client.is_running)
+            try:
+                future.result(timeout=self.stall_timeout)
+            except Exception:
+                if client is self._heartbeat_client:
+                    self._lost.set()
+                if not future.done():
+                    # The stuck poll holds the thread; continue on a fresh one
+                    executor.shutdown(wait=False)
+                    executor = ThreadPoolExecutor(1, thread_name_prefix="owl-heartbeat")
+        executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------ calls
+
+    def _run(self, fn, args, timeout, kwargs=None, heartbeat=True):
+        """
+        Run fn on the worker thread, raising ConnectionLost on error, timeout or,
+        with ``heartbeat``, a heartbeat loss.
+        """
+        future = self._worker.submit(fn, *args, **(kwargs or {}))
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return future.result(timeout=min(0.01, max(0.0, deadline - time.time())))
+            except FutureTimeout:
+                if heartbeat and self._lost.is_set():
+                    raise ConnectionLost("heartbeat lost")
+                if time.time() >= deadline:
+                    raise ConnectionLost("no answer within %.1f s" % timeout)
+            except Exception as e:
+                raise ConnectionLost("%s: %s" % (type(e).__name__, e))
+
+    def _call(self, name, args, kwargs, timeout, retry=True):
+        for attempt in range(self.max_retries):
+            if self._lost.is_set() or self._client is None:
+                self.reconnect()
+            try:
+                return self._run(getattr(self._client, name), args, timeout, kwargs)
+            except ConnectionLost as e:
+                self._lost.set()
+                self.log("============ Connection to %s lost during %s: %s" % (self.address, name, e))
+                if not retry:
+                    raise SessionError("%s cannot be retried safely after: %s" % (name, e))
+        raise SessionError("%s failed %d times" % (name, self.max_retries))
+
+    def is_running(self):
+        try:
+            return self._call("is_running", (), {}, self.call_timeout)
+        except SessionError:
+            return False
+
+    @contextmanager
+    def streaming(self):
+        """Keep only the latest non-blocking move sent inside the block for re-sending."""
+        self._stream_from = len(self._queued)
+        try:
+            yield self
+        finally:
+            self._stream_from = None
+
+    def _move(self, name, args, kwargs, retry=True):
+        """Send a move; a returned blocking move acknowledges every move queued before it."""
+        wait = kwargs["wait"]
+        result = self._call(name, args, kwargs, self.motion_timeout if wait else self.call_timeout, retry)
+        if wait:
+            self.acked += len(self._queued) + 1
+            self._queued = []
+            if self._stream_from is not None:
+                self._stream_from = 0
+        else:
+            if self._stream_from is not None:
+                # A newer setpoint supersedes the previous one
+                del self._queued[self._stream_from:]
+            self._queued.append((name, args, kwargs))
+        return result
+
+    def move_to_pose(self, pose, toolSpeed, wait=True, relative=False, **kwargs):
+        kwargs.update(wait=wait, relative=relative)
+        result = self._move("move_to_pose", (pose, toolSpeed), kwargs, retry=not relative)
+        if wait:
+            self.last_acked_pose = pose
+        return result
+
+    def _move_to_joint(self, joint, toolSpeed, wait=True, **kwargs):
+        kwargs.update(wait=wait)
+        return self._move("move_to_joint", (joint, toolSpeed), kwargs)
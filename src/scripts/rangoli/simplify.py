@@ -0,0 +1,181 @@
+"""Tolerance-driven waypoint reduction.
+
+Instead of a fixed step count, strokes are reduced to the fewest waypoints
+whose straight-line chords stay within a chord-error tolerance given in
+millimetres:
+
+* ``arc_steps`` picks the step count for a circular arc from its radius,
+* ``douglas_peucker`` drops polyline vertices that lie within tolerance,
+* ``curvature_resample`` re-spaces densely sampled smooth curves so that
+  spacing follows the local curvature,
+* ``simplify_stroke`` splits a stroke at its corners and uses whichever of
+  the last two gives fewer points on each piece.
+"""
+
+import numpy as np
+
+from rangoli import geometry
+from rangoli.geometry import X, RX
+
+
+def _tolerance_m(tolerance_mm):
+    if tolerance_mm <= 0:
+        raise ValueError("tolerance_mm must be positive, got %r" % (tolerance_mm,))
+    return tolerance_mm / 1000.0
+
+
+def arc_steps(radius, tolerance_mm, sweep=2.0 * np.pi, min_steps=3):
+    """
+    Number of chords needed for an arc of ``radius`` metres so that the
+    sagitta r * (1 - cos(theta / 2)) of each chord is within tolerance.
+    """
+    tol = _tolerance_m(tolerance_mm)
+    if radius <= tol:
+        return min_steps
+    theta = 2.0 * np.arccos(1.0 - tol / radius)
+    return max(min_steps, int(np.ceil(abs(sweep) / theta)))
+
+
+def adaptive_circle_stroke(center_x, center_y, center_z, radius, tolerance_mm=0.1, **kwargs):
+    """``geometry.circle_stroke`` with the step count chosen by ``arc_steps``."""
+    steps = arc_steps(radius, tolerance_mm)
+    return geometry.circle_stroke(center_x, center_y, center_z, radius, steps, **kwargs)
+
+
+def _segment_distance(points, a, b):
+    """Distance from each of ``points`` to the segment a-b (broadcast over a and b)."""
+    ab = b - a
+    denom = np.sum(ab * ab, axis=-1)
+    t = np.sum((points - a) * ab, axis=-1) / np.where(denom > 0, denom, 1.0)
+    t = np.clip(t, 0.0, 1.0)[..., None]
+    return np.linalg.norm(points - (a + t * ab), axis=-1)
+
+
+def douglas_peucker_mask(stroke, tolerance_mm):
+    """Boolean mask of the waypoints kept by Douglas-Peucker on the stroke positions."""
+    tol = _tolerance_m(tolerance_mm)
+    points = np.asarray(stroke, dtype=float)[:, X:RX]
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        d = _segment_distance(points[i + 1:j], points[i], points[j])
+        k = int(np.argmax(d))
+        if d[k] > tol:
+            mid = i + 1 + k
+            keep[mid] = True
+            stack.append((i, mid))
+            stack.append((mid, j))
+    return keep
+
+
+def douglas_peucker(stroke, tolerance_mm):
+    """Polyline simplification; orientations are taken from the kept waypoints."""
+    stroke = np.asarray(stroke, dtype=float)
+    if len(stroke) < 3:
+        return stroke
+    return stroke[douglas_peucker_mask(stroke, tolerance_mm)]
+
+
+def _arc_length(points):
+    return np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))))
+
+
+def curvature_resample(stroke, tolerance_mm):
+    """
+    Resample a smooth, densely sampled curve with chord spacing set by its
+    local curvature: a chord of length 2 * sqrt(2 r tol - tol^2) on a circle
+    of radius r has a sagitta of exactly tol. Straight runs collapse to their
+    end points. The end points are always kept.
+    """
+    tol = _tolerance_m(tolerance_mm)
+    stroke = np.asarray(stroke, dtype=float)
+    if len(stroke) < 3:
+        return stroke
+    points = stroke[:, X:RX]
+    s = _arc_length(points)
+    if s[-1] <= 0:
+        return stroke[[0, -1]]
+
+    # Curvature at interior vertices from the circle through each point and its neighbours
+    u = points[1:-1] - points[:-2]
+    v = points[2:] - points[1:-1]
+    lengths = np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1) * np.linalg.norm(u + v, axis=1)
+    cross = np.linalg.norm(np.cross(u, v), axis=1)
+    kappa = np.where(lengths > 0, 2.0 * cross / np.where(lengths > 0, lengths, 1.0), 0.0)
+    kappa = np.concatenate((kappa[:1], kappa, kappa[-1:]))
+    segment_kappa = np.maximum(kappa[:-1], kappa[1:])
+
+    # Allowed chord per segment; the number of chords needed is the integral of 1 / chord
+    radius = 1.0 / np.maximum(segment_kappa, 1e-12)
+    chord = 2.0 * np.sqrt(np.maximum(2.0 * radius * tol - tol * tol, tol * tol))
+    budget = np.concatenate(([0.0], np.cumsum(np.diff(s) / chord)))
+    count = max(1, int(np.ceil(budget[-1] - 1e-9)))
+
+    targets = np.interp(np.linspace(0.0, budget[-1], count + 1), budget, s)
+    return np.stack([np.interp(targets, s, stroke[:, c]) for c in range(stroke.shape[1])], axis=1)
+
+
+def max_deviation(original, simplified):
+    """
+    Largest distance from an original waypoint to the simplified path, pairing
+    each waypoint with the simplified chord at the same arc length.
+    """
+    p = np.asarray(original, dtype=float)[:, X:RX]
+    q = np.asarray(simplified, dtype=float)[:, X:RX]
+    if len(q) < 2:
+        return float(np.max(np.linalg.norm(p - q[:1], axis=1))) if len(q) else np.inf
+    s_p = _arc_length(p)
+    s_q = _arc_length(q)
+    # Both parameterisations are rescaled to [0, 1] so they line up end to end
+    s_p = s_p / s_p[-1] if s_p[-1] > 0 else s_p
+    s_q = s_q / s_q[-1] if s_q[-1] > 0 else s_q
+    k = np.clip(np.searchsorted(s_q, s_p, side="right") - 1, 0, len(q) - 2)
+    near = _segment_distance(p, q[k], q[k + 1])
+    # A vertex may also sit next to the neighbouring chord near a knot
+    before = _segment_distance(p, q[np.maximum(k - 1, 0)], q[np.maximum(k, 1)])
+    after = _segment_distance(p, q[np.minimum(k + 1, len(q) - 2)], q[np.minimum(k + 2, len(q) - 1)])
+    return float(np.max(np.minimum(near, np.minimum(before, after))))
+
+
+def corner_indices(stroke, corner_deg=30.0):
+    """Indices of interior waypoints where the path turns by more than ``corner_deg``."""
+    points = np.asarray(stroke, dtype=float)[:, X:RX]
+    if len(points) < 3:
+        return np.zeros(0, dtype=int)
+    u = points[1:-1] - points[:-2]
+    v = points[2:] - points[1:-1]
+    norms = np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1)
+    cos_turn = np.sum(u * v, axis=1) / np.where(norms > 0, norms, 1.0)
+    return np.nonzero((norms > 0) & (cos_turn < np.cos(np.radians(corner_deg))))[0] + 1
+
+
+def simplify_stroke(stroke, tolerance_mm, corner_deg=30.0):
+    """
+    Minimal waypoint set for any stroke within ``tolerance_mm``. The stroke is
+    split at corners, which are always kept; each piece in between is reduced
+    by Douglas-Peucker or, if that gives fewer points within tolerance, by
+    curvature-based resampling.
+    """
+    stroke = np.asarray(stroke, dtype=float)
+    if len(stroke) < 3:
+        return stroke
+    tol = _tolerance_m(tolerance_mm)
+
+    breaks = np.concatenate(([0], corner_indices(stroke, corner_deg), [len(stroke) - 1]))
+    pieces = []
+    for i, j in zip(breaks[:-1], breaks[1:]):
+        piece = stroke[i:j + 1]
+        best = douglas_peucker(piece, tolerance_mm)
+        if len(piece) > 3:
+            resampled = curvature_resample(piece, tolerance_mm)
+            if len(resampled) < len(best) and max_deviation(piece, resampled) <= tol:
+                best = resampled
+        # Each piece starts where the previous one ended
+        pieces.append(best if not pieces else best[1:])
+    return np.concatenate(pieces)
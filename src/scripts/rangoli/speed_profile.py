@@ -0,0 +1,141 @@
+"""Give every hardware move its own tool speed.
+
+The hardware scripts used one ``toolSpeed`` for every waypoint, so long
+straight edges were drawn as slowly as tight curves. ``SpeedProfile`` plans
+the speed per segment instead, reusing the limits of
+``rangoli.streaming.velocity_profile``:
+
+* at every vertex the speed is limited to ``sqrt(max_accel * r)`` for the
+  local radius of curvature ``r``, and to zero at corners sharper than
+  ``corner_deg`` (the controller stops there, and so does the drawing);
+* forward and backward passes bound the tangential acceleration, with the
+  stroke starting and ending at rest;
+* a segment is then commanded at the highest speed it can reach between its
+  two vertex speeds, ``sqrt((v0^2 + v1^2) / 2 + max_accel * length)``,
+  capped at ``max_speed``.
+
+Speeds are rounded down to ``levels`` steps of ``max_speed``, so consecutive
+moves share a speed and multi-pose calls can still take whole runs.
+``StrokeExecutor(..., speed_profile=...)`` passes the result through to
+``move_to_pose``.
+"""
+
+import numpy as np
+
+from rangoli import geometry
+from rangoli.streaming import local_radius
+
+
+def turn_angles(points):
+    """
+    Direction change at every vertex, in radians (0 at the two ends and where a
+    neighbouring segment has zero length).
+    """
+    points = np.asarray(points, dtype=float)
+    angles = np.zeros(len(points))
+    if len(points) < 3:
+        return angles
+    a = points[1:-1] - points[:-2]
+    b = points[2:] - points[1:-1]
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos = np.sum(a * b, axis=1) / norms
+    angles[1:-1] = np.where(norms > 1e-18, np.arccos(np.clip(cos, -1.0, 1.0)), 0.0)
+    return angles
+
+
+class SpeedProfile(object):
+    """Per-segment tool speeds from curvature, segment length and acceleration limits."""
+
+    def __init__(self, max_speed=0.1, max_accel=0.5, min_speed=0.005, corner_deg=20.0, levels=8, scale=1.0):
+        """
+        @param: max_speed   Speed of long straight runs, in m/s
+        @param: max_accel   Cartesian acceleration limit of the arm, in m/s^2
+        @param: min_speed   Lowest speed ever commanded, in m/s
+        @param: corner_deg  Vertices turning more than this are treated as corners and stopped at
+        @param: levels      Number of speed steps between 0 and max_speed; 0 disables rounding
+        @param: scale       Client tool-speed units per m/s
+        """
+        self.max_speed = max_speed
+        self.max_accel = max_accel
+        self.min_speed = min_speed
+        self.corner = np.radians(corner_deg)
+        self.levels = levels
+        self.scale = scale
+
+    def vertex_speeds(self, points):
+        """
+        Highest speed at every vertex of a polyline that starts and ends at rest, in m/s.
+        @param: points  (N, 3) positions or an (N, 6) stroke
+        @returns: (ds, v) the (N - 1,) segment lengths and (N,) vertex speeds
+        """
+        points = np.asarray(points, dtype=float)[:, geometry.X:geometry.RX]
+        ds = np.linalg.norm(np.diff(points, axis=0), axis=1)
+        v = np.minimum(self.max_speed, np.sqrt(self.max_accel * local_radius(points)))
+        v[turn_angles(points) > self.corner] = 0.0
+        v[0] = v[-1] = 0.0
+        for i in range(len(ds)):
+            v[i + 1] = min(v[i + 1], np.sqrt(v[i] ** 2 + 2.0 * self.max_accel * ds[i]))
+        for i in range(len(ds) - 1, -1, -1):
+            v[i] = min(v[i], np.sqrt(v[i + 1] ** 2 + 2.0 * self.max_accel * ds[i]))
+        return ds, v
+
+    def segment_speeds(self, points):
+        """
+        Speed of each segment of a polyline, in m/s.
+        @param: points  (N, 3) positions or an (N, 6) stroke
+        @returns: (N - 1,) speeds
+        """
+        if len(points) < 2:
+            return np.zeros(0)
+        ds, v = self.vertex_speeds(points)
+        peak = np.sqrt(0.5 * (v[:-1] ** 2 + v[1:] ** 2) + self.max_accel * ds)
+        speeds = np.minimum(self.max_speed, peak)
+        if self.levels:
+            step = self.max_speed / float(self.levels)
+            speeds = np.floor(speeds / step + 1e-9) * step
+        return np.maximum(speeds, self.min_speed)
+
+    def stroke_time(self, stroke):
+        """
+        Time to draw a stroke from rest to rest, accelerating at ``max_accel``
+        up to each segment's peak speed and braking into the next vertex.
+        @returns: Seconds
+        """
+        if len(stroke) < 2:
+            return 0.0
+        ds, v = self.vertex_speeds(stroke)
+        v0, v1 = v[:-1], v[1:]
+        peak = np.minimum(self.max_speed, np.sqrt(0.5 * (v0 ** 2 + v1 ** 2) + self.max_accel * ds))
+        # Distance taken by the ramps; the rest of the segment is cruised at the peak speed
+        ramps = (2.0 * peak ** 2 - v0 ** 2 - v1 ** 2) / (2.0 * self.max_accel)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cruise = np.where(peak > 0, np.maximum(ds - ramps, 0.0) / peak, 0.0)
+        return float(np.sum((2.0 * peak - v0 - v1) / self.max_accel + cruise))
+
+    def stroke_speeds(self, stroke, previous=None):
+        """
+        Tool speed of the move to each waypoint of a stroke, in client units.
+        @param: previous  Position (x, y, z) the tool moves from to reach the first waypoint, if known
+        @returns: (N,) speeds
+        """
+        points = np.asarray(stroke, dtype=float)[:, geometry.X:geometry.RX]
+        if previous is not None:
+            speeds = self.segment_speeds(np.vstack((np.asarray(previous, dtype=float)[:3], points)))
+        elif len(points) > 1:
+            speeds = self.segment_speeds(points)
+            speeds = np.concatenate((speeds[:1], speeds))
+        else:
+            speeds = np.full(len(points), self.min_speed)
+        return speeds * self.scale
+
+
+def speed_runs(speeds):
+    """(start, end, speed) of every run of equal consecutive speeds."""
+    speeds = np.asarray(speeds)
+    if len(speeds) == 0:
+        return []
+    breaks = np.flatnonzero(speeds[1:] != speeds[:-1]) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(speeds)]))
+    return [(int(s), int(e), float(speeds[s])) for s, e in zip(starts, ends)]
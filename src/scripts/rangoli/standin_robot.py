@@ -0,0 +1,234 @@
+"""Local TCP stand-in for the OWL controller, with fault injection.
+
+``StandInServer`` accepts the calls the scripts make (``move_to_pose``,
+``move_to_joint`` and ``is_running``) as JSON lines and simulates motion
+time from the travelled distance, or the largest joint rotation. Queued non-blocking moves keep executing while clients come and
+go, as a controller would. ``TcpOwlClient`` is the matching client, with the
+same interface as ``owl_client.OwlClient``, so sessions and scripts can be
+exercised against it.
+
+Faults can be injected from code or the command line:
+
+* ``drop(seconds)`` closes every connection and refuses new ones for a while;
+* ``stall(seconds)`` stops answering without closing anything.
+
+From ``src/scripts``::
+
+    python3 -m rangoli.standin_robot --port 9000 --drop-every 5 --drop-for 0.2
+    OWL_ROBOT=127.0.0.1:9000 python3 hardware_codes/hardware_code.py
+"""
+
+import argparse
+import json
+import math
+import socket
+import socketserver
+import threading
+import time
+
+DEFAULT_PORT = 9000
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        if server.is_down():
+            return
+        server.register(self.connection)
+        try:
+            for line in self.rfile:
+                server.wait_while_stalled()
+                if server.is_down():
+                    return
+                request = json.loads(line.decode("utf-8"))
+                reply = server.dispatch(request)
+                self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            server.unregister(self.connection)
+
+
+class StandInServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Simulated controller: one arm shared by every connection."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), speed=0.25, time_scale=1.0, joint_speed=1.0):
+        """
+        @param: speed        Simulated tool speed in m/s
+        @param: time_scale   Multiplier on all simulated motion time, e.g. 0.01 for fast tests
+        @param: joint_speed  Simulated joint speed in rad/s
+        """
+        socketserver.TCPServer.__init__(self, address, _Handler)
+        self.speed = speed
+        self.time_scale = time_scale
+        self.joint_speed = joint_speed
+        self.position = [0.623, 0.0589, 0.5]
+        self.joints = None
+        self.busy_until = 0.0
+        self.received = []        # every pose target received, in order
+        self.received_joints = []  # every joint target received, in order
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._down_until = 0.0
+        self._stalled_until = 0.0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve on a background thread. @returns: self"""
+        threading.Thread(target=self.serve_forever, name="standin-robot", daemon=True).start()
+        return self
+
+    def register(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def unregister(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def is_down(self):
+        return time.time() < self._down_until
+
+    def wait_while_stalled(self):
+        while time.time() < self._stalled_until:
+            time.sleep(0.005)
+
+    def drop(self, seconds):
+        """Close all connections and refuse new ones for ``seconds``."""
+        self._down_until = time.time() + seconds
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stall(self, seconds):
+        """Keep connections open but stop answering for ``seconds``."""
+        self._stalled_until = time.time() + seconds
+
+    def dispatch(self, request):
+        op = request.get("op")
+        if op == "is_running":
+            return {"ok": True, "result": True}
+        if op == "move_to_pose":
+            return {"ok": True, "result": self.move(request)}
+        if op == "move_to_joint":
+            return {"ok": True, "result": self.move_joints(request)}
+        return {"ok": False, "error": "unknown op %r" % (op,)}
+
+    def move(self, request):
+        target = [float(v) for v in request["pose"][:3]]
+        with self._lock:
+            if request.get("relative"):
+                target = [p + t for p, t in zip(self.position, target)]
+            self.received.append(list(request["pose"]))
+            distance = math.sqrt(sum((a - b) ** 2 for a, b in zip(self.position, target)))
+            self.position = target
+            now = time.time()
+            self.busy_until = max(now, self.busy_until) + self.time_scale * distance / self.speed
+            done = self.busy_until
+        if request.get("wait", True):
+            time.sleep(max(0.0, done - time.time()))
+        return True
+
+    def move_joints(self, request):
+        target = [float(v) for v in request["joints"]]
+        with self._lock:
+            self.received_joints.append(target)
+            rotation = max(abs(a - b) for a, b in zip(self.joints, target)) if self.joints else 0.0
+            self.joints = target
+            now = time.time()
+            self.busy_until = max(now, self.busy_until) + self.time_scale * rotation / self.joint_speed
+            done = self.busy_until
+        if request.get("wait", True):
+            time.sleep(max(0.0, done - time.time()))
+        return True
+
+
+class TcpOwlClient(object):
+    """OwlClient look-alike talking to a ``StandInServer``."""
+
+    def __init__(self, address, timeout=5.0):
+        """
+        @param: address  "host:port" or (host, port)
+        """
+        if isinstance(address, str):
+            host, _, port = address.rpartition(":")
+            address = (host or "127.0.0.1", int(port or DEFAULT_PORT))
+        self.address = address
+        self.sock = socket.create_connection(address, timeout)
+        self.sock.settimeout(None)
+        self.file = self.sock.makefile("rwb")
+
+    def _call(self, request):
+        self.file.write((json.dumps(request) + "\n").encode("utf-8"))
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("stand-in robot closed the connection")
+        reply = json.loads(line.decode("utf-8"))
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply["result"]
+
+    def is_running(self):
+        return self._call({"op": "is_running"})
+
+    def move_to_pose(self, pose, toolSpeed, wait=True, relative=False, moveType=1):
+        return self._call({"op": "move_to_pose", "pose": [pose.x, pose.y, pose.z, pose.rx, pose.ry, pose.rz],
+                           "tool_speed": toolSpeed, "wait": wait, "relative": relative,
+                           "move_type": str(moveType)})
+
+    def move_to_joint(self, joint, toolSpeed, wait=True):
+        try:
+            values = [float(v) for v in joint]
+        except TypeError:
+            values = [float(v) for v in vars(joint).values()]
+        return self._call({"op": "move_to_joint", "joints": values, "tool_speed": toolSpeed, "wait": wait})
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local TCP stand-in for the OWL controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=0.25, help="simulated tool speed in m/s")
+    parser.add_argument("--drop-every", type=float, help="drop all connections every this many seconds")
+    parser.add_argument("--drop-for", type=float, default=0.2, help="length of each drop in seconds")
+    args = parser.parse_args(argv)
+
+    server = StandInServer((args.host, args.port), args.speed).start()
+    print("============ Stand-in robot listening on %s:%d" % (args.host, server.port))
+    try:
+        while True:
+            if args.drop_every:
+                time.sleep(args.drop_every)
+                print("============ Dropping connections for %.3f s" % args.drop_for)
+                server.drop(args.drop_for)
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Fixed-rate, time-parameterised streaming of strokes.
+
+Discrete ``move_to_pose(..., moveType=STRAIGHT)`` calls make the controller
+accelerate and stop at every waypoint. In streaming mode a stroke is instead
+turned into a trajectory with a continuous speed profile:
+
+1. ``velocity_profile`` limits the tool speed everywhere to ``max_speed``,
+   at every vertex to ``sqrt(max_accel * r)`` for the local radius of
+   curvature ``r`` (so centripetal acceleration stays bounded), and along
+   the path by forward and backward passes that bound the tangential
+   acceleration to ``max_accel``;
+2. ``time_parameterize`` samples that profile at a fixed control rate
+   (125 Hz by default), exactly, since speed is piecewise linear in time;
+3. ``SetpointStreamer`` sends one setpoint per tick against absolute
+   deadlines: it sleeps until shortly before each deadline and spins for
+   the rest, so sleep jitter does not accumulate. When it falls more than a
+   period behind it skips to the setpoint that is due now instead of
+   replaying stale ones, and it reports lateness percentiles and deadline
+   misses. The final setpoint is sent as a blocking ``move_to_pose``, so
+   streaming returns once the arm has stopped there.
+
+Setpoints are sent as non-blocking ``move_to_pose`` calls. owl_client has no
+documented streaming call and does not say whether such a move is queued or
+replaces the running one, so streaming is refused unless queuing has been
+switched on (``OWL_QUEUE_MOVES=1``, see ``rangoli.executor``). On a
+``RobotSession`` the stream runs inside ``session.streaming()``, so a reconnect
+re-sends only the latest setpoint rather than the whole stream.
+"""
+
+import contextlib
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry
+
+Trajectory = namedtuple("Trajectory", ["times", "setpoints", "speeds", "duration", "rate"])
+Trajectory.__doc__ = """Setpoints (K, 6) at times (K,) = k / rate, with the tool speed at each."""
+
+StreamReport = namedtuple("StreamReport", ["sent", "skipped", "deadline_misses", "max_lateness",
+                                           "lateness_p50", "lateness_p99", "duration"])
+StreamReport.__doc__ = """Outcome of streaming one trajectory; times in seconds."""
+
+
+def local_radius(points):
+    """
+    Radius of the circle through each vertex and its neighbours (inf on
+    straight runs and at the two ends).
+    @param: points  (N, 3) positions
+    @returns: (N,) radii
+    """
+    points = np.asarray(points, dtype=float)
+    radius = np.full(len(points), np.inf)
+    if len(points) < 3:
+        return radius
+    a = points[1:-1] - points[:-2]
+    b = points[2:] - points[1:-1]
+    c = points[2:] - points[:-2]
+    la, lb, lc = (np.linalg.norm(v, axis=1) for v in (a, b, c))
+    area2 = np.linalg.norm(np.cross(a, b), axis=1)  # twice the triangle area
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = la * lb * lc / (2.0 * area2)
+    radius[1:-1] = np.where(area2 > 1e-15, r, np.inf)
+    # A reversal (zero-area spike) needs a full stop
+    radius[1:-1][(area2 <= 1e-15) & (np.sum(a * b, axis=1) < 0)] = 0.0
+    return radius
+
+
+def velocity_profile(stroke, max_speed, max_accel, start_speed=0.0, end_speed=0.0):
+    """
+    Fastest speed at every waypoint within the speed, centripetal and
+    tangential acceleration limits.
+    @returns: (s, v) arc length and speed at each waypoint
+    """
+    points = np.asarray(stroke, dtype=float)[:, geometry.X:geometry.RX]
+    ds = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    s = np.concatenate(([0.0], np.cumsum(ds)))
+    v = np.minimum(max_speed, np.sqrt(max_accel * local_radius(points)))
+    v[0] = min(v[0], start_speed)
+    v[-1] = min(v[-1], end_speed)
+    # v_{i+1}^2 <= v_i^2 + 2 a ds, forward then backward
+    for i in range(len(ds)):
+        v[i + 1] = min(v[i + 1], np.sqrt(v[i] ** 2 + 2.0 * max_accel * ds[i]))
+    for i in range(len(ds) - 1, -1, -1):
+        v[i] = min(v[i], np.sqrt(v[i + 1] ** 2 + 2.0 * max_accel * ds[i]))
+    return s, v
+
+
+def time_parameterize(stroke, max_speed=0.05, max_accel=0.5, rate=125.0):
+    """
+    Sample a stroke at a fixed rate along its velocity profile.
+    @param: max_speed  Tool speed limit in m/s
+    @param: max_accel  Acceleration limit in m/s^2
+    @param: rate       Control rate in Hz
+    @returns: Trajectory
+    """
+    stroke = np.asarray(stroke, dtype=float)
+    if len(stroke) < 2:
+        return Trajectory(np.zeros(len(stroke)), stroke.copy(), np.zeros(len(stroke)), 0.0, rate)
+    s, v = velocity_profile(stroke, max_speed, max_accel)
+    ds = np.diff(s)
+    # Constant acceleration per segment, so its duration is 2 ds / (v0 + v1)
+    dt = np.where(ds > 0, 2.0 * ds / np.maximum(v[:-1] + v[1:], 1e-12), 0.0)
+    t = np.concatenate(([0.0], np.cumsum(dt)))
+    duration = float(t[-1])
+
+    times = np.arange(int(np.floor(duration * rate)) + 1) / rate
+    if times[-1] < duration:
+        times = np.append(times, duration)
+    seg = np.clip(np.searchsorted(t, times, side="right") - 1, 0, max(0, len(ds) - 1))
+    tau = times - t[seg]
+    accel = np.where(dt[seg] > 0, (v[seg + 1] - v[seg]) / np.where(dt[seg] > 0, dt[seg], 1.0), 0.0)
+    along = np.clip(v[seg] * tau + 0.5 * accel * tau * tau, 0.0, ds[seg])
+    fraction = np.where(ds[seg] > 0, along / np.where(ds[seg] > 0, ds[seg], 1.0), 0.0)[:, None]
+
+    # Interpolate positions linearly and angles after unwrapping
+    columns = stroke.copy()
+    columns[:, geometry.RX:] = np.unwrap(columns[:, geometry.RX:], axis=0)
+    setpoints = columns[seg] + fraction * (columns[seg + 1] - columns[seg])
+    speeds = v[seg] + accel * tau
+    return Trajectory(times, setpoints, speeds, duration, rate)
+
+
+class SetpointStreamer(object):
+    """Sends trajectory setpoints to an OwlClient at a fixed rate."""
+
+    def __init__(self, client, pose_cls=None, tool_speed=35, move_type=None, spin=0.0005,
+                 miss_tolerance=0.5, clock=time.perf_counter, sleep=time.sleep, queue_moves=None):
+        """
+        @param: client          Connected OwlClient or RobotSession
+        @param: tool_speed      Tool speed passed with every setpoint
+        @param: move_type       TrajectoryPlanMode; None keeps the client's default
+        @param: spin            Seconds before each deadline to stop sleeping and busy-wait
+        @param: miss_tolerance  Lateness, as a fraction of the period, counted as a deadline miss
+        @param: queue_moves     Whether non-blocking moves are known to queue; rangoli.executor.QUEUE_MOVES
+                                by default. Streaming raises ValueError without it
+        """
+        from rangoli import executor
+        if not (executor.QUEUE_MOVES if queue_moves is None else queue_moves):
+            raise ValueError("streaming sends moves with wait=False, set OWL_QUEUE_MOVES=1 once the "
+                             "controller has been checked to queue them (see README)")
+        self.client = client
+        self.pose_cls = pose_cls
+        self.tool_speed = tool_speed
+        self.move_type = move_type
+        self.spin = spin
+        self.miss_tolerance = miss_tolerance
+        self.clock = clock
+        self.sleep = sleep
+        # RobotSession keeps only the latest streamed setpoint for re-sending after a reconnect
+        self._streaming = getattr(client, "streaming", None)
+
+    def _move_to_pose(self, pose, wait=False):
+        kwargs = {"wait": wait, "relative": False}
+        if self.move_type is not None:
+            kwargs["moveType"] = self.move_type
+        self.client.move_to_pose(pose, self.tool_speed, **kwargs)
+
+    def stream(self, trajectory):
+        """
+        Send every setpoint at its deadline, skipping ones that are already stale.
+        @returns: StreamReport
+        """
+        with self._streaming() if self._streaming is not None else contextlib.nullcontext():
+            return self._stream(trajectory)
+
+    def _stream(self, trajectory):
+        poses = geometry.to_owl_poses(trajectory.setpoints, self.pose_cls)
+        period = 1.0 / trajectory.rate
+        times = trajectory.times
+        last = len(poses) - 1
+        lateness = np.zeros(len(poses))
+        sent = 0
+        skipped = 0
+
+        start = self.clock()
+        k = 0
+        while k <= last:
+            deadline = start + times[k]
+            remaining = deadline - self.clock()
+            if remaining > self.spin:
+                self.sleep(remaining - self.spin)
+            while self.clock() < deadline:
+                pass
+
+            now = self.clock()
+            if k < last and now - deadline > period:
+                # Behind by more than a tick: jump to the setpoint due now
+                due = min(last, int(np.searchsorted(times, now - start, side="right")) - 1)
+                skipped += due - k
+                k = due
+                deadline = start + times[k]
+            lateness[sent] = now - deadline
+            if k < last:
+                self._move_to_pose(poses[k])
+            sent += 1
+            k += 1
+        duration = self.clock() - start
+        if last >= 0:
+            # Block on the final setpoint so the caller only continues once the motion has finished
+            self._move_to_pose(poses[last], wait=True)
+
+        lateness = lateness[:sent]
+        return StreamReport(
+            sent=sent,
+            skipped=skipped,
+            deadline_misses=int(np.count_nonzero(lateness > self.miss_tolerance * period)),
+            max_lateness=float(lateness.max()) if sent else 0.0,
+            lateness_p50=float(np.percentile(lateness, 50)) if sent else 0.0,
+            lateness_p99=float(np.percentile(lateness, 99)) if sent else 0.0,
+            duration=duration,
+        )
+
+
+def print_report(report, trajectory):
+    print("============ Streamed %d setpoints at %.0f Hz in %.3f s (planned %.3f s), "
+          "%d skipped, %d deadline misses, lateness p50 %.3f ms p99 %.3f ms max %.3f ms" % (
+              report.sent, trajectory.rate, report.duration, trajectory.duration, report.skipped,
+              report.deadline_misses, report.lateness_p50 * 1e3, report.lateness_p99 * 1e3,
+              report.max_lateness * 1e3))
@@ -0,0 +1,275 @@
+"""Choose stroke order, direction and start point to minimise non-drawing travel.
+
+Strokes are ``(N, 6)`` arrays as produced by ``rangoli.geometry``. Open
+strokes may be drawn forwards or backwards; closed loops (first point equal
+to the last) may additionally start at any of their vertices. The order is
+built with a nearest-neighbour construction and then improved with 2-opt and
+Or-opt moves, re-picking loop start vertices and directions after each round.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli.geometry import X, RX
+
+StrokeOrder = namedtuple(
+    "StrokeOrder",
+    ["strokes", "order", "reversed", "start_vertex", "travel_before", "travel_after", "travel_saved"],
+)
+StrokeOrder.__doc__ = """Result of optimize_stroke_order.
+
+strokes       The reordered strokes, each re-oriented and rotated ready to draw
+order         Index into the input list for each output stroke
+reversed      Whether each output stroke is drawn backwards
+start_vertex  Vertex each closed loop starts at (0 for open strokes)
+travel_*      Non-drawing travel in metres before/after optimisation and the difference
+"""
+
+_EPS = 1e-12
+
+
+def is_closed(stroke, tol=1e-6):
+    """True if the stroke ends where it starts."""
+    return len(stroke) > 2 and np.linalg.norm(stroke[-1, X:RX] - stroke[0, X:RX]) <= tol
+
+
+def orient_stroke(stroke, flip=False, vertex=0, closed=None):
+    """
+    Return the stroke drawn backwards and/or, for closed loops, starting at ``vertex``.
+    """
+    if closed is None:
+        closed = is_closed(stroke)
+    if not closed:
+        return stroke[::-1] if flip else stroke
+
+    ring = np.roll(stroke[:-1], -vertex, axis=0)
+    if flip:
+        ring = np.concatenate((ring[:1], ring[:0:-1]))
+    return np.concatenate((ring, ring[:1]))
+
+
+def _dist(a, b):
+    return np.sqrt(np.sum((np.asarray(a) - np.asarray(b)) ** 2, axis=-1))
+
+
+class _Tour(object):
+    """Current order plus per-stroke direction and loop start vertex."""
+
+    def __init__(self, strokes, start, closed_tol):
+        self.points = [np.asarray(s, dtype=float)[:, X:RX] for s in strokes]
+        self.closed = [is_closed(s, closed_tol) for s in strokes]
+        self.start = np.asarray(start, dtype=float)
+        self.order = list(range(len(strokes)))
+        self.flip = [False] * len(strokes)
+        self.vertex = [0] * len(strokes)
+        # Entry and exit point of every stroke under its current flip/vertex
+        self._entry = np.array([p[0] for p in self.points]).reshape(-1, 3)
+        self._exit = np.array([p[0] if c else p[-1] for p, c in zip(self.points, self.closed)]).reshape(-1, 3)
+
+    def orient(self, s, flip=None, vertex=None):
+        if flip is not None:
+            self.flip[s] = flip
+        if vertex is not None:
+            self.vertex[s] = vertex
+        p = self.points[s]
+        if self.closed[s]:
+            self._entry[s] = self._exit[s] = p[self.vertex[s]]
+        elif self.flip[s]:
+            self._entry[s], self._exit[s] = p[-1], p[0]
+        else:
+            self._entry[s], self._exit[s] = p[0], p[-1]
+
+    def entry(self, s):
+        return self._entry[s]
+
+    def exit(self, s):
+        return self._exit[s]
+
+    def ends(self):
+        return self._entry[self.order], self._exit[self.order]
+
+    def travel(self):
+        entries, exits = self.ends()
+        if not len(entries):
+            return 0.0
+        previous = np.vstack((self.start[None, :], exits[:-1]))
+        return float(np.sum(_dist(previous, entries)))
+
+    def nearest_neighbour(self):
+        # One flat array of every candidate entry point, tagged with its stroke
+        owners, candidates, vertices, flips = [], [], [], []
+        for s, p in enumerate(self.points):
+            if self.closed[s]:
+                ring = p[:-1]
+                candidates.append(ring)
+                owners.append(np.full(len(ring), s))
+                vertices.append(np.arange(len(ring)))
+                flips.append(np.zeros(len(ring), dtype=bool))
+            else:
+                candidates.append(p[[0, -1]])
+                owners.append(np.array([s, s]))
+                vertices.append(np.zeros(2, dtype=int))
+                flips.append(np.array([False, True]))
+        candidates = np.concatenate(candidates)
+        owners = np.concatenate(owners)
+        vertices = np.concatenate(vertices)
+        flips = np.concatenate(flips)
+
+        available = np.ones(len(candidates), dtype=bool)
+        position = self.start
+        self.order = []
+        for _ in range(len(self.points)):
+            d = np.where(available, _dist(candidates, position), np.inf)
+            k = int(np.argmin(d))
+            s = int(owners[k])
+            self.order.append(s)
+            self.orient(s, bool(flips[k]), int(vertices[k]))
+            available[owners == s] = False
+            position = self.exit(s)
+
+    def two_opt(self):
+        improved = False
+        n = len(self.order)
+        for i in range(n - 1):
+            entries, exits = self.ends()
+            previous = self.start if i == 0 else exits[i - 1]
+            j = np.arange(i + 1, n)
+            following = np.vstack((entries[1:], np.full((1, 3), np.nan)))[j]
+            has_next = j < n - 1
+            old = _dist(previous, entries[i]) + np.where(has_next, _dist(exits[j], following), 0.0)
+            new = _dist(previous, exits[j]) + np.where(has_next, _dist(entries[i], following), 0.0)
+            delta = new - old
+            k = int(np.argmin(delta))
+            if delta[k] < -_EPS:
+                j = int(j[k])
+                segment = self.order[i:j + 1][::-1]
+                self.order[i:j + 1] = segment
+                for s in segment:
+                    self.orient(s, not self.flip[s])
+                improved = True
+        return improved
+
+    def or_opt(self, max_chain=3):
+        improved = False
+        for length in range(1, max_chain + 1):
+            i = 0
+            while i <= len(self.order) - length:
+                if self._move_chain(i, length):
+                    improved = True
+                i += 1
+        return improved
+
+    def _move_chain(self, i, length):
+        n = len(self.order)
+        entries, exits = self.ends()
+        previous = self.start if i == 0 else exits[i - 1]
+        after = i + length
+        # Travel removed by taking the chain out and joining its neighbours
+        removed = _dist(previous, entries[i])
+        if after < n:
+            removed += _dist(exits[after - 1], entries[after]) - _dist(previous, entries[after])
+
+        rest = self.order[:i] + self.order[after:]
+        keep = np.r_[0:i, after:n].astype(int)
+        rest_entries, rest_exits = entries[keep], exits[keep]
+        m = len(rest)
+        # Insertion slot k places the chain before rest[k] (k == m appends it)
+        before = np.vstack((self.start[None, :], rest_exits))
+        nxt = np.vstack((rest_entries, np.full((1, 3), np.nan)))
+        has_next = np.arange(m + 1) < m
+        joined = np.where(has_next, _dist(before, nxt), 0.0)
+
+        best = (-_EPS, None, None)
+        for flipped in (False, True):
+            chain_in = exits[after - 1] if flipped else entries[i]
+            chain_out = entries[i] if flipped else exits[after - 1]
+            added = _dist(before, chain_in) + np.where(has_next, _dist(chain_out, nxt), 0.0) - joined
+            added[i] = np.inf  # reinserting in place is not a move
+            k = int(np.argmin(added))
+            if added[k] - removed < best[0]:
+                best = (added[k] - removed, k, flipped)
+
+        if best[1] is None:
+            return False
+        chain = self.order[i:after]
+        if best[2]:
+            chain = chain[::-1]
+            for s in chain:
+                self.orient(s, not self.flip[s])
+        self.order = rest[:best[1]] + chain + rest[best[1]:]
+        return True
+
+    def refine_ends(self):
+        """Re-pick loop start vertices and open stroke directions in place."""
+        improved = False
+        n = len(self.order)
+        for pos, s in enumerate(self.order):
+            previous = self.start if pos == 0 else self._exit[self.order[pos - 1]]
+            following = self._entry[self.order[pos + 1]] if pos < n - 1 else None
+            p = self.points[s]
+            if self.closed[s]:
+                candidates = p[:-1]
+                cost = _dist(candidates, previous)
+                if following is not None:
+                    cost = cost + _dist(candidates, following)
+                best = int(np.argmin(cost))
+                if cost[best] < cost[self.vertex[s]] - _EPS:
+                    self.orient(s, vertex=best)
+                    improved = True
+            else:
+                costs = []
+                for entry, exit in ((p[0], p[-1]), (p[-1], p[0])):
+                    cost = _dist(previous, entry)
+                    if following is not None:
+                        cost += _dist(exit, following)
+                    costs.append(cost)
+                flip = costs[1] < costs[0]
+                if flip != self.flip[s] and abs(costs[0] - costs[1]) > _EPS:
+                    self.orient(s, flip)
+                    improved = True
+        return improved
+
+
+def optimize_stroke_order(strokes, start=None, max_rounds=50, closed_tol=1e-6):
+    """
+    Reorder, reverse and rotate strokes to minimise the travel between them.
+    @param: strokes     Sequence of (N, 6) stroke arrays
+    @param: start       Starting x, y, z of the tool; defaults to the first point of the first stroke
+    @param: max_rounds  Upper bound on 2-opt/Or-opt improvement rounds
+    @param: closed_tol  Distance under which a stroke counts as a closed loop
+    @returns: StrokeOrder
+    """
+    strokes = [np.asarray(s, dtype=float) for s in strokes]
+    if not strokes:
+        return StrokeOrder([], [], [], [], 0.0, 0.0, 0.0)
+    if start is None:
+        start = strokes[0][0, X:RX]
+
+    tour = _Tour(strokes, np.asarray(start, dtype=float)[:3], closed_tol)
+    travel_before = tour.travel()
+
+    tour.nearest_neighbour()
+    for _ in range(max_rounds):
+        improved = tour.two_opt()
+        improved = tour.or_opt() or improved
+        improved = tour.refine_ends() or improved
+        if not improved:
+            break
+
+    travel_after = tour.travel()
+    if travel_after > travel_before:
+        # Never hand back something worse than the order we were given
+        tour = _Tour(strokes, np.asarray(start, dtype=float)[:3], closed_tol)
+        travel_after = travel_before
+
+    ordered = [orient_stroke(strokes[s], tour.flip[s], tour.vertex[s], tour.closed[s]) for s in tour.order]
+    return StrokeOrder(
+        ordered,
+        list(tour.order),
+        [tour.flip[s] for s in tour.order],
+        [tour.vertex[s] for s in tour.order],
+        travel_before,
+        travel_after,
+        travel_before - travel_after,
+    )
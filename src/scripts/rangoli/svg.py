@@ -0,0 +1,418 @@
+"""Streaming SVG importer that yields strokes in workspace coordinates.
+
+``iter_strokes`` parses the file incrementally with ``iterparse`` and yields
+one ``(N, 6)`` stroke (see ``rangoli.geometry``) per SVG subpath as soon as
+its element has been read. Each element is dropped from the tree once
+handled, so memory stays bounded by the largest single path rather than the
+file. A consumer such as ``StrokeExecutor.execute_all`` can start drawing
+before the rest of the file has been parsed.
+
+Supported elements are ``path`` (M, L, H, V, C, S, Q, T, A and Z, absolute
+and relative), ``line``, ``polyline``, ``polygon``, ``rect``, ``circle`` and
+``ellipse``, with ``transform`` attributes on them and on enclosing groups.
+Curves are flattened adaptively, so the chords stay within ``tolerance_mm``
+of the true curve on the paper:
+
+* Béziers use Wang's bound on the segment count, evaluated in one vectorised
+  call per curve;
+* arcs, circles and ellipses use the same sagitta rule as
+  ``simplify.arc_steps``.
+
+The drawing is mapped onto the workspace with the centre of its viewBox
+(or width/height) at the hardware scripts' ``center_x``/``center_y``, y
+flipped so the picture is not mirrored, and scaled so its larger side is
+``size_m`` metres. Pass ``size_m=None`` to use the document's own physical
+units instead. Without a viewBox or size, one user unit is one millimetre.
+"""
+
+import functools
+import math
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from rangoli import geometry, simplify
+from rangoli.path import DEFAULT_CENTER
+
+# Metres per CSS unit
+UNITS = {"": 0.0254 / 96, "px": 0.0254 / 96, "pt": 0.0254 / 72, "pc": 0.0254 / 6,
+         "mm": 1e-3, "cm": 1e-2, "in": 0.0254, "m": 1.0}
+
+_NUMBER = re.compile(r"\s*,?\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+_COMMAND = re.compile(r"\s*([MmLlHhVvCcSsQqTtAaZz])")
+_FLAG = re.compile(r"\s*,?\s*([01])")
+_LENGTH = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-z%]*)")
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+
+SHAPES = ("path", "line", "polyline", "polygon", "rect", "circle", "ellipse")
+
+
+def _numbers(text):
+    return [float(n) for n in _NUMBER.findall(text or "")]
+
+
+def _length(text, default=None):
+    """Parse an attribute length, returning (value, unit)."""
+    match = _LENGTH.match(text or "")
+    if not match:
+        return default, ""
+    return float(match.group(1)), match.group(2)
+
+
+def parse_transform(text):
+    """3x3 affine matrix of an SVG ``transform`` attribute."""
+    matrix = np.eye(3)
+    for name, args in _TRANSFORM.findall(text or ""):
+        v = _numbers(args)
+        m = np.eye(3)
+        if name == "matrix":
+            m[:2, :] = np.array(v[:6]).reshape(3, 2).T
+        elif name == "translate":
+            m[0, 2], m[1, 2] = v[0], v[1] if len(v) > 1 else 0.0
+        elif name == "scale":
+            m[0, 0], m[1, 1] = v[0], v[1] if len(v) > 1 else v[0]
+        elif name == "rotate":
+            a = math.radians(v[0])
+            c, s = math.cos(a), math.sin(a)
+            m[:2, :2] = ((c, -s), (s, c))
+            if len(v) == 3:
+                # rotate(a, cx, cy) = translate(cx, cy) rotate(a) translate(-cx, -cy)
+                m[:2, 2] = np.array(v[1:]) - m[:2, :2] @ np.array(v[1:])
+        elif name == "skewX":
+            m[0, 1] = math.tan(math.radians(v[0]))
+        elif name == "skewY":
+            m[1, 0] = math.tan(math.radians(v[0]))
+        matrix = matrix @ m
+    return matrix
+
+
+def _apply(matrix, points):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+def _gain(matrix):
+    """Largest stretch factor (singular value) of an affine matrix, for converting tolerances."""
+    (a, b), (c, d) = matrix[:2, :2].tolist()
+    t = a * a + b * b + c * c + d * d
+    det = a * d - b * c
+    return math.sqrt((t + math.sqrt(max(0.0, t * t - 4.0 * det * det))) / 2.0) or 1.0
+
+
+@functools.lru_cache(maxsize=256)
+def _bernstein(degree, n):
+    """(n, degree + 1) Bernstein basis at t = 1/n, 2/n, ..., 1."""
+    t = np.linspace(0.0, 1.0, n + 1)[1:, None]
+    return np.hstack([math.comb(degree, k) * t ** k * (1.0 - t) ** (degree - k) for k in range(degree + 1)])
+
+
+def bezier_points(control, tolerance):
+    """
+    Flatten one Bézier curve of any degree given in workspace coordinates.
+    The segment count follows Wang's formula, so no point of the curve is
+    further than ``tolerance`` from the polyline.
+    @param: control    (degree + 1, 2) control points
+    @param: tolerance  In the same units as the control points
+    @returns: (n, 2) points, excluding the start point
+    """
+    control = np.asarray(control, dtype=float)
+    degree = len(control) - 1
+    second = control[2:] - 2.0 * control[1:-1] + control[:-2]
+    m = math.sqrt(float(np.max(np.sum(second * second, axis=1)))) if len(second) else 0.0
+    n = max(1, int(math.ceil(math.sqrt(degree * (degree - 1) / 8.0 * m / tolerance))))
+    return _bernstein(degree, n) @ control
+
+
+def arc_points(start, rx, ry, phi_deg, large_arc, sweep, end, tolerance_mm, gain):
+    """
+    Flatten an SVG elliptical arc given in local coordinates (endpoint
+    parameterisation, SVG 1.1 appendix F.6).
+    @param: gain  Local-to-workspace stretch, to turn the tolerance into local units
+    @returns: (n, 2) local points, excluding the start point
+    """
+    x0, y0 = start
+    x1, y1 = end
+    if (x0, y0) == (x1, y1):
+        return np.empty((0, 2))
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0.0 or ry == 0.0:
+        return np.array([end], dtype=float)
+
+    phi = math.radians(phi_deg)
+    c, s = math.cos(phi), math.sin(phi)
+    dx, dy = (x0 - x1) / 2.0, (y0 - y1) / 2.0
+    xp, yp = c * dx + s * dy, -s * dx + c * dy
+    scale = xp * xp / (rx * rx) + yp * yp / (ry * ry)
+    if scale > 1.0:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    num = rx * rx * ry * ry - rx * rx * yp * yp - ry * ry * xp * xp
+    den = rx * rx * yp * yp + ry * ry * xp * xp
+    coef = math.sqrt(max(0.0, num / den)) if den else 0.0
+    if large_arc == sweep:
+        coef = -coef
+    cxp, cyp = coef * rx * yp / ry, -coef * ry * xp / rx
+    cx = c * cxp - s * cyp + (x0 + x1) / 2.0
+    cy = s * cxp + c * cyp + (y0 + y1) / 2.0
+
+    theta1 = math.atan2((yp - cyp) / ry, (xp - cxp) / rx)
+    dtheta = (math.atan2((-yp - cyp) / ry, (-xp - cxp) / rx) - theta1) % (2.0 * math.pi)
+    if not sweep and dtheta > 0.0:
+        dtheta -= 2.0 * math.pi
+
+    steps = simplify.arc_steps(max(rx, ry) * gain, tolerance_mm, sweep=dtheta, min_steps=1)
+    theta = theta1 + dtheta * np.linspace(0.0, 1.0, steps + 1)[1:]
+    ex, ey = rx * np.cos(theta), ry * np.sin(theta)
+    points = np.stack((cx + c * ex - s * ey, cy + s * ex + c * ey), axis=-1)
+    points[-1] = end
+    return points
+
+
+def ellipse_points(cx, cy, rx, ry, tolerance_mm, gain):
+    """Closed ellipse in local coordinates, first point repeated at the end."""
+    steps = simplify.arc_steps(max(rx, ry) * gain, tolerance_mm)
+    theta = np.linspace(0.0, 2.0 * np.pi, steps + 1)
+    return np.stack((cx + rx * np.cos(theta), cy + ry * np.sin(theta)), axis=-1)
+
+
+class _PathData(object):
+    """Cursor over an SVG path ``d`` attribute."""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def command(self):
+        match = _COMMAND.match(self.text, self.pos)
+        if not match:
+            return None
+        self.pos = match.end()
+        return match.group(1)
+
+    def has_number(self):
+        return _NUMBER.match(self.text, self.pos) is not None
+
+    def number(self):
+        match = _NUMBER.match(self.text, self.pos)
+        if not match:
+            raise ValueError("Expected a number at %d in path data %r" % (self.pos, self.text[:80]))
+        self.pos = match.end()
+        return float(match.group(1))
+
+    def flag(self):
+        # Arc flags may be written without separators, e.g. "a1 1 0 001 1"
+        match = _FLAG.match(self.text, self.pos)
+        if not match:
+            raise ValueError("Expected an arc flag at %d in path data %r" % (self.pos, self.text[:80]))
+        self.pos = match.end()
+        return match.group(1) == "1"
+
+    def at_end(self):
+        return not self.text[self.pos:].strip()
+
+
+def path_polylines(d, matrix, tolerance_mm):
+    """
+    Flatten a path ``d`` attribute into workspace polylines, one per subpath.
+    @param: matrix  Local-to-workspace affine transform
+    @returns: generator of (n, 2) arrays
+    """
+    tol = tolerance_mm / 1000.0
+    gain = _gain(matrix)
+    data = _PathData(d)
+    current = np.zeros(2)      # current point, local coordinates
+    start = np.zeros(2)        # subpath start, local coordinates
+    last_control = None        # reflected by S/T
+    pieces = []                # workspace point arrays of the open subpath
+    command = None
+
+    def finish():
+        if pieces and sum(len(p) for p in pieces) > 1:
+            return np.concatenate(pieces)
+        return None
+
+    while not data.at_end():
+        next_command = data.command()
+        if next_command is not None:
+            command = next_command
+        elif command is None or not data.has_number():
+            raise ValueError("Malformed path data near %r" % data.text[data.pos:data.pos + 20])
+        relative = command.islower()
+        kind = command.upper()
+        origin = current if relative else np.zeros(2)
+
+        if kind == "Z":
+            if pieces:
+                pieces.append(_apply(matrix, start))
+            polyline = finish()
+            if polyline is not None:
+                yield polyline
+            pieces = []
+            current = start.copy()
+            last_control = None
+            command = None
+            continue
+
+        if kind == "M":
+            polyline = finish()
+            if polyline is not None:
+                yield polyline
+            current = origin + (data.number(), data.number())
+            start = current.copy()
+            pieces = [_apply(matrix, current)]
+            last_control = None
+            # Further coordinate pairs after a moveto are implicit linetos
+            command = "l" if relative else "L"
+            continue
+
+        if not pieces:
+            pieces = [_apply(matrix, current)]
+
+        if kind in "LHV":
+            if kind == "L":
+                end = origin + (data.number(), data.number())
+            elif kind == "H":
+                end = np.array((data.number() + (current[0] if relative else 0.0), current[1]))
+            else:
+                end = np.array((current[0], data.number() + (current[1] if relative else 0.0)))
+            pieces.append(_apply(matrix, end))
+            last_control = None
+        elif kind in "CS":
+            if kind == "C":
+                c1 = origin + (data.number(), data.number())
+            else:
+                c1 = 2.0 * current - last_control if last_control is not None and last_kind in "CS" else current
+            c2 = origin + (data.number(), data.number())
+            end = origin + (data.number(), data.number())
+            pieces.append(bezier_points(_apply(matrix, (current, c1, c2, end)), tol))
+            last_control = c2
+        elif kind in "QT":
+            if kind == "Q":
+                c1 = origin + (data.number(), data.number())
+            else:
+                c1 = 2.0 * current - last_control if last_control is not None and last_kind in "QT" else current
+            end = origin + (data.number(), data.number())
+            pieces.append(bezier_points(_apply(matrix, (current, c1, end)), tol))
+            last_control = c1
+        elif kind == "A":
+            rx, ry, phi = data.number(), data.number(), data.number()
+            large_arc, sweep = data.flag(), data.flag()
+            end = origin + (data.number(), data.number())
+            local = arc_points(current, rx, ry, phi, large_arc, sweep, end, tolerance_mm, gain)
+            pieces.append(_apply(matrix, local))
+            last_control = None
+        last_kind = kind
+        current = end
+
+    polyline = finish()
+    if polyline is not None:
+        yield polyline
+
+
+def element_polylines(element, tag, matrix, tolerance_mm):
+    """Workspace polylines of one shape element."""
+    def get(name):
+        return _length(element.get(name), 0.0)[0]
+
+    gain = _gain(matrix)
+    if tag == "path":
+        for polyline in path_polylines(element.get("d", ""), matrix, tolerance_mm):
+            yield polyline
+    elif tag == "line":
+        yield _apply(matrix, ((get("x1"), get("y1")), (get("x2"), get("y2"))))
+    elif tag in ("polyline", "polygon"):
+        points = np.array(_numbers(element.get("points")), dtype=float)
+        points = points[:len(points) // 2 * 2].reshape(-1, 2)
+        if tag == "polygon" and len(points):
+            points = np.vstack((points, points[:1]))
+        if len(points) > 1:
+            yield _apply(matrix, points)
+    elif tag == "rect":
+        x, y, w, h = get("x"), get("y"), get("width"), get("height")
+        if w > 0 and h > 0:
+            yield _apply(matrix, ((x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)))
+    elif tag == "circle":
+        r = get("r")
+        if r > 0:
+            yield _apply(matrix, ellipse_points(get("cx"), get("cy"), r, r, tolerance_mm, gain))
+    elif tag == "ellipse":
+        rx, ry = get("rx"), get("ry")
+        if rx > 0 and ry > 0:
+            yield _apply(matrix, ellipse_points(get("cx"), get("cy"), rx, ry, tolerance_mm, gain))
+
+
+def document_matrix(svg, size_m=0.2, center=DEFAULT_CENTER):
+    """
+    Affine transform from the root ``svg`` element's user units to workspace
+    metres: box center onto ``center``, y flipped.
+    """
+    box = _numbers(svg.get("viewBox"))
+    width, width_unit = _length(svg.get("width"))
+    height, height_unit = _length(svg.get("height"))
+    if len(box) == 4 and box[2] > 0 and box[3] > 0:
+        min_x, min_y, box_w, box_h = box
+    elif width and height:
+        min_x, min_y, box_w, box_h = 0.0, 0.0, width, height
+    else:
+        min_x = min_y = box_w = box_h = None
+
+    if size_m is not None and box_w is not None:
+        scale = size_m / max(box_w, box_h)
+    elif width and width_unit in UNITS and box_w is not None:
+        # Physical size from the width attribute
+        scale = width * UNITS[width_unit] / box_w
+    else:
+        scale = 1e-3
+
+    matrix = np.diag((scale, -scale, 1.0))
+    matrix[:2, 2] = center[:2]
+    if box_w is not None:
+        matrix[:2, 2] -= matrix[:2, :2] @ np.array((min_x + box_w / 2.0, min_y + box_h / 2.0))
+    return matrix
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def iter_polylines(source, tolerance_mm=0.1, size_m=0.2, center=DEFAULT_CENTER):
+    """
+    Parse ``source`` (a path or file object) incrementally, yielding (n, 2)
+    workspace polylines as each shape element is completed.
+    """
+    simplify._tolerance_m(tolerance_mm)  # validate early
+    matrices = []
+    elements = []
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        tag = _local_name(element.tag)
+        if event == "start":
+            if not matrices:
+                base = document_matrix(element, size_m, center) if tag == "svg" else document_matrix(element, None, center)
+                matrices.append(base @ parse_transform(element.get("transform")))
+            else:
+                matrices.append(matrices[-1] @ parse_transform(element.get("transform")))
+            elements.append(element)
+            continue
+
+        matrix = matrices.pop()
+        elements.pop()
+        if tag in SHAPES:
+            for polyline in element_polylines(element, tag, matrix, tolerance_mm):
+                yield polyline
+        # Drop the finished element so the tree never grows beyond the open ancestors
+        element.clear()
+        if elements:
+            elements[-1].remove(element)
+
+
+def iter_strokes(source, tolerance_mm=0.1, size_m=0.2, center=DEFAULT_CENTER):
+    """
+    Lazily yield one (N, 6) drawing stroke per SVG subpath, at the center's
+    height in the drawing orientation.
+    @param: source        SVG file path or file object
+    @param: tolerance_mm  Largest allowed chord deviation on the paper
+    @param: size_m        Size of the drawing's larger side in metres, None for the document's units
+    @param: center        Workspace (x, y, z) the drawing is centred on
+    """
+    for polyline in iter_polylines(source, tolerance_mm, size_m, center):
+        yield geometry.polyline_stroke(polyline, center[2])
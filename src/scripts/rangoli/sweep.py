@@ -0,0 +1,340 @@
+"""Parameter sweeps over designs, evaluated in parallel worker processes.
+
+Tuning a design used to mean hand-editing constants such as ``radius``,
+``steps``, the side-length growth or the rotation angles and running the
+script again. ``run_sweep`` takes a grid of parameter values instead and
+evaluates every combination in a process pool. Each variant goes through
+the same offline pipeline as a real job:
+
+1. generation, from a built-in design (``DESIGNS``) or from a drawing-daemon
+   job whose values may name grid parameters as ``"$name"``;
+2. optional simplification (``tolerance_mm``) and then corner blending
+   (``blend_mm``, ``blend_deviation_mm``, arcs sampled to ``tolerance_mm``),
+   then stroke ordering;
+3. a reachability preflight, when a ``rangoli.reachability`` index is given;
+4. optionally planning with batched IK from a ``KinematicChain``, which
+   stands in for MoveIt and flags unreachable poses and branch switches.
+
+``cycle_time`` estimates how long the robot would take with the speeds a
+``rangoli.speed_profile.SpeedProfile`` plans, so curvature, corner stops and
+acceleration all count, plus pen-up travel, pauses and controller calls.
+The variants are ranked feasible first, then by estimated cycle time.
+
+From ``src/scripts``::
+
+    python3 -m rangoli.sweep --design nested_squares \\
+        --param side_length=[0.04,0.06] --param growth=[1.2,1.414] \\
+        --param tolerance_mm=[0.1,0.5] --index owl.reach
+    python3 -m rangoli.sweep sweep.json --plan --urdf owl.urdf --output ranked.json
+
+where ``sweep.json`` holds ``{"design": name, "grid": {...}}`` or
+``{"job": {...}, "grid": {...}}``.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rangoli import blend, geometry, simplify
+from rangoli.path import DEFAULT_CENTER
+from rangoli.speed_profile import SpeedProfile
+from rangoli.stroke_order import optimize_stroke_order
+
+# Grid parameters consumed by the pipeline rather than by the design
+PIPELINE = {"tolerance_mm": None, "blend_mm": None, "blend_deviation_mm": None, "order": True}
+
+CycleTime = namedtuple("CycleTime", ["draw", "travel", "pauses", "calls", "total"])
+CycleTime.__doc__ = """Estimated drawing, pen-up travel, pause and controller-call time, in seconds."""
+
+
+def nested_squares(side_length=0.06, growth=np.sqrt(2), angles=(45, 0, 45, 0), center_x=DEFAULT_CENTER[0],
+                   center_y=DEFAULT_CENTER[1], center_z=DEFAULT_CENTER[2]):
+    """The squares of hardware_code.py: one per angle, each ``growth`` times larger than the last."""
+    sides = side_length * float(growth) ** np.arange(len(angles))
+    return [geometry.rotated_square_stroke(center_x, center_y, center_z, side, angle)
+            for side, angle in zip(sides, angles)]
+
+
+def mandala(copies=8, rings=4, steps=72, center_x=DEFAULT_CENTER[0], center_y=DEFAULT_CENTER[1],
+            center_z=DEFAULT_CENTER[2]):
+    """The synthetic mandala of ``rangoli.bench``."""
+    from rangoli import bench
+
+    return bench.mandala(int(copies), int(rings), int(steps), (center_x, center_y, center_z))
+
+
+DESIGNS = {
+    "nested_squares": nested_squares,
+    "mandala": mandala,
+}
+
+
+def _substitute(template, params):
+    """Copy of a job template with every "$name" string replaced by params[name]."""
+    if isinstance(template, dict):
+        return {key: _substitute(value, params) for key, value in template.items()}
+    if isinstance(template, list):
+        return [_substitute(value, params) for value in template]
+    if isinstance(template, str) and template.startswith("$"):
+        return params[template[1:]]
+    return template
+
+
+def design_strokes(spec, params):
+    """
+    Strokes of one variant.
+    @param: spec    {"design": name in DESIGNS} or {"job": drawing-daemon job template}
+    @param: params  Grid values of the variant; pipeline parameters are ignored here
+    @returns: list of (N, 6) stroke arrays
+    """
+    values = {key: value for key, value in params.items() if key not in PIPELINE}
+    if "job" in spec:
+        from rangoli.daemon import expand_symmetry, job_strokes, job_symmetry
+
+        job = _substitute(spec["job"], values)
+        strokes = [np.asarray(s, dtype=float) for s in job_strokes(job)]
+        folds, center = job_symmetry(job)
+        return expand_symmetry(strokes, folds, center) if folds > 1 else strokes
+    if spec.get("design") not in DESIGNS:
+        raise ValueError("Unknown design %r, expected one of %s or a job" % (spec.get("design"), sorted(DESIGNS)))
+    return DESIGNS[spec["design"]](**values)
+
+
+def variants(grid):
+    """Every combination of the grid values, as parameter dicts in grid order."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _travel_time(distance, speed, accel):
+    """Point-to-point move from rest to rest under speed and acceleration limits."""
+    if distance <= speed * speed / accel:
+        return 2.0 * np.sqrt(distance / accel)
+    return distance / speed + speed / accel
+
+
+def cycle_time(strokes, profile=None, travel_speed=0.1, pause=0.5, call_s=0.002):
+    """
+    Estimate the time to draw strokes in the given order.
+    @param: profile       SpeedProfile the strokes are drawn with, the default one when None
+    @param: travel_speed  Pen-up travel speed between strokes in m/s
+    @param: pause         Pause before every stroke in seconds (hardware_code.py waits 0.5 s)
+    @param: call_s        Controller round trip per waypoint in seconds
+    @returns: CycleTime
+    """
+    profile = profile or SpeedProfile()
+    draw = travel = 0.0
+    waypoints = 0
+    for i, stroke in enumerate(strokes):
+        stroke = np.asarray(stroke, dtype=float)
+        waypoints += len(stroke)
+        draw += profile.stroke_time(stroke)
+        if i:
+            gap = np.linalg.norm(stroke[0, geometry.X:geometry.RX] - previous[-1, geometry.X:geometry.RX])
+            travel += _travel_time(gap, travel_speed, profile.max_accel)
+        previous = stroke
+    pauses = pause * len(strokes)
+    calls = call_s * waypoints
+    return CycleTime(draw, travel, pauses, calls, draw + travel + pauses + calls)
+
+
+# Per-process state of pool workers
+_worker = {}
+
+
+def _init_worker(index_path, urdf, base_link, tip_link, group):
+    _worker.clear()
+    if index_path:
+        from rangoli.reachability import ReachabilityIndex
+
+        _worker["index"] = ReachabilityIndex(index_path)
+    if urdf or group:
+        from rangoli.kinematics import KinematicChain
+
+        if urdf:
+            _worker["chain"] = KinematicChain.from_urdf(urdf, base_link, tip_link)
+        else:
+            _worker["chain"] = KinematicChain.from_parameter_server(group)
+
+
+def evaluate(spec, params, limits=None):
+    """
+    Run one variant through generation, simplification, ordering and the
+    checks set up for this process.
+    @param: limits  Keyword arguments of ``cycle_time``
+    @returns: Result dict; ``error`` is set instead of raising
+    """
+    start = time.perf_counter()
+    row = {"params": params, "feasible": False, "error": None}
+    try:
+        options = dict(PIPELINE, **{key: value for key, value in params.items() if key in PIPELINE})
+        strokes = [s for s in design_strokes(spec, params) if len(s)]
+        if options["tolerance_mm"]:
+            strokes = [simplify.simplify_stroke(s, options["tolerance_mm"]) for s in strokes]
+        if options["blend_mm"]:
+            # Blended after simplifying, which would collapse the arcs again; the arcs are
+            # sampled to the same tolerance instead
+            strokes = [blend.blend_corners(s, options["blend_mm"], options["blend_deviation_mm"],
+                                           tolerance_mm=options["tolerance_mm"] or 0.1) for s in strokes]
+        if options["order"]:
+            strokes = optimize_stroke_order(strokes).strokes
+        estimate = cycle_time(strokes, **(limits or {}))
+        row.update(
+            strokes=len(strokes),
+            waypoints=int(sum(len(s) for s in strokes)),
+            path_length=float(sum(np.sum(np.linalg.norm(np.diff(s[:, geometry.X:geometry.RX], axis=0), axis=1))
+                                  for s in strokes)),
+            cycle_time=estimate.total,
+            time=estimate._asdict(),
+        )
+        feasible = True
+        if "index" in _worker:
+            result = _worker["index"].preflight(strokes)
+            row.update(unreachable_strokes=result.unreachable, singular_strokes=result.singular)
+            feasible &= result.ok
+        if "chain" in _worker:
+            solution, offsets = _worker["chain"].solve_strokes(strokes)
+            row.update(ik_unreachable=int(np.count_nonzero(~solution.reachable)),
+                       branch_switches=int(np.count_nonzero(solution.branch_switch)))
+            feasible &= not row["ik_unreachable"] and not row["branch_switches"]
+        row["feasible"] = bool(feasible)
+    except Exception as e:  # one bad variant must not end the sweep
+        row["error"] = "%s: %s" % (type(e).__name__, e)
+    row["eval_time"] = time.perf_counter() - start
+    return row
+
+
+def _evaluate_task(args):
+    return evaluate(*args)
+
+
+def _problems(row):
+    """Number of strokes and poses that failed a check."""
+    return (len(row.get("unreachable_strokes") or ()) + len(row.get("singular_strokes") or ())
+            + row.get("ik_unreachable", 0) + row.get("branch_switches", 0))
+
+
+def rank(rows):
+    """
+    Feasible variants first, then by estimated cycle time. Infeasible ones
+    follow with the fewest problems first, and failed variants come last.
+    """
+    return sorted(rows, key=lambda r: (r["error"] is not None, not r["feasible"], _problems(r),
+                                       r.get("cycle_time", np.inf)))
+
+
+def run_sweep(spec, grid, workers=None, index_path=None, urdf=None, base_link=None, tip_link=None,
+              group=None, limits=None):
+    """
+    Evaluate every combination of ``grid`` in a process pool.
+    @param: spec        {"design": name} or {"job": template}, see ``design_strokes``
+    @param: grid        {parameter: [values]}
+    @param: workers     Pool size, os.cpu_count() by default
+    @param: index_path  Reachability index to preflight every variant against
+    @param: urdf        URDF of the arm; plans every variant with batched IK when given
+    @param: group       Planning group read from the parameter server instead of ``urdf``
+    @param: limits      Keyword arguments of ``cycle_time``
+    @returns: Ranked result dicts
+    """
+    tasks = [(spec, params, limits) for params in variants(grid)]
+    if not tasks:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    # Spawned like the planner pool, so workers never inherit ROS threads from the parent
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(index_path, urdf, base_link, tip_link, group)) as pool:
+        rows = list(pool.map(_evaluate_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    return rank(rows)
+
+
+def _feasibility(row):
+    if row["error"]:
+        return row["error"]
+    # Counts only; the stroke indices are in the JSON output
+    counts = (("unreachable", len(row.get("unreachable_strokes") or ())),
+              ("singular", len(row.get("singular_strokes") or ())),
+              ("IK failed", row.get("ik_unreachable", 0)),
+              ("switches", row.get("branch_switches", 0)))
+    return ", ".join("%d %s" % (count, name) for name, count in counts if count) or "ok"
+
+
+def format_table(rows, limit=None):
+    """Ranked rows as a fixed-width text table."""
+    header = "%4s  %9s  %8s  %9s  %7s  %-36s  %s" % (
+        "rank", "cycle (s)", "path (m)", "waypoints", "strokes", "feasibility", "parameters")
+    lines = [header, "-" * len(header)]
+    for i, row in enumerate(rows[:limit] if limit else rows):
+        params = ", ".join("%s=%s" % item for item in row["params"].items())
+        if row["error"]:
+            lines.append("%4d  %9s  %8s  %9s  %7s  %-36s  %s" % (i + 1, "-", "-", "-", "-", _feasibility(row), params))
+        else:
+            lines.append("%4d  %9.1f  %8.3f  %9d  %7d  %-36s  %s" % (
+                i + 1, row["cycle_time"], row["path_length"], row["waypoints"], row["strokes"], _feasibility(row),
+                params))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate and rank design parameter variants in parallel")
+    parser.add_argument("spec", nargs="?", help='JSON file with {"design": ...} or {"job": ...} and a "grid"')
+    parser.add_argument("--design", choices=sorted(DESIGNS), help="built-in design, instead of a spec file")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=JSON_LIST",
+                        help="grid values of one parameter, e.g. radius=[0.05,0.1]; repeat for more")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all CPUs)")
+    parser.add_argument("--index", help="reachability index to preflight every variant against")
+    parser.add_argument("--plan", action="store_true", help="plan every variant with batched IK")
+    parser.add_argument("--urdf", help="URDF file for --plan; read from the parameter server by default")
+    parser.add_argument("--group", default="arm", help="planning group, used with the parameter server")
+    parser.add_argument("--base-link")
+    parser.add_argument("--tip-link")
+    parser.add_argument("--max-speed", type=float, default=0.1, help="drawing speed limit (m/s)")
+    parser.add_argument("--max-accel", type=float, default=0.5, help="acceleration limit (m/s^2)")
+    parser.add_argument("--corner-deg", type=float, default=20.0, help="turns above this stop the tool")
+    parser.add_argument("--travel-speed", type=float, default=0.1, help="pen-up travel speed (m/s)")
+    parser.add_argument("--pause", type=float, default=0.5, help="pause before every stroke (s)")
+    parser.add_argument("--call", type=float, default=0.002, help="controller round trip per waypoint (s)")
+    parser.add_argument("--top", type=int, help="only print the best N variants")
+    parser.add_argument("--output", help="also write the ranked results as JSON here")
+    args = parser.parse_args(argv)
+
+    spec, grid = {}, {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+        grid.update(spec.pop("grid", {}))
+    if args.design:
+        spec = {"design": args.design}
+    if not spec:
+        parser.error("give a spec file or --design")
+    for item in args.param:
+        name, _, values = item.partition("=")
+        values = json.loads(values)
+        grid[name] = values if isinstance(values, list) else [values]
+
+    limits = dict(profile=SpeedProfile(args.max_speed, args.max_accel, corner_deg=args.corner_deg),
+                  travel_speed=args.travel_speed, pause=args.pause, call_s=args.call)
+    start = time.perf_counter()
+    rows = run_sweep(spec, grid, args.workers, args.index, args.urdf if args.plan else None, args.base_link,
+                     args.tip_link, args.group if args.plan and not args.urdf else None, limits)
+    elapsed = time.perf_counter() - start
+    print(format_table(rows, args.top))
+    print("============ Evaluated %d variants in %.1f s, %d feasible" % (
+        len(rows), elapsed, sum(1 for r in rows if r["feasible"])))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
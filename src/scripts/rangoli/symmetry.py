@@ -0,0 +1,209 @@
+"""Plan one sector of a rotationally symmetric design and derive the other copies.
+
+A mandala that repeats a motif ``folds`` times about its center only needs
+the motif (the sector) planned. Copy ``k`` is the sector rotated by
+``k * 2 pi / folds`` about the center, positions and yaw alike. Its joint
+trajectory is derived from the sector's one instead of planned:
+
+* **base**: when the center lies on the axis of the base joint, rotating the
+  drawing is the same as rotating the whole arm, so the copy is the sector
+  trajectory with the base joint offset by the copy angle;
+* **ik**: otherwise the rotated tool poses are solved with
+  ``rangoli.kinematics``. Each point is seeded with the sector's joint values,
+  the base turned to the target's azimuth, so the solver converges in a few
+  batched iterations.
+
+Every derived copy gets a quick validity check: joint limits, the largest
+joint step between consecutive points, and (for ``ik`` copies) the IK
+residual. A copy that fails it is planned normally with
+``compute_cartesian_path`` from the copy's start state, so correctness never
+depends on the symmetry holding. Planner calls drop from
+``folds * strokes`` to ``strokes`` when every copy can be derived.
+"""
+
+import copy
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry, plan_cache
+from rangoli.path import DEFAULT_CENTER
+from rangoli.trajectory_file import plan_arrays
+
+SymmetricPlan = namedtuple("SymmetricPlan", ["joint_names", "copies", "modes", "fraction"])
+SymmetricPlan.__doc__ = """Trajectories of every copy of one sector stroke; copies[k] is a RobotTrajectory
+and modes[k] one of "sector", "base", "ik" or "planned"."""
+
+
+def rotate_stroke(stroke, angle_rad, center):
+    """Rotate a stroke about ``center`` (x, y), adding the angle to its yaw."""
+    stroke = np.array(stroke, dtype=float)
+    stroke[:, geometry.X:geometry.Z] = geometry.rotate_xy(stroke[:, geometry.X:geometry.Z], angle_rad, center)
+    stroke[:, geometry.RZ] += angle_rad
+    return stroke
+
+
+def rotational_copies(strokes, folds, center):
+    """
+    Every copy of a sector.
+    @returns: list of ``folds`` lists of strokes, the first being the sector itself
+    """
+    return [[rotate_stroke(s, 2.0 * np.pi * k / folds, center) for s in strokes] for k in range(folds)]
+
+
+class SymmetricPlanner(object):
+    """Plans sector strokes once and derives their rotated copies."""
+
+    def __init__(self, move_group, folds, center=DEFAULT_CENTER[:2], chain=None, eef_step=0.01,
+                 base_joint=0, base_xy=(0.0, 0.0), base_tolerance=1e-3, jump_tolerance=0.2,
+                 position_tolerance=1e-4, orientation_tolerance=1e-3, retime=True):
+        """
+        @param: folds           Number of copies, the sector included
+        @param: center          Rotation center (x, y) in the planning frame
+        @param: chain           rangoli.kinematics.KinematicChain of the group; enables ik copies and
+                                replaces base_joint/base_xy with the chain's own base axis
+        @param: base_xy         Where the base joint's (vertical) axis meets the x-y plane, without a chain
+        @param: jump_tolerance  Largest joint step between consecutive trajectory points (rad)
+        @param: retime          Retime ik and planned copies with move_group.retime_trajectory
+        """
+        self.move_group = move_group
+        self.folds = int(folds)
+        self.center = np.asarray(center, dtype=float)[:2]
+        self.chain = chain
+        self.eef_step = eef_step
+        self.jump_tolerance = jump_tolerance
+        self.position_tolerance = position_tolerance
+        self.orientation_tolerance = orientation_tolerance
+        self.retime = retime
+        self.base_joint = base_joint
+        self.base_sign = 1.0
+        self.lower = self.upper = None
+        axis_xy = np.asarray(base_xy, dtype=float)
+        vertical = True
+        if chain is not None:
+            self.base_joint = 0
+            origin = chain.origins[0]
+            axis = origin[:3, :3] @ chain.joints[0].axis
+            vertical = not chain.prismatic[0] and abs(abs(axis[2]) - 1.0) < 1e-6
+            self.base_sign = np.sign(axis[2]) or 1.0
+            axis_xy = origin[:2, 3]
+            self.lower, self.upper = chain.lower, chain.upper
+        self.axis_xy = axis_xy
+        self.base_on_axis = vertical and np.linalg.norm(self.center - axis_xy) <= base_tolerance
+        self.planner_calls = 0
+        self.derived = 0
+
+    def _compute(self, stroke, start_positions=None, joint_names=None):
+        """compute_cartesian_path for one stroke, optionally from a given start state."""
+        self.planner_calls += 1
+        if start_positions is not None and joint_names is not None:
+            # The cache expects the values in active joint order
+            active = self.move_group.get_active_joints()
+            start_positions = [start_positions[joint_names.index(n)] for n in active]
+        return plan_cache.cached_compute_cartesian_path(self.move_group, geometry.to_ros_poses(stroke),
+                                                        self.eef_step, start_positions=start_positions)
+
+    def _valid(self, joint_names, positions):
+        """Joint limits and continuity of a derived copy."""
+        if len(positions) > 1 and np.max(np.abs(np.diff(positions, axis=0))) > self.jump_tolerance:
+            return False
+        if self.chain is not None:
+            q = positions[:, [joint_names.index(n) for n in self.chain.joint_names]]
+            if np.any(q < self.lower - 1e-9) or np.any(q > self.upper + 1e-9):
+                return False
+        return True
+
+    def _with_positions(self, plan, joint_names, positions, mode):
+        derived = copy.deepcopy(plan)
+        for point, q in zip(derived.joint_trajectory.points, positions):
+            point.positions = [float(v) for v in q]
+        if mode == "ik" and self.retime and len(positions) > 1:
+            from rangoli.parallel_plan import _robot_state
+
+            derived = self.move_group.retime_trajectory(_robot_state(joint_names, positions[0]), derived)
+        return derived
+
+    def _base_offset(self, joint_names, positions, angle):
+        """The sector trajectory with the base joint turned by ``angle``, kept within its limits."""
+        base = joint_names.index(self.chain.joint_names[0]) if self.chain is not None else self.base_joint
+        offset = positions.copy()
+        offset[:, base] += self.base_sign * angle
+        if self.lower is not None:
+            # Prefer the equivalent base angle that stays within the limits
+            for turn in (0.0, -2.0 * np.pi, 2.0 * np.pi):
+                shifted = offset[:, base] + turn
+                if np.all(shifted >= self.lower[0]) and np.all(shifted <= self.upper[0]):
+                    offset[:, base] = shifted
+                    break
+        return offset
+
+    def _derive(self, joint_names, positions, offset, angle):
+        """(mode, positions) of the copy rotated by ``angle``, or (None, None) if it is not valid."""
+        if self.base_on_axis:
+            return ("base", offset) if self._valid(joint_names, offset) else (None, None)
+        if self.chain is None:
+            return None, None
+
+        order = [joint_names.index(n) for n in self.chain.joint_names]
+        sector = self.chain.forward_stroke(positions[:, order])
+        targets = rotate_stroke(sector, angle, self.center)
+        # Seed every point with the sector's joints, the base turned so the tool
+        # lands at the target's azimuth about the base axis
+        before = np.arctan2(sector[:, geometry.Y] - self.axis_xy[1], sector[:, geometry.X] - self.axis_xy[0])
+        after = np.arctan2(targets[:, geometry.Y] - self.axis_xy[1], targets[:, geometry.X] - self.axis_xy[0])
+        turn = np.unwrap(after - before)
+        turn -= 2.0 * np.pi * np.round(turn[0] / (2.0 * np.pi))
+        seed = positions[:, order].copy()
+        seed[:, 0] += self.base_sign * turn
+        solution = self.chain.solve(targets, seed, position_tolerance=self.position_tolerance,
+                                    orientation_tolerance=self.orientation_tolerance)
+        if not np.all(solution.reachable):
+            return None, None
+        solved = np.empty_like(positions)
+        solved[:, order] = solution.joints
+        return ("ik", solved) if self._valid(joint_names, solved) else (None, None)
+
+    def plan_stroke(self, stroke):
+        """
+        Plan one sector stroke and all of its copies.
+        @returns: SymmetricPlan
+        """
+        stroke = np.asarray(stroke, dtype=float)
+        plan, fraction = self._compute(stroke)
+        joint_names, _, positions = plan_arrays(plan)
+        copies, modes = [plan], ["sector"]
+        for k in range(1, self.folds):
+            angle = 2.0 * np.pi * k / self.folds
+            offset = self._base_offset(joint_names, positions, angle)
+            mode, derived = (None, None)
+            if fraction >= 1.0 and len(positions):
+                mode, derived = self._derive(joint_names, positions, offset, angle)
+            if mode is not None:
+                copies.append(self._with_positions(plan, joint_names, derived, mode))
+                self.derived += 1
+            else:
+                # No usable symmetry for this copy: plan it, starting from the base-offset sector start
+                mode = "planned"
+                start = offset[0] if len(offset) else None
+                copy_plan, copy_fraction = self._compute(rotate_stroke(stroke, angle, self.center), start,
+                                                         joint_names)
+                copies.append(copy_plan)
+                fraction = min(fraction, copy_fraction)
+            modes.append(mode)
+        return SymmetricPlan(joint_names, copies, modes, fraction)
+
+    def plan(self, strokes):
+        """Plan every sector stroke. @returns: list of SymmetricPlan, one per stroke"""
+        return [self.plan_stroke(s) for s in strokes]
+
+    def execute(self, plans):
+        """Draw copy by copy, each copy's strokes in sector order, moving to each start in joint space."""
+        for k in range(self.folds):
+            for symmetric in plans:
+                trajectory = symmetric.copies[k]
+                points = trajectory.joint_trajectory.points
+                if not points:
+                    continue
+                self.move_group.go(list(points[0].positions), wait=True)
+                self.move_group.execute(trajectory, wait=True)
+        self.move_group.stop()
@@ -0,0 +1,241 @@
+"""Record MoveIt plans in simulation and replay them on the robot without replanning.
+
+A trajectory file holds one or more segments (one per executed plan) as a
+single float64 table. Each row is ``time, joint values..., x, y, z, rx, ry,
+rz``, where the pose columns are the tool pose of the row's joint values
+(NaN when no kinematic description was available while recording). The
+layout is::
+
+    8 bytes   magic b"RGTRAJ01"
+    4 bytes   little-endian uint32 length of the JSON header
+    header    JSON: joint_names, columns, rows, segments (start rows), source metadata
+    padding   to a multiple of 64 bytes
+    data      rows x columns little-endian float64, C order
+
+so ``TrajectoryFile`` can memory-map the table and hand out segments as
+zero-copy views.
+
+Recording: ``MoveGroupInterface(record_path=...)`` writes every plan that
+the sim scripts execute successfully (run them with ``--record plan.traj``).
+Replaying: ``TrajectoryReplayer`` sends a segment as joint moves when the
+client has ``move_to_joint``, otherwise as pose moves through
+``StrokeExecutor``. ``hardware_codes/hardware_replay.py`` does this on the
+robot.
+
+Replay reproduces the recorded path but not its timing: every point is sent
+with the replayer's single ``tool_speed`` and the recorded
+``time_from_start`` values are only reported, since the controller API
+gives no way to command a point's time.
+"""
+
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"RGTRAJ01"
+ALIGN = 64
+POSE_COLUMNS = ("x", "y", "z", "rx", "ry", "rz")
+
+# Joint-space calls looked up on the client, in order of preference. They are
+# called as method(joint, tool_speed, wait=...).
+JOINT_METHODS = ("move_to_joint",)
+
+
+def plan_arrays(plan):
+    """
+    Times and joint values of a moveit_msgs RobotTrajectory.
+    @returns: (joint_names, times (K,), positions (K, J))
+    """
+    trajectory = plan.joint_trajectory
+    points = trajectory.points
+    times = np.array([p.time_from_start.to_sec() for p in points], dtype=float)
+    positions = np.array([p.positions for p in points], dtype=float).reshape(len(points), -1)
+    return list(trajectory.joint_names), times, positions
+
+
+def write_trajectory(path, joint_names, segments, **metadata):
+    """
+    Write a trajectory file atomically.
+    @param: segments  list of (times (K,), positions (K, J), poses (K, 6) or None)
+    @param: metadata  Extra JSON-serialisable header fields
+    """
+    joints = len(joint_names)
+    tables = []
+    starts = []
+    rows = 0
+    for times, positions, poses in segments:
+        times = np.asarray(times, dtype=float)
+        table = np.full((len(times), 1 + joints + 6), np.nan)
+        table[:, 0] = times
+        table[:, 1:1 + joints] = np.asarray(positions, dtype=float).reshape(len(times), joints)
+        if poses is not None:
+            table[:, 1 + joints:] = np.asarray(poses, dtype=float).reshape(len(times), 6)
+        starts.append(rows)
+        rows += len(table)
+        tables.append(table)
+
+    header = dict(metadata)
+    header.update(version=1, joint_names=list(joint_names),
+                  columns=["time"] + list(joint_names) + list(POSE_COLUMNS),
+                  rows=rows, segments=starts, dtype="<f8")
+    text = json.dumps(header).encode("utf-8")
+    prefix = len(MAGIC) + 4
+    text += b" " * (-(prefix + len(text)) % ALIGN)
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(text)) + text)
+        for table in tables:
+            f.write(table.astype("<f8").tobytes())
+    os.replace(tmp, path)
+
+
+class TrajectoryFile(object):
+    """Read-only, memory-mapped trajectory file."""
+
+    def __init__(self, path, mmap=True):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a trajectory file" % path)
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length).decode("utf-8"))
+        offset = len(MAGIC) + 4 + length
+        shape = (self.header["rows"], len(self.header["columns"]))
+        if not mmap or shape[0] == 0:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                self.data = np.frombuffer(f.read(), dtype="<f8").reshape(shape)
+        else:
+            self.data = np.memmap(path, dtype="<f8", mode="r", offset=offset, shape=shape)
+        self.path = path
+        self.joint_names = list(self.header["joint_names"])
+        self.starts = list(self.header["segments"]) + [shape[0]]
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __repr__(self):
+        return "TrajectoryFile(%r, %d segments, %d rows)" % (self.path, len(self), self.header["rows"])
+
+    @property
+    def times(self):
+        return self.data[:, 0]
+
+    @property
+    def positions(self):
+        return self.data[:, 1:1 + len(self.joint_names)]
+
+    @property
+    def poses(self):
+        return self.data[:, 1 + len(self.joint_names):]
+
+    @property
+    def has_poses(self):
+        return len(self.data) > 0 and not np.isnan(self.poses).any()
+
+    def segment(self, index):
+        """(times, positions, poses) views of one segment."""
+        rows = slice(self.starts[index], self.starts[index + 1])
+        return self.times[rows], self.positions[rows], self.poses[rows]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.segment(i)
+
+
+class TrajectoryRecorder(object):
+    """Collects executed plans and keeps the trajectory file on disk up to date."""
+
+    def __init__(self, path, chain=None, **metadata):
+        """
+        @param: path      Trajectory file to (re)write after every plan
+        @param: chain     rangoli.kinematics.KinematicChain used to fill in tool poses, optional
+        @param: metadata  Extra header fields, e.g. group and planning frame
+        """
+        self.path = path
+        self.chain = chain
+        self.metadata = metadata
+        self.joint_names = None
+        self.segments = []
+
+    def add(self, plan, fraction=None):
+        """Append an executed RobotTrajectory and rewrite the file."""
+        names, times, positions = plan_arrays(plan)
+        if self.joint_names is None:
+            self.joint_names = names
+        elif names != self.joint_names:
+            order = [names.index(n) for n in self.joint_names]
+            positions = positions[:, order]
+        poses = None
+        if self.chain is not None and len(positions):
+            order = [self.joint_names.index(n) for n in self.chain.joint_names]
+            poses = self.chain.forward_stroke(positions[:, order])
+        self.segments.append((times, positions, poses))
+        self.metadata.setdefault("fractions", []).append(fraction)
+        write_trajectory(self.path, self.joint_names, self.segments, recorded=time.time(), **self.metadata)
+        return len(self.segments) - 1
+
+
+class TrajectoryReplayer(object):
+    """Replays recorded segments on an OwlClient, at ``tool_speed`` rather than the recorded timing."""
+
+    def __init__(self, client, tool_speed=35, mode="auto", pose_cls=None, joint_cls=None,
+                 move_type=None, max_queued=None, queue_moves=None):
+        """
+        @param: client      Connected OwlClient or RobotSession
+        @param: mode        "joint", "pose" or "auto" (joint moves when the client has them)
+        @param: joint_cls   Joint class built as joint_cls(*values), owl_client.Joint by default
+        @param: max_queued  Block every this many non-blocking moves; None queues the whole segment
+        @param: queue_moves Send moves with wait=False; rangoli.executor.QUEUE_MOVES by default
+        """
+        from rangoli import executor
+        self.client = client
+        self.tool_speed = tool_speed
+        self.max_queued = max_queued
+        self.queue_moves = executor.QUEUE_MOVES if queue_moves is None else queue_moves
+        self.joint_call = None
+        for name in JOINT_METHODS:
+            if callable(getattr(client, name, None)):
+                self.joint_call = getattr(client, name)
+                break
+        if mode == "auto":
+            mode = "joint" if self.joint_call is not None else "pose"
+        if mode == "joint" and self.joint_call is None:
+            raise ValueError("client has none of %s, replay with mode='pose'" % (JOINT_METHODS,))
+        self.mode = mode
+        if mode == "joint" and joint_cls is None:
+            from owl_client import Joint as joint_cls
+        self.joint_cls = joint_cls
+        self.executor = None
+        if mode == "pose":
+            self.executor = executor.StrokeExecutor(client, tool_speed, move_type=move_type, pose_cls=pose_cls,
+                                                    max_queued=max_queued, queue_moves=self.queue_moves)
+        self.calls = 0
+
+    def replay_segment(self, times, positions, poses, wait=True):
+        """Send one segment; the first waypoint is approached with a blocking move."""
+        if len(times) == 0:
+            return 0
+        if self.mode == "pose":
+            if np.isnan(poses).any():
+                raise ValueError("segment has no recorded poses, replay it with mode='joint'")
+            self.executor.begin_stroke()
+            self.executor.move_to(np.asarray(poses[0]))
+            calls = 1 + self.executor.execute(np.asarray(poses[1:]), wait=wait, new_stroke=False)
+        else:
+            last = len(positions) - 1
+            for i, q in enumerate(positions):
+                block = not self.queue_moves or i == 0 or (i == last and wait) or (
+                    self.max_queued is not None and i % self.max_queued == 0)
+                self.joint_call(self.joint_cls(*(float(v) for v in q)), self.tool_speed, wait=block)
+            calls = len(positions)
+        self.calls += calls
+        return calls
+
+    def replay(self, trajectory):
+        """Replay every segment of a TrajectoryFile in order, returning the controller calls made."""
+        return sum(self.replay_segment(*segment) for segment in trajectory)
+
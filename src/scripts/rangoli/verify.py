@@ -0,0 +1,160 @@
+"""Vectorised goal/actual pose comparison for whole trajectories.
+
+The ``all_close`` helper of the MoveIt tutorial the sim scripts started from
+compares one pose pair at a time. The functions here take arrays of poses and return per-sample errors and
+pass/fail masks in one NumPy call, using the same metrics: Euclidean
+position error and the angle between orientations (q and -q count as the
+same orientation).
+
+Poses may be given as (N, 7) ``x, y, z, qx, qy, qz, qw`` arrays, (N, 6)
+stroke arrays with roll/pitch/yaw, or lists of ``geometry_msgs`` Pose
+messages. The sim scripts check the pose goal with ``batch_all_close`` and
+every pose sampled while a plan executes with ``path_deviation`` (see
+``MoveGroupInterface.report_path_deviation``).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from rangoli import geometry
+
+PoseErrors = namedtuple("PoseErrors", ["position_error", "angular_error", "position_ok", "angle_ok", "ok"])
+PoseErrors.__doc__ = """Per-sample errors (metres, radians) and pass/fail masks."""
+
+
+def pose_array(poses):
+    """Normalise any supported pose representation to an (N, 7) array."""
+    if isinstance(poses, np.ndarray) or (len(poses) and not hasattr(poses[0], "position")):
+        poses = np.asarray(poses, dtype=float)
+        if poses.ndim == 1:
+            poses = poses[None, :]
+        if poses.shape[-1] == 6:
+            return np.concatenate((poses[:, :3], geometry.quaternion_from_euler(poses[:, 3:])), axis=1)
+        return poses
+    return geometry.ros_poses_to_array(poses)
+
+
+def angular_error(q_goal, q_actual):
+    """Angle in radians between unit quaternions, sample by sample."""
+    cos_half = np.abs(np.sum(np.asarray(q_goal) * np.asarray(q_actual), axis=-1))
+    return 2.0 * np.arccos(np.clip(cos_half, 0.0, 1.0))
+
+
+def _errors(position_error, angle_error, tolerance, angle_tolerance):
+    if angle_tolerance is None:
+        angle_tolerance = tolerance
+    position_ok = position_error <= tolerance
+    angle_ok = angle_error <= angle_tolerance
+    return PoseErrors(position_error, angle_error, position_ok, angle_ok, position_ok & angle_ok)
+
+
+def batch_all_close(goal, actual, tolerance, angle_tolerance=None):
+    """
+    ``all_close`` for N goal/actual pairs at once.
+    @param: goal             N goal poses
+    @param: actual           N actual poses
+    @param: tolerance        Position tolerance in metres (and angle tolerance, as in all_close)
+    @param: angle_tolerance  Separate angle tolerance in radians
+    @returns: PoseErrors
+    """
+    goal, actual = pose_array(goal), pose_array(actual)
+    if goal.shape != actual.shape:
+        raise ValueError("goal and actual differ in shape: %s vs %s" % (goal.shape, actual.shape))
+    position_error = np.linalg.norm(goal[:, :3] - actual[:, :3], axis=1)
+    return _errors(position_error, angular_error(goal[:, 3:], actual[:, 3:]), tolerance, angle_tolerance)
+
+
+def _project(points, a, b):
+    """Distance from points (N, 3) to segments a-b (N, M, 3 broadcast) and the segment parameter."""
+    ab = b - a
+    denom = np.sum(ab * ab, axis=-1)
+    t = np.clip(np.sum((points - a) * ab, axis=-1) / np.where(denom > 0, denom, 1.0), 0.0, 1.0)
+    return np.linalg.norm(points - (a + t[..., None] * ab), axis=-1), t
+
+
+def path_deviation(path, actual, tolerance, angle_tolerance=None, chunk=4096):
+    """
+    Compare samples that are not aligned with the commanded waypoints (e.g.
+    recorded state feedback) against the commanded path: the position error
+    is the distance to the nearest path segment and the orientation is
+    compared with the nearer end of that segment.
+    @returns: PoseErrors
+    """
+    path, actual = pose_array(path), pose_array(actual)
+    if len(path) == 1:
+        path = np.vstack((path, path))
+    a, b = path[:-1, :3], path[1:, :3]
+
+    position_error = np.empty(len(actual))
+    nearest = np.empty(len(actual), dtype=int)
+    # Chunked to bound the (samples x segments) distance matrix
+    for start in range(0, len(actual), chunk):
+        p = actual[start:start + chunk, None, :3]
+        d, t = _project(p, a[None], b[None])
+        k = np.argmin(d, axis=1)
+        rows = np.arange(len(k))
+        position_error[start:start + chunk] = d[rows, k]
+        nearest[start:start + chunk] = k + (t[rows, k] > 0.5)
+    return _errors(position_error, angular_error(path[nearest, 3:], actual[:, 3:]), tolerance, angle_tolerance)
+
+
+class StreamingVerifier(object):
+    """
+    Check live pose feedback against a commanded path one sample at a time.
+    Samples are assumed to progress along the path, so each check only
+    searches a window of segments ahead of the last match. The first
+    ``capacity`` errors are kept in preallocated arrays; failure counts and
+    maxima in the summary cover every sample.
+    """
+
+    def __init__(self, path, tolerance, angle_tolerance=None, window=16, capacity=100000):
+        self.path = pose_array(path)
+        if len(self.path) == 1:
+            self.path = np.vstack((self.path, self.path))
+        self.tolerance = tolerance
+        self.angle_tolerance = tolerance if angle_tolerance is None else angle_tolerance
+        self.window = window
+        self.segment = 0
+        self.fraction = 0.0  # position along the current segment
+        self.count = 0
+        self.failures = 0
+        self.max_position_error = 0.0
+        self.max_angular_error = 0.0
+        self.position_errors = np.zeros(capacity)
+        self.angular_errors = np.zeros(capacity)
+
+    def check(self, pose):
+        """
+        Compare one actual pose with the path.
+        @returns: (position_error, angular_error, ok)
+        """
+        pose = pose_array([pose] if hasattr(pose, "position") else pose)[0]
+        lo = self.segment
+        hi = min(len(self.path) - 1, lo + self.window)
+        d, t = _project(pose[None, :3], self.path[lo:hi, :3], self.path[lo + 1:hi + 1, :3])
+        k = int(np.argmin(d))
+        self.segment = lo + k
+        self.fraction = float(t[k])
+        position_error = float(d[k])
+        target = self.path[self.segment + (1 if t[k] > 0.5 else 0), 3:]
+        angle_error = float(angular_error(target, pose[3:]))
+
+        if self.count < len(self.position_errors):
+            self.position_errors[self.count] = position_error
+            self.angular_errors[self.count] = angle_error
+        self.count += 1
+        ok = position_error <= self.tolerance and angle_error <= self.angle_tolerance
+        self.failures += not ok
+        self.max_position_error = max(self.max_position_error, position_error)
+        self.max_angular_error = max(self.max_angular_error, angle_error)
+        return position_error, angle_error, ok
+
+    def summary(self):
+        return {
+            "samples": self.count,
+            "failures": self.failures,
+            "max_position_error": self.max_position_error,
+            "max_angular_error": self.max_angular_error,
+            "progress": (self.segment + self.fraction) / float(len(self.path) - 1),
+        }
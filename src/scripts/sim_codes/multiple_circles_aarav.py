@@ -36,7 +36,8 @@
 
 ## BEGIN_SUB_TUTORIAL imports
 ##
-## To use the Python MoveIt interfaces, we will import the `moveit_commander`_ namespace.
+## The Python MoveIt interfaces come from the `moveit_commander`_ namespace, which MoveGroupInterface
+## imports and initializes.
 ## This namespace provides us with a `MoveGroupCommander`_ class, a `PlanningSceneInterface`_ class,
 ## and a `RobotCommander`_ class. More on these below. We also import `rospy`_ and some messages that we will use:
 ##
@@ -45,131 +46,29 @@
 from __future__ import print_function
 
 
+import os
 import sys
 import numpy as np
-import math
-import copy
 import rospy
-import moveit_commander
 import moveit_msgs.msg
 from geometry_msgs.msg import Point
 import geometry_msgs.msg
 import tf.transformations
 
-try:
-    from math import pi, tau, dist, fabs, cos
-except:  # For Python 2 compatibility
-    from math import pi, fabs, cos, sqrt
-
-    tau = 2.0 * pi
-
-    def dist(p, q):
-        return sqrt(sum((p_i - q_i) ** 2.0 for p_i, q_i in zip(p, q)))
-
-
-from std_msgs.msg import String
-from moveit_commander.conversions import pose_to_list
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rangoli import geometry, plan_cache, repair, simplify, verify
+from rangoli.moveit_interface import MoveGroupInterface
 
 ## END_SUB_TUTORIAL
 
 
-def all_close(goal, actual, tolerance):
-    """
-    Convenience method for testing if the values in two lists are within a tolerance of each other.
-    For Pose and PoseStamped inputs, the angle between the two quaternions is compared (the angle
-    between the identical orientations q and -q is calculated correctly).
-    @param: goal       A list of floats, a Pose or a PoseStamped
-    @param: actual     A list of floats, a Pose or a PoseStamped
-    @param: tolerance  A float
-    @returns: bool
-    """
-    if type(goal) is list:
-        for index in range(len(goal)):
-            if abs(actual[index] - goal[index]) > tolerance:
-                return False
-
-    elif type(goal) is geometry_msgs.msg.PoseStamped:
-        return all_close(goal.pose, actual.pose, tolerance)
-
-    elif type(goal) is geometry_msgs.msg.Pose:
-        x0, y0, z0, qx0, qy0, qz0, qw0 = pose_to_list(actual)
-        x1, y1, z1, qx1, qy1, qz1, qw1 = pose_to_list(goal)
-        # Euclidean distance
-        d = dist((x1, y1, z1), (x0, y0, z0))
-        # phi = angle between orientations
-        cos_phi_half = fabs(qx0 * qx1 + qy0 * qy1 + qz0 * qz1 + qw0 * qw1)
-        return d <= tolerance and cos_phi_half >= cos(tolerance / 2.0)
-
-    return True
-
-
-class MoveGroupPythonInterfaceTutorial(object):
-    """MoveGroupPythonInterfaceTutorial"""
-
-    def __init__(self):
-        super(MoveGroupPythonInterfaceTutorial, self).__init__()
-
-        ## BEGIN_SUB_TUTORIAL setup
-        ##
-        ## First initialize `moveit_commander`_ and a `rospy`_ node:
-        moveit_commander.roscpp_initialize(sys.argv)
-        rospy.init_node("move_group_python_interface_tutorial", anonymous=True)
+class MoveGroupPythonInterfaceTutorial(MoveGroupInterface):
+    """MoveGroupPythonInterfaceTutorial
 
-        ## Instantiate a `RobotCommander`_ object. Provides information such as the robot's
-        ## kinematic model and the robot's current joint states
-        robot = moveit_commander.RobotCommander()
-
-        ## Instantiate a `PlanningSceneInterface`_ object.  This provides a remote interface
-        ## for getting, setting, and updating the robot's internal understanding of the
-        ## surrounding world:
-        scene = moveit_commander.PlanningSceneInterface()
-
-        
-        group_name = "arm"
-        move_group = moveit_commander.MoveGroupCommander(group_name)
-
-        ## Create a `DisplayTrajectory`_ ROS publisher which is used to display
-        ## trajectories in Rviz:
-        display_trajectory_publisher = rospy.Publisher(
-            "/move_group/display_planned_path",
-            moveit_msgs.msg.DisplayTrajectory,
-            queue_size=20,
-        )
-
-        ## END_SUB_TUTORIAL
-
-        ## BEGIN_SUB_TUTORIAL basic_info
-        ##
-        ## Getting Basic Information
-        ## ^^^^^^^^^^^^^^^^^^^^^^^^^
-        # We can get the name of the reference frame for this robot:
-        planning_frame = move_group.get_planning_frame()
-        print("============ Planning frame: %s" % planning_frame)
-
-        # We can also print the name of the end-effector link for this group:
-        eef_link = move_group.get_end_effector_link()
-        print("============ End effector link: %s" % eef_link)
-
-        # We can get a list of all the groups in the robot:
-        group_names = robot.get_group_names()
-        print("============ Available Planning Groups:", robot.get_group_names())
-
-        # Sometimes for debugging it is useful to print the entire state of the
-        # robot:
-        print("============ Printing robot state")
-        print(robot.get_current_state())
-        print("")
-        ## END_SUB_TUTORIAL
-
-        # Misc variables
-        self.box_name = ""
-        self.robot = robot
-        self.scene = scene
-        self.move_group = move_group
-        self.display_trajectory_publisher = display_trajectory_publisher
-        self.planning_frame = planning_frame
-        self.eef_link = eef_link
-        self.group_names = group_names
+    Setup of `moveit_commander`_, the `rospy`_ node and the "arm" `MoveGroupCommander`_
+    lives in MoveGroupInterface. The `RobotCommander`_, `PlanningSceneInterface`_ and
+    the `DisplayTrajectory`_ publisher are only created the first time they are used.
+    """
 
     
 
@@ -214,29 +113,35 @@ class MoveGroupPythonInterfaceTutorial(object):
         # It is always good to clear your targets after planning with poses.
         # Note: there is no equivalent function for clear_joint_value_targets().
         move_group.clear_pose_targets()
+
+        # Check the pose reached, with the batch comparison from rangoli.verify
+        current_pose = move_group.get_current_pose().pose
+        return bool(verify.batch_all_close([pose_goal], [current_pose], 0.01).ok[0])
     
     def plan_cartesian_path(self, center: Point, radius: float):
         # Copy class variables to local variables to make the web tutorials clearer.
         # In practice, you should use the class variables directly unless you have a good reason not to.
         move_group = self.move_group
-        waypoints = []
 
         # Start at the current pose of the end-effector to keep the initial z-coordinate
         wpose = move_group.get_current_pose().pose
         wpose.position.z = wpose.position.z  # Keep the z-coordinate constant
 
-        steps = 72  # Number of waypoints to approximate the circle (5-degree increments)
+        steps = simplify.arc_steps(radius, 0.1)  # Fewest waypoints keeping every chord within 0.1 mm of the circle
 
         # Generate waypoints around the circle in the x-y plane at the given center
-        for i in range(steps + 1):
-            angle = 2 * math.pi * i / steps  # Angle in radians for each waypoint
-            wpose.position.x = center.x + radius * math.cos(angle)
-            wpose.position.y = center.y + radius * math.sin(angle)
-            waypoints.append(copy.deepcopy(wpose))
+        # in one vectorised call, keeping the current orientation for every waypoint
+        stroke = geometry.circle_stroke(center.x, center.y, wpose.position.z, radius, steps)
+        waypoints = geometry.to_ros_poses(stroke, orientation=wpose.orientation)
+
+        # execute_plan checks the executed motion against this path, from the start pose on
+        self.commanded_path = [move_group.get_current_pose().pose] + waypoints
 
         # Generate the plan with the specified waypoints
-        (plan, fraction) = move_group.compute_cartesian_path(
-            waypoints, 0.01  # eef_step
+        # Previously planned paths are loaded from the on-disk plan cache instead of being replanned;
+        # if the path stops short, only the failing part is replanned and stitched back in
+        (plan, fraction) = repair.plan_with_repair(
+            move_group, waypoints, 0.01  # eef_step
         )
 
         # Return the computed plan and fraction of the path achieved
@@ -283,7 +188,14 @@ class MoveGroupPythonInterfaceTutorial(object):
         ## ^^^^^^^^^^^^^^^^
         ## Use execute if you would like the robot to follow
         ## the plan that has already been computed:
-        move_group.execute(plan, wait=True)
+        # The arm's pose is sampled during the motion
+        with self.sampled_poses() as samples:
+            success = move_group.execute(plan, wait=True)
+        if success:
+            # Keep the validated plan so it can be replayed without replanning
+            self.record_plan(plan)
+            # Check every sample of the executed motion against the commanded path
+            self.report_path_deviation(self.commanded_path, samples)
 
         ## **Note:** The robot's current joint state must be within some tolerance of the
         ## first waypoint in the `RobotTrajectory`_ or ``execute()`` will fail
@@ -294,7 +206,11 @@ class MoveGroupPythonInterfaceTutorial(object):
     
 def main():
     try:
-        tutorial = MoveGroupPythonInterfaceTutorial()
+        # Pass --quiet to skip the planning frame / robot state dump at startup
+        # Pass --record plan.traj to save executed plans for hardware_codes/hardware_replay.py
+        record_path = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None
+        tutorial = MoveGroupPythonInterfaceTutorial(quiet="--quiet" in sys.argv, record_path=record_path)
+        tutorial.report_timings()
         
         # Define the center of the circle
         center = geometry_msgs.msg.Point()
@@ -310,6 +226,7 @@ def main():
         
         # Call the modified plan_cartesian_path function with center and radius
         cartesian_plan, fraction = tutorial.plan_cartesian_path(center, radius)
+        plan_cache.default_cache().report()
 
         # Check if the fraction is less than 1
         if fraction < 1.0:
@@ -0,0 +1,84 @@
+"""RobotSession against slow and dropping stand-in clients, without a robot."""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "scripts"))
+from rangoli.session import RobotSession
+
+
+class SlowClient(object):
+    """Client whose constructor and status calls take longer than the session's 10 ms poll."""
+
+    def __init__(self, address, connect_delay=0.05, call_delay=0.02, log=None):
+        time.sleep(connect_delay)
+        self.call_delay = call_delay
+        self.log = log if log is not None else []
+        self.fail_next = False
+
+    def is_running(self):
+        time.sleep(self.call_delay)
+        return True
+
+    def move_to_pose(self, pose, toolSpeed, wait=True, relative=False):
+        if self.fail_next:
+            self.fail_next = False
+            raise IOError("connection reset")
+        self.log.append((pose, wait))
+        return True
+
+
+def _session(factory):
+    return RobotSession("10.0.0.1", factory=factory, heartbeat_interval=0.05, stall_timeout=0.5,
+                        reconnect_delays=(0.0, 0.01), warmup_calls=2, log=lambda *a: None)
+
+
+def test_connects_with_slow_client():
+    with _session(SlowClient) as session:
+        assert session.is_running()
+        assert session.move_to_pose("p0", 35)
+        assert session.acked == 1
+
+
+def test_queued_moves_are_resent_after_a_drop():
+    log = []
+    clients = []
+
+    def factory(address):
+        clients.append(SlowClient(address, log=log))
+        return clients[-1]
+
+    with _session(factory) as session:
+        session.move_to_pose("p0", 35, wait=True)
+        session.move_to_pose("p1", 35, wait=False)
+        session.move_to_pose("p2", 35, wait=False)
+        # Only the blocking move is acknowledged
+        assert session.acked == 1
+        session._client.fail_next = True
+        session.move_to_pose("p3", 35, wait=True)
+        assert session.reconnects == 1
+        assert session.acked == 4
+        # p1 and p2 may have been dropped with the link, so they are sent again before p3
+        assert [pose for pose, _ in log] == ["p0", "p1", "p2", "p1", "p2", "p3"]
+
+
+def test_only_the_latest_streamed_setpoint_is_resent():
+    log = []
+    clients = []
+
+    def factory(address):
+        clients.append(SlowClient(address, log=log))
+        return clients[-1]
+
+    with _session(factory) as session:
+        session.move_to_pose("p0", 35, wait=True)
+        with session.streaming():
+            for k in range(1, 50):
+                session.move_to_pose("s%d" % k, 35, wait=False)
+            session._client.fail_next = True
+            session.move_to_pose("s50", 35, wait=True)
+        assert session.reconnects == 1
+        # The stream continues from its latest setpoint instead of retracing it from s1
+        assert [pose for pose, _ in log[-3:]] == ["s49", "s49", "s50"]
+        assert len(log) == 52